@@ -0,0 +1,244 @@
+""" Benchmarks of the models that run without the GUI. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+
+from .pim import Pim
+
+
+_words = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo"
+).split()
+
+
+def generate_text(rand, size):
+    """ Generate note XML of roughly the given size in bytes. """
+    parts = ["<note>"]
+    length = len(parts[0])
+    while length < size:
+        para = "<p>{0}</p>".format(" ".join(rand.choice(_words) for i in range(40)))
+        parts.append(para)
+        length += len(para)
+    parts.append("</note>")
+    return "\n".join(parts)
+
+
+def generate_pim(directory, fanout=10, depth=3, note_size=2048, attachments=0, attachment_size=16384, seed=0):
+    """ Create a synthetic PIM directory.
+        Each note has fanout children down to the given depth, contents of
+        about note_size bytes and a number of attachment files.  The files
+        are written directly so creating the PIM doesn't depend on the
+        model being measured.  Returns the number of notes created.
+    """
+    rand = random.Random(seed)
+    storage = os.path.join(directory, "notes")
+
+    def create(parent, level):
+        count = 0
+        for i in range(fanout):
+            name = "Note {0}".format(i)
+            notedir = os.path.join(parent, name.replace(" ", "_"))
+            os.makedirs(notedir)
+
+            with io.open(os.path.join(notedir, "contents.note"), "wt") as handle:
+                handle.write(generate_text(rand, note_size))
+
+            for j in range(attachments):
+                with io.open(os.path.join(notedir, "attachment{0}.bin".format(j)), "wb") as handle:
+                    handle.write(os.urandom(attachment_size))
+
+            count += 1
+            if level < depth:
+                count += create(notedir, level + 1)
+
+        return count
+
+    if not os.path.isdir(storage):
+        os.makedirs(storage)
+
+    # Rendering needs a note template.  Provide a minimal one if the
+    # application data doesn't have one.
+    template = os.path.join("templates", "notes", "main.tmpl")
+    builtin = os.path.join(os.path.dirname(__file__), "data", template)
+    if not os.path.exists(builtin):
+        template = os.path.join(directory, "data", template)
+        os.makedirs(os.path.dirname(template))
+        with io.open(template, "wt") as handle:
+            handle.write("<html><body></body></html>\n")
+
+    return create(storage, 1)
+
+
+class Timer(object):
+    """ Collect timings for named operations. """
+
+    def __init__(self):
+        self.results = {}
+
+    def time(self, name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.results.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        summary = {}
+        for (name, times) in sorted(self.results.items()):
+            times = sorted(times)
+            summary[name] = {
+                "count": len(times),
+                "total": sum(times),
+                "min": times[0],
+                "median": times[len(times) // 2],
+                "mean": sum(times) / len(times),
+                "max": times[-1]
+            }
+        return summary
+
+
+def run_benchmarks(directory, repeat=3, sample=200, seed=0, write=True):
+    """ Time the notes model operations on a PIM directory.
+        If write is True, write_note is timed by rewriting sampled notes.
+    """
+    timer = Timer()
+    rand = random.Random(seed)
+
+    pim = timer.time("open", Pim, directory)
+    model = pim.get_model("notes")
+
+    # The first traversal builds the index, later ones use it
+    paths = timer.time("traverse.cold", lambda: list(model.walk_notes()))
+    for i in range(repeat):
+        timer.time("traverse.warm", lambda: list(model.walk_notes()))
+
+    if not paths:
+        return (timer.summary(), 0)
+
+    sampled = [rand.choice(paths) for i in range(min(sample, len(paths)))]
+    parents = [None] + sampled
+
+    for i in range(repeat):
+        for path in parents:
+            timer.time("get_children", model.get_children, path)
+            timer.time("get_children_info", model.get_children_info, path)
+
+    for path in sampled:
+        timer.time("read_note", model.read_note, path)
+
+    model.clear_cache()
+    for path in sampled:
+        timer.time("parse_note.cold", model.parse_note, path)
+    for path in sampled:
+        timer.time("parse_note.warm", model.parse_note, path)
+        timer.time("load_note", model.load_note, path)
+
+    for path in sampled if write else ():
+        contents = model.read_note(path)
+        timer.time("write_note", model.write_note, path, contents + " ")
+        model.write_note(path, contents)
+
+    pim.close()
+    return (timer.summary(), len(paths))
+
+
+def compare(old, new):
+    """ Return lines comparing the median times of two result sets. """
+    lines = []
+    for (name, result) in sorted(new["results"].items()):
+        before = old["results"].get(name)
+        if before is None or not before["median"]:
+            lines.append("{0:24} {1:12.6f}s".format(name, result["median"]))
+        else:
+            lines.append("{0:24} {1:12.6f}s {2:8.2f}x".format(
+                name, result["median"], result["median"] / before["median"]
+            ))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mrbavii_mypim.bench")
+    parser.add_argument("--directory", help="Benchmark an existing PIM instead of a generated one.")
+    parser.add_argument("--fanout", type=int, default=10, help="Children of each generated note.")
+    parser.add_argument("--depth", type=int, default=3, help="Depth of the generated tree.")
+    parser.add_argument("--note-size", type=int, default=2048, help="Size of each generated note.")
+    parser.add_argument("--attachments", type=int, default=0, help="Attachments of each generated note.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeats of the listing benchmarks.")
+    parser.add_argument("--sample", type=int, default=200, help="Number of notes to read and render.")
+    parser.add_argument("--packed", action="store_true", help="Compact the generated notes into a pack first.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="Compare the results with an earlier JSON file.")
+    args = parser.parse_args(argv)
+
+    params = dict(vars(args))
+    tempdir = None
+
+    try:
+        if args.directory:
+            directory = args.directory
+        else:
+            tempdir = tempfile.mkdtemp(prefix="mypim-bench-")
+            directory = tempdir
+            start = time.perf_counter()
+            generate_pim(directory, args.fanout, args.depth, args.note_size, args.attachments)
+            params["generate_time"] = time.perf_counter() - start
+
+            if args.packed:
+                start = time.perf_counter()
+                pim = Pim(directory)
+                pim.get_model("notes").compact()
+                pim.close()
+                shutil.rmtree(os.path.join(directory, "db"), ignore_errors=True)
+                params["compact_time"] = time.perf_counter() - start
+
+        # Don't modify the notes of an existing PIM
+        (results, count) = run_benchmarks(directory, args.repeat, args.sample, write=tempdir is not None)
+    finally:
+        if tempdir:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+    output = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "notes": count,
+        "results": results
+    }
+
+    if args.output:
+        outdir = os.path.dirname(args.output)
+        if outdir and not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        with io.open(args.output, "wt") as handle:
+            json.dump(output, handle, indent=2, sort_keys=True)
+
+    if args.compare:
+        with io.open(args.compare, "rt") as handle:
+            lines = compare(json.load(handle), output)
+    else:
+        lines = compare({"results": {}}, output)
+
+    sys.stdout.write("{0} notes\n".format(count))
+    for line in lines:
+        sys.stdout.write(line + "\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+""" Caches of rendered and parsed content. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import json
+import hashlib
+import threading
+import collections
+
+
+class RenderCache(object):
+    """
+    Store rendered output in files under a cache directory.
+
+    Each entry is a single file containing a one line JSON header followed
+    by the rendered data.  The header records the modification time, size
+    and content hash of the source file along with a fingerprint of the
+    templates used to render it.  A lookup whose source file still has the
+    same modification time and size is a single read of the entry file.
+
+    Entries are evicted in least recently used order when the total size
+    of the cache exceeds the size budget.
+    """
+
+    DEFAULT_BUDGET = 64 * 1024 * 1024
+
+    def __init__(self, directory, budget=None):
+        """ Create the cache in a given directory. """
+        self._directory = directory
+        self._budget = self.DEFAULT_BUDGET if budget is None else budget
+        self._lock = threading.Lock()
+        self._total = None
+
+    def get_directory(self):
+        """ Return the cache directory. """
+        return self._directory
+
+    @staticmethod
+    def make_key(name):
+        """ Return the cache key for a source such as the key of a note.
+            Each source has a single entry, replaced whenever the source
+            changes, and the content hash stored with it decides whether it
+            still matches.
+        """
+        return hashlib.sha1(name.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_data(data):
+        """ Return the content hash used by the cache. """
+        return hashlib.sha1(data).hexdigest()
+
+    def _entry_file(self, key):
+        return os.path.join(self._directory, key[:2], key)
+
+    def _read_entry(self, key):
+        entry = self._entry_file(key)
+        try:
+            with io.open(entry, "rb") as handle:
+                header = json.loads(handle.readline().decode("utf-8"))
+                data = handle.read()
+        except (IOError, OSError, ValueError):
+            return (None, None)
+
+        return (header, data)
+
+    def get(self, key, stat, fingerprint, loader=None):
+        """ Return the cached data for a key or None.
+            The source file's stat result and the template fingerprint must
+            match the ones stored with the entry.  If only the modification
+            time differs and a loader is given, it is called to get the
+            source data so the content hash can be compared instead.
+        """
+        (header, data) = self._read_entry(key)
+        if header is None:
+            return None
+
+        if header.get("fingerprint") != fingerprint or header.get("size") != stat.st_size:
+            return None
+
+        if header.get("mtime") != stat.st_mtime:
+            if loader is None or header.get("hash") != self.hash_data(loader()):
+                return None
+
+            # Touched but not changed, refresh the entry with the new time
+            self.set(key, stat, header["hash"], fingerprint, data)
+            return data
+
+        # Mark the entry as recently used for eviction
+        try:
+            os.utime(self._entry_file(key), None)
+        except (IOError, OSError):
+            pass
+
+        return data
+
+    def set(self, key, stat, hash, fingerprint, data):
+        """ Store data for a key. """
+        import tempfile
+
+        header = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": hash,
+            "fingerprint": fingerprint
+        }
+        header = json.dumps(header, sort_keys=True).encode("utf-8") + b"\n"
+
+        entry = self._entry_file(key)
+        directory = os.path.dirname(entry)
+
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            try:
+                old_size = os.path.getsize(entry)
+            except (IOError, OSError):
+                old_size = 0
+
+            (fd, tmpname) = tempfile.mkstemp(dir=directory, prefix=".tmp")
+            try:
+                with io.open(fd, "wb") as handle:
+                    handle.write(header)
+                    handle.write(data)
+                os.replace(tmpname, entry)
+            except:
+                os.unlink(tmpname)
+                raise
+        except (IOError, OSError):
+            # The cache is only an optimization
+            return
+
+        with self._lock:
+            if self._total is not None:
+                self._total += len(header) + len(data) - old_size
+                if self._total <= self._budget:
+                    return
+
+        self.evict()
+
+    def discard(self, key):
+        """ Remove the entry for a key if it exists. """
+        try:
+            os.unlink(self._entry_file(key))
+        except (IOError, OSError):
+            pass
+
+    def _entries(self):
+        results = []
+        if not os.path.isdir(self._directory):
+            return results
+
+        for subdir in os.listdir(self._directory):
+            subdir = os.path.join(self._directory, subdir)
+            if not os.path.isdir(subdir):
+                continue
+
+            with os.scandir(subdir) as entries:
+                for entry in entries:
+                    try:
+                        stat = entry.stat()
+                    except (IOError, OSError):
+                        continue
+                    results.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return results
+
+    def evict(self, budget=None):
+        """ Remove least recently used entries until under the budget. """
+        if budget is None:
+            budget = self._budget
+
+        with self._lock:
+            entries = self._entries()
+            total = sum(i[1] for i in entries)
+
+            if total > budget:
+                # Evict down below the budget so every store doesn't rescan
+                target = budget * 3 // 4
+                for (mtime, size, file) in sorted(entries):
+                    if total <= target:
+                        break
+                    try:
+                        os.unlink(file)
+                        total -= size
+                    except (IOError, OSError):
+                        pass
+
+            self._total = total
+
+    def clear(self):
+        """ Remove all entries from the cache. """
+        import shutil
+
+        with self._lock:
+            if os.path.isdir(self._directory):
+                shutil.rmtree(self._directory, ignore_errors=True)
+            self._total = 0
+
+    def get_size(self):
+        """ Return the total size of the cache entries. """
+        return sum(i[1] for i in self._entries())
+
+
+class MemoryCache(object):
+    """
+    Keep recently used values in memory within a size budget.
+
+    Each value is stored with a stamp, such as the modification time and
+    size of the file it was made from, and a lookup with a different stamp
+    is a miss.  The size of each value is given by the caller and only
+    needs to be approximate.  When the total size exceeds the budget the
+    least recently used values are evicted.
+    """
+
+    DEFAULT_BUDGET = 32 * 1024 * 1024
+
+    def __init__(self, budget=None):
+        """ Create the cache with a budget in bytes. """
+        self._budget = self.DEFAULT_BUDGET if budget is None else budget
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._total = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, stamp):
+        """ Return the value for a key or None if missing or stale. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                if entry is not None:
+                    self._remove(key)
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key, stamp, value, size):
+        """ Store a value, replacing any value for the key. """
+        with self._lock:
+            self._remove(key)
+            if size > self._budget:
+                return
+
+            self._entries[key] = (stamp, value, size)
+            self._total += size
+            self._evict(self._budget)
+
+    def resize(self, key, value, size):
+        """ Change the size of a value that is still cached.
+            Nothing is done if the value was evicted or replaced.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] is not value:
+                return
+
+            if size > self._budget:
+                self._remove(key)
+                return
+
+            self._entries[key] = (entry[0], value, size)
+            self._total += size - entry[2]
+            self._evict(self._budget)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total -= entry[2]
+
+    def _evict(self, budget):
+        while self._total > budget:
+            (_, entry) = self._entries.popitem(last=False)
+            self._total -= entry[2]
+            self._evictions += 1
+
+    def discard(self, key):
+        """ Remove the value for a key if there is one. """
+        with self._lock:
+            self._remove(key)
+
+    def discard_prefix(self, prefix):
+        """ Remove the values of a key and every key starting with prefix + "/". """
+        with self._lock:
+            below = prefix + "/"
+            for key in [i for i in self._entries if i == prefix or i.startswith(below)]:
+                self._remove(key)
+
+    def set_budget(self, budget):
+        """ Change the budget, evicting values if needed. """
+        with self._lock:
+            self._budget = budget
+            self._evict(budget)
+
+    def clear(self):
+        """ Remove all values.  The counters are kept. """
+        with self._lock:
+            self._entries.clear()
+            self._total = 0
+
+    def get_stats(self):
+        """ Return the counters and current size as a dictionary. """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "size": self._total,
+                "budget": self._budget
+            }
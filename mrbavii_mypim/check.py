@@ -0,0 +1,363 @@
+""" Integrity check and repair of a PIM. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+"""
+The check runs in three steps:
+
+    scan        walk the notes directory with os.scandir, checking names
+                and listing every note, including those only in the pack
+    verify      read and parse each note and its attachment list in a pool
+                of processes
+    orphans     compare the render cache with the notes found
+
+Each problem is an issue with a type, the path of the file or directory
+relative to the PIM directory, the key of the note if there is one, and a
+message.  With repair, the issues that can be fixed safely are:
+
+    invalid-xml         the latest saved revision that parses is restored
+    misplaced-name      the directory is renamed to the one the model uses
+    temp-file           removed if older than TEMP_FILE_AGE
+    orphan-cache        removed
+
+Directories with invalid names, name collisions and missing attachments
+are only reported, as fixing them could lose data.
+"""
+
+
+import os
+import io
+import json
+import time
+import contextlib
+from xml.etree import ElementTree as ET
+
+from .errors import Error
+from .cache import RenderCache
+from .models.notespack import NotesPack
+from .models import compression
+from .workers import pool_map
+
+
+INVALID_XML = "invalid-xml"
+INVALID_NAME = "invalid-name"
+NAME_COLLISION = "name-collision"
+MISPLACED_NAME = "misplaced-name"
+INVALID_ATTACHMENTS = "invalid-attachments"
+MISSING_ATTACHMENT = "missing-attachment"
+TEMP_FILE = "temp-file"
+ORPHAN_CACHE = "orphan-cache"
+
+# Temporary files younger than this may belong to a write in progress
+TEMP_FILE_AGE = 3600
+
+# Directories scanned between progress reports
+SCAN_BATCH = 1000
+
+
+def _issue(type, file, message, key=None):
+    return {"type": type, "file": file, "note": key, "message": message, "repaired": False}
+
+
+def _setup_worker(note_filename, attachments_filename, attachments_dir, pack_file):
+    return {
+        "note_filename": note_filename,
+        "attachments_filename": attachments_filename,
+        "attachments_dir": attachments_dir,
+        "pack": NotesPack(pack_file) if pack_file else None,
+    }
+
+
+def _check_note(state, task):
+    """ Check the contents and attachments of one note.
+        Runs in a worker process.  task is (key, directory, pack_index)
+        where directory is None for a note only in the pack and pack_index
+        is None for a note not in it.  The contents in the pack are checked
+        when the directory has no contents file.  Returns (key, cache_key,
+        issues).
+    """
+    (key, directory, index) = task
+    issues = []
+    cache_key = None
+    handle = None
+
+    if directory is not None:
+        file = os.path.join(directory, state["note_filename"])
+        try:
+            handle = io.open(file, "rb")
+        except (IOError, OSError):
+            # A directory may only hold sub-notes or the contents are packed
+            pass
+
+        if handle is not None:
+            cache_key = RenderCache.make_key(key)
+            try:
+                with compression.open_stream(handle) as stream:
+                    ET.parse(stream)
+            except (ET.ParseError, Error) as e:
+                issues.append(_issue(INVALID_XML, file, str(e), key))
+            except (IOError, OSError):
+                pass
+
+    if handle is None and index is not None:
+        pack = state["pack"]
+        cache_key = RenderCache.make_key(key)
+        try:
+            ET.fromstring(pack.read(index))
+        except ET.ParseError as e:
+            issues.append(_issue(INVALID_XML, pack.get_filename(), str(e), key))
+
+    if directory is not None:
+        refs_file = os.path.join(directory, state["attachments_filename"])
+        try:
+            with io.open(refs_file, "rt", encoding="utf-8") as handle:
+                refs = json.load(handle)
+        except (IOError, OSError):
+            refs = {}
+        except ValueError as e:
+            refs = {}
+            issues.append(_issue(INVALID_ATTACHMENTS, refs_file, str(e), key))
+
+        for (name, info) in sorted(refs.items()):
+            hash = info.get("hash", "") if isinstance(info, dict) else ""
+            blob = os.path.join(state["attachments_dir"], hash[:2], hash)
+            if len(hash) != 64 or not os.path.isfile(blob):
+                issues.append(_issue(MISSING_ATTACHMENT, refs_file, "Missing data for {0}".format(name), key))
+
+    return (key, cache_key, issues)
+
+
+def _is_temp_file(name):
+    return name.startswith(".") and name.endswith(".tmp")
+
+
+def _scan(pim, model, issues):
+    """ Walk the notes directory.
+        Returns a list of (key, directory, None) for each note directory,
+        or None if aborted.  Problems with names are added to issues.
+    """
+    root = pim.get_directory()
+    tasks = []
+    stack = [(model._directory, ())]
+    count = 0
+
+    while stack:
+        (directory, parts) = stack.pop()
+        count += 1
+        if count % SCAN_BATCH == 0 and not pim.call_progress_function("Scanning notes", 0):
+            return None
+
+        try:
+            entries = list(os.scandir(directory))
+        except (IOError, OSError):
+            continue
+
+        dirs = set(entry.name for entry in entries if entry.is_dir(follow_symlinks=False))
+        for entry in entries:
+            name = entry.name
+            if name.startswith("."):
+                if _is_temp_file(name) and entry.is_file(follow_symlinks=False):
+                    issues.append(_issue(TEMP_FILE, os.path.relpath(entry.path, root), "Temporary file left by an interrupted write"))
+                continue
+
+            if name not in dirs:
+                continue
+
+            note = model._file_to_path_part(name)
+            relative = os.path.relpath(entry.path, root)
+            if not model.valid_name(note):
+                issues.append(_issue(INVALID_NAME, relative, "Not a valid note name, the directory is ignored"))
+                continue
+
+            canonical = model._path_to_file([note])[0]
+            if canonical != name:
+                # The model only ever looks for the name with underscores
+                key = "/".join(parts + (note,))
+                if canonical in dirs:
+                    issues.append(_issue(NAME_COLLISION, relative, "Same note name as {0}".format(canonical), key))
+                else:
+                    issues.append(_issue(MISPLACED_NAME, relative, "Should be named {0}".format(canonical), key))
+                continue
+
+            path = parts + (note,)
+            tasks.append(("/".join(path), entry.path, None))
+            stack.append((entry.path, path))
+
+    return tasks
+
+
+def _scan_pack(model, tasks):
+    """ Add the pack index of each note with contents in the pack.
+        A note with a directory keeps its task and the worker reads the
+        pack if the directory has no contents file.  A task is added for
+        each note only in the pack.
+    """
+    pack = model._pack
+    if pack is None:
+        return
+
+    loose = dict((task[0], position) for (position, task) in enumerate(tasks))
+    for (key, index) in model._iter_packed():
+        if not pack.get_info(index)[0]:
+            continue
+
+        if key in loose:
+            position = loose[key]
+            tasks[position] = (key, tasks[position][1], index)
+        else:
+            tasks.append((key, None, index))
+
+
+def _scan_other_temp_files(pim, model, issues):
+    """ Find temporary files outside of the notes directory. """
+    root = pim.get_directory()
+    for directory in (root, model._attachments._directory):
+        try:
+            entries = list(os.scandir(directory))
+        except (IOError, OSError):
+            continue
+
+        for entry in entries:
+            name = entry.name
+            if entry.is_file(follow_symlinks=False) and (
+                _is_temp_file(name) or
+                (name.startswith(model.PACK_FILENAME + ".") and name.endswith(".tmp"))
+            ):
+                issues.append(_issue(TEMP_FILE, os.path.relpath(entry.path, root), "Temporary file left by an interrupted write"))
+
+
+def _scan_cache(pim, model, live, issues):
+    """ Find render cache entries of notes that no longer exist. """
+    root = pim.get_directory()
+    directory = model._render_cache.get_directory()
+    try:
+        with os.scandir(directory) as entries:
+            subdirs = [i for i in entries if i.is_dir(follow_symlinks=False)]
+    except (IOError, OSError):
+        return
+
+    for subdir in subdirs:
+        try:
+            with os.scandir(subdir.path) as entries:
+                for entry in entries:
+                    if entry.name not in live:
+                        issues.append(_issue(ORPHAN_CACHE, os.path.relpath(entry.path, root), "Cached page of a note that no longer exists"))
+        except (IOError, OSError):
+            continue
+
+
+def _repair(pim, model, issue):
+    """ Try to fix an issue.  Returns True if it was fixed. """
+    filename = os.path.join(pim.get_directory(), issue["file"])
+    try:
+        if issue["type"] == INVALID_XML:
+            path = model.get_path(tuple(issue["note"].split("/")))
+            for (revision, _, _) in reversed(model.get_revisions(path)):
+                contents = model.read_revision(path, revision)
+                try:
+                    ET.fromstring(contents.encode("utf-8"))
+                except ET.ParseError:
+                    continue
+
+                model.write_note(path, contents)
+                issue["message"] += " (restored revision {0})".format(revision)
+                return True
+
+        elif issue["type"] == MISPLACED_NAME:
+            target = os.path.join(os.path.dirname(filename), model._path_to_file([issue["note"].split("/")[-1]])[0])
+            if not os.path.lexists(target):
+                os.rename(filename, target)
+                return True
+
+        elif issue["type"] == TEMP_FILE:
+            if time.time() - os.stat(filename).st_mtime > TEMP_FILE_AGE:
+                os.unlink(filename)
+                return True
+
+        elif issue["type"] == ORPHAN_CACHE:
+            os.unlink(filename)
+            return True
+
+    except (Error, IOError, OSError) as e:
+        issue["message"] += " (repair failed: {0})".format(e)
+
+    return False
+
+
+def check_pim(pim, jobs=None, repair=False):
+    """ Check the notes of a PIM for problems.
+        Notes are parsed in parallel by a pool of jobs processes.  Progress
+        is reported through the PIM's progress function.  Returns a report
+        dictionary suitable for JSON, or None if the check was aborted.
+        If repair is True, issues that can be fixed safely are fixed and
+        marked as repaired in the report.
+    """
+    model = pim.get_model("notes")
+    model.flush_writes()
+    issues = []
+
+    if not pim.call_progress_function("Scanning notes", 0):
+        return None
+
+    tasks = _scan(pim, model, issues)
+    if tasks is None:
+        return None
+
+    _scan_pack(model, tasks)
+    _scan_other_temp_files(pim, model, issues)
+
+    total = len(tasks)
+    done = 0
+    live = set()
+
+    root = pim.get_directory()
+    results = pool_map(
+        _check_note,
+        tasks,
+        jobs,
+        _setup_worker,
+        (
+            model.NOTE_FILENAME,
+            model.ATTACHMENTS_FILENAME,
+            model._attachments._directory,
+            model._pack.get_filename() if model._pack is not None else None
+        ),
+        256
+    )
+    with contextlib.closing(results):
+        for (key, cache_key, note_issues) in results:
+            done += 1
+            if cache_key is not None:
+                live.add(cache_key)
+            for issue in note_issues:
+                issue["file"] = os.path.relpath(issue["file"], root)
+                issues.append(issue)
+
+            if done % SCAN_BATCH == 0 and not pim.call_progress_function("Checking notes", done * 100 // total):
+                return None
+
+    _scan_cache(pim, model, live, issues)
+
+    if repair:
+        for (position, issue) in enumerate(issues):
+            if not pim.call_progress_function("Repairing", position * 100 // len(issues)):
+                break
+            issue["repaired"] = _repair(pim, model, issue)
+
+    pim.call_progress_function("Checking notes", 100)
+
+    issues.sort(key=lambda i: (i["type"], i["file"]))
+    counts = {}
+    for issue in issues:
+        counts[issue["type"]] = counts.get(issue["type"], 0) + 1
+
+    return {
+        "directory": pim.get_directory(),
+        "time": time.time(),
+        "notes": total,
+        "counts": counts,
+        "issues": issues,
+    }
@@ -0,0 +1,244 @@
+""" Export of a PIM as static HTML. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import json
+import shutil
+import contextlib
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+from .pim import Pim
+from .errors import Error
+from .workers import pool_map
+from .models.noteslinks import rewrite_html_links
+
+
+MANIFEST_FILENAME = "manifest.json"
+PAGE_FILENAME = "index.html"
+
+
+def note_url(path, from_path=()):
+    """ Return the relative URL of a note's page from another note's page. """
+    parts = [i.replace(" ", "_") for i in path] + [PAGE_FILENAME]
+    return "../" * len(from_path) + "/".join(parts)
+
+
+def rewrite_links(html, path):
+    """ Replace note: links in rendered HTML with relative URLs. """
+    return rewrite_html_links(html, lambda target: note_url(target, path))
+
+
+def _note_directory(outdir, key):
+    """ Return the output directory of a note from its key. """
+    return os.path.join(outdir, *key.replace(" ", "_").split("/"))
+
+
+def _copy_attachment(source, target, link):
+    try:
+        stat = os.stat(target)
+        source_stat = os.stat(source)
+        if stat.st_size == source_stat.st_size and stat.st_mtime >= source_stat.st_mtime:
+            return
+        os.unlink(target)
+    except (IOError, OSError):
+        pass
+
+    if link:
+        try:
+            os.link(source, target)
+            return
+        except (IOError, OSError):
+            # Different file systems, fall back to copying
+            pass
+
+    shutil.copy2(source, target)
+
+
+def _attachments_stamp(model, path):
+    """ Return [name, mtime, size] for each attachment of a note, sorted. """
+    stamp = []
+    for (name, source) in sorted(model.get_attachment_files(path)):
+        try:
+            stat = os.stat(source)
+        except (IOError, OSError):
+            continue
+        stamp.append([name, stat.st_mtime, stat.st_size])
+
+    return stamp
+
+
+def _stamp_names(stamp):
+    """ Return the names of the files exported for a note from its stamp. """
+    if isinstance(stamp, list) and len(stamp) > 2:
+        return set(i[0] for i in stamp[2])
+    return set()
+
+
+def _remove_files(directory, names):
+    for name in names:
+        try:
+            os.unlink(os.path.join(directory, name))
+        except (IOError, OSError):
+            pass
+
+
+def _remove_stale(outdir, old_notes, notes):
+    """ Remove the pages and attachments of notes and attachments that no
+        longer exist, along with directories left empty.
+    """
+    for (key, stamp) in old_notes.items():
+        directory = _note_directory(outdir, key)
+        if key in notes:
+            _remove_files(directory, _stamp_names(stamp) - _stamp_names(notes[key]))
+            continue
+
+        _remove_files(directory, _stamp_names(stamp) | set([PAGE_FILENAME]))
+        while directory != outdir:
+            try:
+                os.rmdir(directory)
+            except (IOError, OSError):
+                # Still holds the pages of sub-notes
+                break
+            directory = os.path.dirname(directory)
+
+
+def _setup_worker(directory, outdir, link):
+    return {"model": Pim(directory).get_model("notes"), "outdir": outdir, "link": link}
+
+
+def _export_note(state, path):
+    """ Render one note and copy its attachments.
+        Runs in a worker process.  Returns (path, error).
+    """
+    model = state["model"]
+    outdir = _note_directory(state["outdir"], "/".join(path))
+
+    try:
+        html = model.parse_note(path) or ""
+        html = rewrite_links(html, path)
+
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+
+        with io.open(os.path.join(outdir, PAGE_FILENAME), "wt", encoding="utf-8") as handle:
+            handle.write(html)
+
+        for (name, source) in model.get_attachment_files(path):
+            _copy_attachment(source, os.path.join(outdir, name), state["link"])
+    except (Error, IOError, OSError) as e:
+        return (path, str(e))
+
+    return (path, None)
+
+
+def _write_index(model, outdir):
+    """ Write the top level page listing every note. """
+    parts = ["<html><body><ul>"]
+    depth = 1
+    for path in model.walk_notes():
+        while depth < len(path):
+            parts.append("<ul>")
+            depth += 1
+        while depth > len(path):
+            parts.append("</ul>")
+            depth -= 1
+        parts.append('<li><a href="{0}">{1}</a></li>'.format(
+            escape(note_url(path), True),
+            escape(path[-1])
+        ))
+    parts.append("</ul>" * depth)
+    parts.append("</body></html>")
+
+    with io.open(os.path.join(outdir, PAGE_FILENAME), "wt", encoding="utf-8") as handle:
+        handle.write("\n".join(parts))
+
+
+def export_notes(pim, outdir, jobs=None, link=True):
+    """ Export every note of a PIM to static HTML files.
+        Notes are rendered in parallel by a pool of jobs processes.  A
+        manifest in the output directory records what was exported, and
+        notes whose contents and attachments haven't changed since are
+        skipped.  The files of notes and attachments that no longer exist
+        are removed.  Attachments are hard linked if link is True and
+        possible, otherwise copied.  Progress is
+        reported through the PIM's progress function.  Returns False if the
+        export was aborted.
+    """
+    model = pim.get_model("notes")
+    fingerprint = pim.get_template_cache().digest()
+    manifest_file = os.path.join(outdir, MANIFEST_FILENAME)
+
+    try:
+        with io.open(manifest_file, "rt", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+    except (IOError, OSError, ValueError):
+        manifest = {}
+
+    if manifest.get("fingerprint") != fingerprint:
+        # Templates changed, so everything has to be rendered again
+        manifest = {}
+
+    old_notes = manifest.get("notes", {})
+    notes = {}
+    todo = []
+
+    if not pim.call_progress_function("Scanning notes", 0):
+        return False
+
+    for path in model.walk_notes():
+        (_, stat) = model._stat_contents(path)
+        if stat is None:
+            continue
+
+        key = "/".join(path)
+        notes[key] = [stat.st_mtime, stat.st_size, _attachments_stamp(model, path)]
+        if old_notes.get(key) != notes[key]:
+            todo.append(path)
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    # Notes that don't need exporting are already up to date
+    exported = dict(
+        (key, stamp) for (key, stamp) in notes.items() if old_notes.get(key) == stamp
+    )
+
+    total = len(todo)
+    done = 0
+    aborted = False
+
+    results = pool_map(_export_note, todo, jobs, _setup_worker, (pim.get_directory(), outdir, link))
+    with contextlib.closing(results):
+        for (path, error) in results:
+            done += 1
+            key = "/".join(path)
+            if error is None:
+                exported[key] = notes[key]
+            else:
+                pim.call_log_function("error", "export", "{0}: {1}".format(key, error))
+
+            if not pim.call_progress_function("Exporting notes", done * 100 // total):
+                aborted = True
+                break
+
+    _remove_stale(outdir, old_notes, notes)
+
+    _write_index(model, outdir)
+
+    with io.open(manifest_file, "wt", encoding="utf-8") as handle:
+        json.dump({"fingerprint": fingerprint, "notes": exported}, handle, sort_keys=True)
+
+    if aborted:
+        return False
+
+    pim.call_progress_function("Exporting notes", 100)
+    return True
@@ -5,11 +5,15 @@ __copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
 __license__     =   "Apache License 2.0"
 
 
+import os
+import io
+
 import wx
 
 from mrbaviirc.gui.wx import bookctrl
 
 from ..pim import Pim
+from ..metrics import MetricsCollector
 
 class MainWindow(wx.Frame):
 
@@ -17,6 +21,13 @@ class MainWindow(wx.Frame):
         wx.Frame.__init__(self, None, wx.ID_ANY, "Main Window")
 
         self._pim = Pim(directory)
+
+        # Collect timings of model operations if requested
+        self._metrics = None
+        if os.environ.get("MRBAVII_MYPIM_METRICS"):
+            self._metrics = MetricsCollector()
+            self._pim.register_metrics_function(self._metrics)
+
         self.InitGui()
 
     def InitGui(self):
@@ -32,8 +43,10 @@ class MainWindow(wx.Frame):
 
         from . import views
 
+        self._view_windows = []
         for view in views.all_views:
             view_window = view(self.views, self._pim)
+            self._view_windows.append(view_window)
             view_bitmap = wx.ArtProvider.GetBitmap(view.VIEW_ICON, size=(32, 32))
             self.views.AddPage(view_window, view.VIEW_NAME, view_bitmap)
 
@@ -51,14 +64,44 @@ class MainWindow(wx.Frame):
         # Restore view classes
         self._pim.notify_listeners("view-restore")
 
+        # Views create their contents when first shown, make sure the one
+        # shown at startup does.
+        for view_window in self._view_windows:
+            if view_window.IsShown():
+                view_window.Activate()
+
         # Events
         self.Bind(wx.EVT_CLOSE, self.OnClose)
 
     def OnClose(self, event):
         self._pim.notify_listeners("view-save")
 
+        try:
+            self._pim.close()
+        except Exception as e:
+            wx.MessageBox("Unable to save changes: {0}".format(e), "Error", parent=self)
+
+        if self._metrics:
+            self.DumpMetrics()
+
         self.Destroy()
 
+    def DumpMetrics(self):
+        """ Write the collected metrics to the PIM cache directory. """
+        directory = os.path.join(self._pim.get_directory(), "cache")
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            with io.open(os.path.join(directory, "metrics.txt"), "wt") as handle:
+                handle.write(self._metrics.format() + "\n")
+                stats = self._pim.get_template_cache().get_stats()
+                handle.write("\ntemplate cache: {0} hits, {1} misses, {2} templates\n".format(
+                    stats["hits"], stats["misses"], stats["templates"]
+                ))
+        except (IOError, OSError) as e:
+            wx.LogError(str(e))
+
     def OnViewRestore(self):
         config = wx.Config.Get()
         changer = wx.ConfigPathChanger(config, "/Views/MainWindow/")
@@ -5,10 +5,34 @@ __copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
 __license__     =   "Apache License 2.0"
 
 
+import threading
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
 import wx
 import wx.html
 
 from .view import View
+from ..worker import RenderWorker
+
+
+LOADING_PAGE = "<html><body><p><i>Loading...</i></p></body></html>"
+
+# Number of notes added to the tree at a time
+PAGE_SIZE = 200
+
+
+class MoreItem(object):
+    """ Data of the placeholder item that loads the next page of notes. """
+
+    __slots__ = ("note", "offset")
+
+    def __init__(self, note, offset):
+        self.note = note
+        self.offset = offset
 
 
 class NotesView(View):
@@ -17,24 +41,38 @@ class NotesView(View):
 
     def __init__(self, parent, pim):
         View.__init__(self, parent, pim)
-        self._model = pim.get_model("notes")
-
-        self.InitGui()
+        self._model = None
+        self._worker = None
+        self._current = None
+        self._more = {}
+        self._listings = {}
 
     def InitGui(self):
+        self._model = self._pim.get_model("notes")
+        self._worker = RenderWorker()
+
         # Create the basic GUI
         self.splitter = wx.SplitterWindow(self)
 
-        self.tree = wx.TreeCtrl(self.splitter, wx.ID_ANY, style=wx.TR_HIDE_ROOT | wx.TR_HAS_BUTTONS | wx.TR_LINES_AT_ROOT)
+        left = wx.Panel(self.splitter, wx.ID_ANY)
+        self.search = wx.SearchCtrl(left, wx.ID_ANY, style=wx.TE_PROCESS_ENTER)
+        self.tree = wx.TreeCtrl(left, wx.ID_ANY, style=wx.TR_HIDE_ROOT | wx.TR_HAS_BUTTONS | wx.TR_LINES_AT_ROOT)
         self.tabs = wx.Notebook(self.splitter, wx.ID_ANY)
 
+        left_sizer = wx.BoxSizer(wx.VERTICAL)
+        left_sizer.Add(self.search, 0, wx.EXPAND | wx.BOTTOM, 5)
+        left_sizer.Add(self.tree, 1, wx.EXPAND)
+        left.SetSizer(left_sizer)
+
         self.view = wx.html.HtmlWindow(self.tabs, wx.ID_ANY)
         self.source = wx.TextCtrl(self.tabs, wx.ID_ANY, style=wx.TE_MULTILINE | wx.TE_PROCESS_ENTER | wx.TE_PROCESS_TAB | wx.HSCROLL)
+        self.links = wx.html.HtmlWindow(self.tabs, wx.ID_ANY)
 
         self.tabs.AddPage(self.view, "View")
         self.tabs.AddPage(self.source, "Edit")
+        self.tabs.AddPage(self.links, "Links")
 
-        self.splitter.SplitVertically(self.tree, self.tabs)
+        self.splitter.SplitVertically(left, self.tabs)
         self.splitter.SetMinimumPaneSize(20)
 
         sizer = wx.BoxSizer(wx.VERTICAL)
@@ -43,12 +81,26 @@ class NotesView(View):
 
         # Events
         self.Bind(wx.html.EVT_HTML_LINK_CLICKED, self.OnClick)
+        self.Bind(wx.EVT_TEXT_ENTER, self.OnSearch, self.search)
+        self.Bind(wx.EVT_SEARCHCTRL_SEARCH_BTN, self.OnSearch, self.search)
         self.Bind(wx.EVT_TREE_SEL_CHANGED, self.OnNoteChanged, self.tree)
         self.Bind(wx.EVT_TREE_ITEM_EXPANDING, self.OnNoteExpand, self.tree)
         self.Bind(wx.EVT_TREE_ITEM_COLLAPSED, self.OnNoteCollapse, self.tree)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy, self)
+        self.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.OnTabChanged, self.tabs)
+        self.Bind(wx.EVT_TEXT, self.OnSourceChanged, self.source)
+        self.tree.Bind(wx.EVT_SCROLLWIN, self.OnTreeScroll)
+        self.tree.Bind(wx.EVT_MOUSEWHEEL, self.OnTreeScroll)
+        self.tree.Bind(wx.EVT_SIZE, self.OnTreeScroll)
 
         # Initialize
-        self.RefreshTree()
+        if not self.RestoreTreeState():
+            self.RefreshTree()
+
+        # Build the indexes if this is a new or upgraded PIM
+        thread = threading.Thread(target=self._model.reindex_if_needed)
+        thread.daemon = True
+        thread.start()
 
     def PopulateTree(self, item):
         # Determine the items note
@@ -57,25 +109,294 @@ class NotesView(View):
             return
 
         note = data.GetData()
-        children = self._model.get_children(note)
-        for child in children:
+        self.AppendPage(item, note, 0)
+
+    def AppendPage(self, item, note, offset):
+        """ Add a page of the children of a note to a tree item.
+            If there may be more children, a placeholder item is added
+            which loads the next page when it is scrolled into view.
+        """
+        children = None
+        if offset == 0:
+            # Saved listings are only used while restoring the tree
+            children = self._listings.pop("/".join(note) if note else "", None)
+        if children is None:
+            children = self._model.get_children_info(note, offset, PAGE_SIZE)
+
+        for (child, has_children, mtime, size) in children:
             name = child[-1]
             child_item = self.tree.AppendItem(item, name, data=wx.TreeItemData(child))
-            has_children = self._model.get_children(child)
-            self.tree.SetItemHasChildren(child_item, len(has_children) > 0)
+            self.tree.SetItemHasChildren(child_item, has_children)
+
+        if len(children) == PAGE_SIZE:
+            more = MoreItem(note, offset + PAGE_SIZE)
+            more_item = self.tree.AppendItem(item, "More...", data=wx.TreeItemData(more))
+            self.tree.SetItemTextColour(more_item, wx.SystemSettings.GetColour(wx.SYS_COLOUR_GRAYTEXT))
+            self._more[item] = more_item
+
+    def LoadMore(self, more_item):
+        """ Replace a placeholder item with the next page of notes. """
+        parent = self.tree.GetItemParent(more_item)
+        if self._more.get(parent) != more_item:
+            # Already loaded or removed
+            return
+
+        del self._more[parent]
+        more = self.tree.GetItemData(more_item).GetData()
+
+        self.tree.Freeze()
+        try:
+            self.tree.Delete(more_item)
+            self.AppendPage(parent, more.note, more.offset)
+        finally:
+            self.tree.Thaw()
+
+    def LoadVisible(self):
+        """ Load the next page for each placeholder that is on screen. """
+        for more_item in list(self._more.values()):
+            if self.tree.IsVisible(more_item):
+                self.LoadMore(more_item)
 
     def RefreshTree(self):
         # self.set_selection(None)
+        self._more = {}
         self.tree.DeleteAllItems()
 
         root_item = self.tree.AddRoot("", data=wx.TreeItemData(None))
         self.PopulateTree(root_item)
 
 
+    def RestoreTreeState(self):
+        """ Rebuild the tree as it was when last saved.
+            The saved listings are shown right away and checked against the
+            notes in the background.  Returns False if there is no saved
+            state.
+        """
+        state = self._model.load_tree_state()
+        if state is None:
+            return False
+
+        (expanded, selected, listings, limit) = state
+        if limit != PAGE_SIZE:
+            return False
+
+        self._listings = dict(listings)
+        self.tree.Freeze()
+        try:
+            self.RefreshTree()
+            for path in expanded:
+                item = self.FindItem(path)
+                if item is not None:
+                    self.tree.Expand(item)
+
+            if selected is not None:
+                self.SelectNote(selected)
+        finally:
+            self.tree.Thaw()
+            self._listings = {}
+
+        model = self._model
+        def check():
+            changed = model.check_tree_state(listings, PAGE_SIZE)
+            if changed:
+                wx.CallAfter(self.OnTreeStateChecked, changed)
+
+        thread = threading.Thread(target=check)
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def SaveTreeState(self):
+        """ Save the expanded notes, the selection and their listings. """
+        expanded = self.GetExpandedNotes(self.tree.GetRootItem())
+
+        selected = None
+        item = self.tree.GetSelection()
+        if item.IsOk():
+            selected = self.tree.GetItemData(item).GetData()
+            if isinstance(selected, MoreItem):
+                selected = None
+
+        self._model.save_tree_state(expanded, selected, PAGE_SIZE)
+
+    def GetExpandedNotes(self, item):
+        """ Return the paths of the expanded items below an item, parents first. """
+        expanded = []
+        (child, cookie) = self.tree.GetFirstChild(item)
+        while child.IsOk():
+            if self.tree.IsExpanded(child):
+                expanded.append(self.tree.GetItemData(child).GetData())
+                expanded.extend(self.GetExpandedNotes(child))
+            child = self.tree.GetNextSibling(child)
+
+        return expanded
+
+    def FindLoadedItem(self, path):
+        """ Find the tree item for a note without loading anything.
+            Returns None if the note isn't in the tree as it is.
+        """
+        item = self.tree.GetRootItem()
+        for count in range(1, len(path) + 1):
+            target = path[:count]
+            (child, cookie) = self.tree.GetFirstChild(item)
+            while child.IsOk() and self.tree.GetItemData(child).GetData() != target:
+                child = self.tree.GetNextSibling(child)
+            if not child.IsOk():
+                return None
+            item = child
+
+        return item
+
+    def ReloadItem(self, item):
+        """ List the children of an expanded item again.
+            The expanded items and the selection below it are kept.
+        """
+        root = self.tree.GetRootItem()
+        if item != root and not self.tree.IsExpanded(item):
+            return
+
+        expanded = self.GetExpandedNotes(item)
+        selected = self.tree.GetSelection()
+        selected = self.tree.GetItemData(selected).GetData() if selected.IsOk() else None
+
+        self.tree.Freeze()
+        try:
+            self.ForgetMore(item)
+            self.tree.DeleteChildren(item)
+            self.PopulateTree(item)
+            for path in expanded:
+                child = self.FindItem(path)
+                if child is not None:
+                    self.tree.Expand(child)
+
+            if selected is not None and not isinstance(selected, MoreItem):
+                if not self.tree.GetSelection().IsOk():
+                    self.SelectNote(selected)
+        finally:
+            self.tree.Thaw()
+
+    def ForgetMore(self, item):
+        """ Forget the placeholders of the items below an item. """
+        for parent in list(self._more):
+            ancestor = parent
+            while ancestor.IsOk() and ancestor != item:
+                ancestor = self.tree.GetItemParent(ancestor)
+            if ancestor.IsOk():
+                del self._more[parent]
+
+    def FindItem(self, path):
+        """ Find the tree item for a note, expanding the tree as needed.
+            Pages of notes are loaded until the note is found.
+        """
+        item = self.tree.GetRootItem()
+        for count in range(1, len(path) + 1):
+            if count > 1:
+                self.tree.Expand(item)
+
+            target = path[:count]
+            (child, cookie) = self.tree.GetFirstChild(item)
+            while child.IsOk():
+                data = self.tree.GetItemData(child).GetData()
+                if isinstance(data, MoreItem):
+                    # Load the next page and continue from its first note
+                    previous = self.tree.GetPrevSibling(child)
+                    self.LoadMore(child)
+                    if previous.IsOk():
+                        child = self.tree.GetNextSibling(previous)
+                    else:
+                        (child, cookie) = self.tree.GetFirstChild(item)
+                    continue
+
+                if data == target:
+                    break
+                child = self.tree.GetNextSibling(child)
+            else:
+                return None
+
+            item = child
+
+        return item
+
+    def SelectNote(self, path):
+        """ Select a note in the tree.  Returns False if it wasn't found. """
+        item = self.FindItem(tuple(path))
+        if item is None:
+            return False
+
+        self.tree.SelectItem(item)
+        self.tree.EnsureVisible(item)
+        return True
+
+    def ShowSearchResults(self, query, results):
+        # Don't let a note still loading replace the results
+        self._worker.Cancel()
+
+        parts = ["<html><body><h3>Search: {0}</h3>".format(escape(query))]
+        if not results:
+            parts.append("<p>No notes found.</p>")
+
+        for (path, snippet) in results:
+            snippet = escape(snippet).replace("\x01", "<b>").replace("\x02", "</b>")
+            parts.append('<p><a href="{0}">{1}</a><br>{2}</p>'.format(
+                escape(self._model.path_to_link(path), True),
+                escape(" / ".join(path)),
+                snippet
+            ))
+
+        parts.append("</body></html>")
+        self.view.SetPage("".join(parts))
+        self.tabs.SetSelection(0)
+
+    def ShowLinks(self, note, links, backlinks):
+        """ Show the notes linked to from and linking to a note. """
+        def item(path, exists):
+            text = escape(" / ".join(path))
+            if not exists:
+                return "<li><i>{0} (missing)</i></li>".format(text)
+            return '<li><a href="{0}">{1}</a></li>'.format(
+                escape(self._model.path_to_link(path), True),
+                text
+            )
+
+        parts = ["<html><body><h3>{0}</h3>".format(escape(" / ".join(note)))]
+        for (title, paths) in (("Links to", links), ("Linked from", backlinks)):
+            parts.append("<h4>{0}</h4>".format(title))
+            if not paths:
+                parts.append("<p>None.</p>")
+                continue
+
+            parts.append("<ul>")
+            for (path, exists) in paths:
+                parts.append(item(path, exists))
+            parts.append("</ul>")
+
+        parts.append("</body></html>")
+        self.links.SetPage("".join(parts))
+
+    def OnSearch(self, evt):
+        query = self.search.GetValue().strip()
+        if not query:
+            return
+
+        try:
+            results = self._model.search(query)
+        except Exception as e:
+            wx.LogError(str(e))
+            return
+
+        self.ShowSearchResults(query, results)
+
     def OnClick(self, evt):
-        #wx.MessageBox(evt.GetLinkInfo().GetHref(), "Title", parent=self)
-        evt.Skip()
-        pass
+        path = self._model.link_to_path(evt.GetLinkInfo().GetHref())
+        if path is None:
+            evt.Skip()
+            return
+
+        if not self.SelectNote(path):
+            wx.LogError("The note {0} does not exist.".format(" / ".join(path)))
+            return
+
+        self.tabs.SetSelection(0)
 
     def OnNoteChanged(self, evt):
         item = evt.GetItem();
@@ -89,15 +410,78 @@ class NotesView(View):
 
         # Data from tree item data
         note = note.GetData()
+        if isinstance(note, MoreItem):
+            # Don't delete the item while its selection is being handled
+            wx.CallAfter(self.LoadMore, item)
+            return
+
+        # Show a placeholder until the note is loaded in the background
+        self._current = None
+        self.source.ChangeValue("")
+        self.view.SetPage(LOADING_PAGE)
+        self.links.SetPage("")
+
+        model = self._model
+        def load():
+            backlinks = [(path, True) for path in model.get_backlinks(note)]
+            return (note, model.load_note(note), model.get_links(note), backlinks)
+
+        self._worker.Submit(
+            load,
+            self.OnNoteLoaded,
+            self.OnNoteLoadError
+        )
+
+    def OnNoteLoaded(self, result):
+        (note, (contents, html), links, backlinks) = result
+        self._current = note
+        self.source.ChangeValue(contents)
+        self.source.DiscardEdits()
+        self.view.SetPage(html or "")
+        self.ShowLinks(note, links, backlinks)
+
+    def OnPreviewRendered(self, html):
+        self.view.SetPage(html or "")
+
+    def OnSourceChanged(self, evt):
+        # Only edits by the user, ChangeValue doesn't send this event
+        if self._current is None:
+            return
 
         try:
-            contents = self._model.read_note(note)
-            self.source.SetValue(contents)
-            html = self._model.parse_note(note)
-            self.view.SetPage(html)
+            self._model.queue_write(self._current, self.source.GetValue())
         except Exception as e:
             wx.LogError(str(e))
 
+    def OnTabChanged(self, evt):
+        evt.Skip()
+
+        # Preview the edited source when switching back to the view
+        if evt.GetSelection() != 0 or not self.source.IsModified():
+            return
+
+        contents = self.source.GetValue()
+        model = self._model
+        self._worker.Submit(
+            lambda: model.render_note_text(contents),
+            self.OnPreviewRendered,
+            self.OnNoteLoadError
+        )
+
+    def OnNoteLoadError(self, error):
+        self.view.SetPage("")
+        wx.LogError(str(error))
+
+    def OnDestroy(self, evt):
+        if evt.GetEventObject() is self:
+            self._worker.Shutdown()
+        evt.Skip()
+
+    def OnTreeScroll(self, evt):
+        evt.Skip()
+        if self._more:
+            # Check after the tree has scrolled
+            wx.CallAfter(self.LoadVisible)
 
     def OnNoteExpand(self, evt):
         item = evt.GetItem()
@@ -111,8 +495,25 @@ class NotesView(View):
         if not item.IsOk():
             return
 
+        # Forget the placeholders of the items about to be deleted
+        self.ForgetMore(item)
         self.tree.DeleteChildren(item)
 
+    def OnTreeStateChecked(self, changed):
+        """ Update the parts of a restored tree that were out of date. """
+        # Reloading a note reloads everything below it
+        changed = sorted(changed, key=lambda key: key.count("/") if key else -1)
+        done = []
+        for key in changed:
+            path = tuple(key.split("/")) if key else ()
+            if any(path[:len(i)] == i for i in done):
+                continue
+
+            item = self.FindLoadedItem(path)
+            if item is not None:
+                self.ReloadItem(item)
+                done.append(path)
+
     def DoViewRestore(self, config):
         position = config.ReadInt("SashPosition", 40)
         self.splitter.SetSashPosition(position)
@@ -120,5 +521,15 @@ class NotesView(View):
     def DoViewSave(self, config):
         config.WriteInt("SashPosition", self.splitter.GetSashPosition())
 
+        try:
+            self.SaveTreeState()
+        except Exception as e:
+            wx.LogError(str(e))
+
+        try:
+            self._model.flush_writes()
+        except Exception as e:
+            wx.LogError(str(e))
+
 
 
@@ -17,17 +17,55 @@ class View(wx.Panel):
         
         wx.Panel.__init__(self, parent, wx.ID_ANY)
         self._pim = pim
+        self._active = False
+        self._restore = False
 
         self._pim.add_listener("view-restore", self.OnViewRestore)
         self._pim.add_listener("view-save", self.OnViewSave)
 
+        # The contents of the view are created when it is first shown
+        self.Bind(wx.EVT_SHOW, self.OnShow)
+
+    def OnShow(self, evt):
+        evt.Skip()
+        if evt.IsShown():
+            self.Activate()
+
+    def Activate(self):
+        """ Create the contents of the view if not already done. """
+        if self._active:
+            return
+
+        self._active = True
+        self.InitGui()
+        self.Layout()
+
+        if self._restore:
+            self._restore = False
+            self.OnViewRestore()
+
+    def IsActive(self):
+        return self._active
+
+    def InitGui(self):
+        pass
+
     def OnViewRestore(self):
+        if not self._active:
+            # Restore once the view is created
+            self._restore = True
+            return
+
         config = wx.Config.Get()
         changer = wx.ConfigPathChanger(config, "/Views/" + self.VIEW_NAME + "/")
 
         self.DoViewRestore(config)
 
     def OnViewSave(self):
+        if not self._active:
+            # Never created, so nothing changed
+            return
+
         config = wx.Config.Get()
         changer = wx.ConfigPathChanger(config, "/Views/" + self.VIEW_NAME + "/")
 
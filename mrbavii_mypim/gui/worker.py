@@ -0,0 +1,88 @@
+""" Background worker for rendering in the GUI. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import threading
+from concurrent import futures
+
+import wx
+
+
+class RenderWorker(object):
+    """
+    Run tasks in a thread pool and deliver the results on the GUI thread.
+
+    Only the result of the most recently submitted task is delivered.
+    Submitting a new task cancels the previous one if it hasn't started
+    yet, and drops its result if it has.
+    """
+
+    def __init__(self, max_workers=1):
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._future = None
+        self._generation = 0
+        self._closed = False
+
+    def Submit(self, func, callback, errback=None):
+        """ Run func in the background.
+            callback is called with the result on the GUI thread, or errback
+            with the exception if func raised one.
+        """
+        with self._lock:
+            if self._closed:
+                return
+
+            if self._future is not None:
+                self._future.cancel()
+
+            self._generation += 1
+            generation = self._generation
+
+            future = self._executor.submit(func)
+            self._future = future
+
+        future.add_done_callback(
+            lambda f: self._OnDone(f, generation, callback, errback)
+        )
+
+    def Cancel(self):
+        """ Cancel or drop the current task. """
+        with self._lock:
+            if self._future is not None:
+                self._future.cancel()
+                self._future = None
+            self._generation += 1
+
+    def IsCurrent(self, generation):
+        with self._lock:
+            return not self._closed and generation == self._generation
+
+    def _OnDone(self, future, generation, callback, errback):
+        # Called on the worker thread, or the calling thread if cancelled
+        if future.cancelled() or not self.IsCurrent(generation):
+            return
+
+        error = future.exception()
+        if error is None:
+            wx.CallAfter(self._Deliver, generation, callback, future.result())
+        elif errback is not None:
+            wx.CallAfter(self._Deliver, generation, errback, error)
+
+    def _Deliver(self, generation, func, value):
+        # Check again, a newer task may have been submitted meanwhile
+        if self.IsCurrent(generation):
+            func(value)
+
+    def Shutdown(self):
+        """ Stop accepting tasks and drop any pending results. """
+        with self._lock:
+            self._closed = True
+            if self._future is not None:
+                self._future.cancel()
+                self._future = None
+
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,480 @@
+""" Bulk import of notes from other collections. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+"""
+The import is a pipeline of generators, so only one batch of notes is in
+memory at a time however large the collection is:
+
+    scan_directory / scan_pim   yield (parts, file or data) in tree order
+    convert_documents           read and convert files to note XML
+    assign_paths                pick an unused note path for each
+    make_batches                group the notes for NotesModel.write_notes
+
+parts are the names from the source, which may not be valid note names.
+"""
+
+
+import os
+import io
+import re
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+from html.parser import HTMLParser
+
+from .pim import Pim
+from .errors import Error
+
+
+BATCH_SIZE = 500
+DEFAULT_NOTE = b"<note></note>"
+
+_invalid_name_re = re.compile("[^A-Za-z0-9]+")
+
+
+def make_name(name):
+    """ Turn a file name into a valid note name. """
+    return " ".join(_invalid_name_re.sub(" ", name).split()) or "Untitled"
+
+
+def _wrap(parts):
+    return "<note>\n" + "\n".join(parts) + "\n</note>"
+
+
+def text_to_note(text):
+    """ Convert plain text to note XML, one paragraph per block of lines. """
+    paragraphs = [i.strip() for i in re.split(r"\n\s*\n", text) if i.strip()]
+    return _wrap([
+        "<p>{0}</p>".format(escape(i).replace("\n", "<br/>"))
+        for i in paragraphs
+    ])
+
+
+_md_code_re = re.compile(r"`([^`]+)`")
+_md_inline = (
+    (re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)"), r'<a href="\2">\1</a>'),
+    (re.compile(r"\*\*(.+?)\*\*|__(.+?)__"), lambda m: "<b>{0}</b>".format(m.group(1) or m.group(2))),
+    (re.compile(r"\*([^*]+)\*|\b_([^_]+)_\b"), lambda m: "<i>{0}</i>".format(m.group(1) or m.group(2))),
+)
+_md_heading_re = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_md_item_re = re.compile(r"^\s*(?:([-*+])|\d+[.)])\s+(.*)$")
+_md_rule_re = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+
+
+def _markdown_inline(text):
+    # Code spans are escaped but not formatted
+    parts = _md_code_re.split(text)
+    for i in range(len(parts)):
+        parts[i] = escape(parts[i])
+        if i % 2:
+            parts[i] = "<code>{0}</code>".format(parts[i])
+        else:
+            for (pattern, replace) in _md_inline:
+                parts[i] = pattern.sub(replace, parts[i])
+    return "".join(parts)
+
+
+def markdown_to_note(text):
+    """ Convert the common parts of Markdown to note XML.
+        Headings, paragraphs, lists, block quotes, rules, fenced code and
+        inline emphasis, code and links are converted.  Anything else is
+        kept as text.
+    """
+    output = []
+    para = []
+    quote = []
+    items = []
+    list_tag = None
+    code = None
+
+    def flush():
+        if para:
+            output.append("<p>{0}</p>".format(_markdown_inline(" ".join(para))))
+            del para[:]
+        if quote:
+            output.append("<blockquote><p>{0}</p></blockquote>".format(_markdown_inline(" ".join(quote))))
+            del quote[:]
+        if items:
+            output.append("<{0}>{1}</{0}>".format(
+                list_tag,
+                "".join("<li>{0}</li>".format(_markdown_inline(i)) for i in items)
+            ))
+            del items[:]
+
+    for line in text.splitlines():
+        if code is not None:
+            if line.strip().startswith("```"):
+                output.append("<pre>{0}</pre>".format(escape("\n".join(code))))
+                code = None
+            else:
+                code.append(line)
+            continue
+
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            flush()
+            code = []
+            continue
+
+        if not stripped:
+            flush()
+            continue
+
+        match = _md_heading_re.match(stripped)
+        if match:
+            flush()
+            level = len(match.group(1))
+            output.append("<h{0}>{1}</h{0}>".format(level, _markdown_inline(match.group(2))))
+            continue
+
+        if _md_rule_re.match(stripped):
+            flush()
+            output.append("<hr/>")
+            continue
+
+        match = _md_item_re.match(line)
+        if match:
+            tag = "ul" if match.group(1) else "ol"
+            if para or quote or (items and tag != list_tag):
+                flush()
+            list_tag = tag
+            items.append(match.group(2))
+            continue
+
+        if stripped.startswith(">"):
+            if para or items:
+                flush()
+            quote.append(stripped[1:].strip())
+            continue
+
+        if items and line[:1].isspace():
+            # Continuation of a list item
+            items[-1] += " " + stripped
+            continue
+
+        if quote or items:
+            flush()
+        para.append(stripped)
+
+    if code is not None:
+        output.append("<pre>{0}</pre>".format(escape("\n".join(code))))
+    flush()
+
+    return _wrap(output)
+
+
+class _NoteHTMLParser(HTMLParser):
+    """ Turn HTML, which need not be well formed, into well formed XML. """
+
+    VOID = frozenset((
+        "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+        "meta", "param", "source", "track", "wbr"
+    ))
+    SKIP = frozenset(("head", "script", "style", "title", "template"))
+    DROP = frozenset(("html", "body"))
+    # Elements closed by another of the same kind, like <li>one<li>two
+    SIBLINGS = frozenset(("li", "p", "tr", "td", "th", "dt", "dd", "option"))
+
+    _name_re = re.compile(r"^[A-Za-z_][-A-Za-z0-9_.]*$")
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.output = []
+        self.stack = []
+        self.skipping = 0
+
+    def _attrs(self, attrs):
+        return "".join(
+            ' {0}="{1}"'.format(name, escape(value or "", True))
+            for (name, value) in attrs
+            if self._name_re.match(name) and not name.startswith("on")
+        )
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skipping += 1
+            return
+
+        if self.skipping or tag in self.DROP or not self._name_re.match(tag):
+            return
+
+        if tag in self.SIBLINGS and self.stack and self.stack[-1] == tag:
+            self.output.append("</{0}>".format(self.stack.pop()))
+
+        if tag in self.VOID:
+            self.output.append("<{0}{1}/>".format(tag, self._attrs(attrs)))
+        else:
+            self.output.append("<{0}{1}>".format(tag, self._attrs(attrs)))
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.VOID or tag in self.SKIP:
+            self.handle_starttag(tag, attrs)
+            if tag in self.SKIP:
+                self.skipping -= 1
+        else:
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self.skipping = max(0, self.skipping - 1)
+            return
+
+        if self.skipping or tag not in self.stack:
+            return
+
+        # Close anything left open inside it
+        while self.stack:
+            top = self.stack.pop()
+            self.output.append("</{0}>".format(top))
+            if top == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.output.append(escape(data, False))
+
+    def get_result(self):
+        self.close()
+        while self.stack:
+            self.output.append("</{0}>".format(self.stack.pop()))
+        return "".join(self.output)
+
+
+def html_to_note(text):
+    """ Convert an HTML document to note XML.
+        The head, scripts and styles are dropped and the rest is made well
+        formed.
+    """
+    parser = _NoteHTMLParser()
+    parser.feed(text)
+    return _wrap([parser.get_result()])
+
+
+CONVERTERS = {
+    ".txt": text_to_note,
+    ".text": text_to_note,
+    ".md": markdown_to_note,
+    ".markdown": markdown_to_note,
+    ".mdown": markdown_to_note,
+    ".html": html_to_note,
+    ".htm": html_to_note,
+    ".xhtml": html_to_note,
+}
+
+
+def is_pim_directory(source):
+    """ Determine if a directory is a PIM rather than a collection of files. """
+    notes = os.path.join(source, "notes")
+    if not os.path.isdir(notes):
+        return False
+
+    if os.path.isfile(os.path.join(source, "notes.pack")):
+        return True
+
+    with os.scandir(notes) as entries:
+        for entry in entries:
+            if entry.is_dir() and os.path.isfile(os.path.join(entry.path, "contents.note")):
+                return True
+
+    return False
+
+
+def scan_directory(source, parts=()):
+    """ Yield (parts, file) for each file that can be imported, depth first.
+        Each directory is yielded as (parts, None) before what is in it,
+        right after a file of the same name, so "A.md" and "A/" become one
+        note.
+    """
+    try:
+        entries = [
+            i for i in os.scandir(source)
+            if not i.name.startswith(".") and not i.is_symlink()
+        ]
+    except (IOError, OSError):
+        return
+
+    found = []
+    for entry in entries:
+        if entry.is_dir():
+            found.append((entry.name, 1, entry))
+        else:
+            (stem, ext) = os.path.splitext(entry.name)
+            if ext.lower() in CONVERTERS:
+                found.append((stem, 0, entry))
+
+    for (name, is_dir, entry) in sorted(found, key=lambda i: (i[0], i[1], i[2].name)):
+        if is_dir:
+            yield (parts + (name,), None)
+            for item in scan_directory(entry.path, parts + (name,)):
+                yield item
+        else:
+            yield (parts + (name,), entry.path)
+
+
+def walk_pim(model, path=()):
+    """ Yield the path of each note of another PIM's notes model, depth first.
+        The note directories and the pack are listed directly rather than
+        through the hierarchy index, so nothing is written to the other PIM.
+    """
+    for (name, _) in model._list_children(path):
+        child = tuple(path) + (name,)
+        yield child
+        for item in walk_pim(model, child):
+            yield item
+
+
+def scan_pim(model, paths=None):
+    """ Yield (parts, data) for each note of another PIM, depth first.
+        paths are those from walk_pim if already listed.  Only the contents
+        of the notes are imported.  Their attachments and history stay
+        behind in the other PIM.
+    """
+    for path in walk_pim(model) if paths is None else paths:
+        try:
+            data = model._read_contents(path)
+        except Error:
+            data = None
+        yield (path, data)
+
+
+def convert_documents(items, log=None):
+    """ Read and convert files to note XML.
+        Takes (parts, file) and yields (parts, data).  Directories, with a
+        file of None, and files that can't be read are yielded with data of
+        None.
+    """
+    for (parts, file) in items:
+        if file is None:
+            yield (parts, None)
+            continue
+
+        try:
+            with io.open(file, "rb") as handle:
+                text = handle.read().decode("utf-8-sig", "replace")
+        except (IOError, OSError) as e:
+            if log:
+                log("{0}: {1}".format(file, e))
+            yield (parts, None)
+            continue
+
+        converter = CONVERTERS[os.path.splitext(file)[1].lower()]
+        yield (parts, converter(text).encode("utf-8"))
+
+
+def assign_paths(model, parent, items):
+    """ Give each imported note an unused path below parent.
+        Takes (parts, data) in depth first order and yields (path, data).
+        A folder, with data of None, only gets the default contents if it
+        is a new note.  Only the notes along the current branch and their
+        siblings are remembered.
+    """
+    # parts -> [path, has contents]
+    targets = {(): [model.get_path(parent or ()), True]}
+    # parts -> set of the paths given to the notes directly below
+    used = {}
+    current = ()
+
+    def new_path(parts):
+        parent_path = targets[parts[:-1]][0]
+        base = make_name(parts[-1])
+        siblings = used.setdefault(parts[:-1], set())
+
+        (path, count) = (parent_path.child(base), 1)
+        while path in siblings or model._get_directory_mtime(path) is not None:
+            count += 1
+            path = parent_path.child("{0} {1}".format(base, count))
+
+        siblings.add(path)
+        targets[parts] = [path, False]
+        return path
+
+    for (parts, data) in items:
+        if parts[:-1] != current:
+            # Forget the notes below branches already finished
+            current = parts[:-1]
+            for key in list(targets):
+                if key and key[:-1] != current[:len(key) - 1]:
+                    del targets[key]
+                    used.pop(key, None)
+
+        for count in range(1, len(parts)):
+            if parts[:count] not in targets:
+                yield (new_path(parts[:count]), DEFAULT_NOTE)
+
+        target = targets.get(parts)
+        if target is None:
+            path = new_path(parts)
+            yield (path, DEFAULT_NOTE if data is None else data)
+        elif data is None:
+            continue
+        elif target[1]:
+            # Two files with the same name
+            path = new_path(parts)
+            yield (path, data)
+        else:
+            path = target[0]
+            yield (path, data)
+
+        if data is not None:
+            targets[parts][1] = True
+
+
+def make_batches(items, size=BATCH_SIZE):
+    """ Group items into lists of at most size. """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def import_notes(pim, source, parent=None, batch_size=BATCH_SIZE):
+    """ Import a directory of text, Markdown and HTML files, or another PIM.
+        The notes are created below the parent note, with names made unique
+        if needed.  Progress is reported through the PIM's progress function
+        after each batch.  Returns the number of notes imported, or None if
+        the import was aborted.  Batches already written are kept.
+    """
+    model = pim.get_model("notes")
+    log = lambda message: pim.call_log_function("error", "import", message)
+
+    if not pim.call_progress_function("Scanning files", 0):
+        return None
+
+    other = None
+    if is_pim_directory(source):
+        # Only read, as the other PIM may be a read only backup
+        other = Pim(source)
+        other_model = other.get_model("notes")
+        paths = list(walk_pim(other_model))
+        total = len(paths)
+        items = scan_pim(other_model, paths)
+    else:
+        total = sum(1 for i in scan_directory(source))
+        items = convert_documents(scan_directory(source), log)
+
+    done = 0
+    try:
+        for batch in make_batches(assign_paths(model, parent, items), batch_size):
+            done += model.write_notes(batch)
+            if not pim.call_progress_function("Importing notes", min(100, done * 100 // max(total, 1))):
+                return None
+    finally:
+        if other is not None:
+            other.close()
+
+    pim.call_progress_function("Importing notes", 100)
+    return done
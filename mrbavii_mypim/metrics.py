@@ -0,0 +1,166 @@
+""" Timing of model operations. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import time
+import functools
+import threading
+
+
+class _NullTimer(object):
+    """ Context manager used when metrics are disabled. """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+
+class Timer(object):
+    """ Context manager that reports the time spent in its block. """
+
+    __slots__ = ("_callback", "_name", "_start")
+
+    def __init__(self, callback, name):
+        self._callback = callback
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._callback(self._name, time.perf_counter() - self._start)
+        return False
+
+
+def timed(name):
+    """ Decorator to time a model method under a given name.
+        The method's object must have a _pim attribute.  When no metrics
+        function is registered with the PIM the cost is one attribute
+        lookup.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            callback = self._pim.get_metrics_function()
+            if callback is None:
+                return fn(self, *args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                callback(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class Histogram(object):
+    """ Latency histogram with power of two buckets in microseconds. """
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+        micro = int(seconds * 1000000)
+        self.buckets[min(micro.bit_length(), self.BUCKETS - 1)] += 1
+
+    def percentile(self, percent):
+        """ Return the upper bound in seconds of the bucket for a percentile. """
+        if not self.count:
+            return 0.0
+
+        target = self.count * percent / 100.0
+        seen = 0
+        for (index, count) in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                # The last bucket also holds everything above it
+                if index == self.BUCKETS - 1:
+                    return self.max
+                return min((1 << index) / 1000000.0, self.max)
+
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": list(self.buckets)
+        }
+
+
+class MetricsCollector(object):
+    """
+    Metrics function that aggregates timings into histograms.
+
+    An instance can be passed directly to Pim.register_metrics_function.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def __call__(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def as_dict(self):
+        """ Return the metrics as a dictionary suitable for JSON. """
+        with self._lock:
+            return dict(
+                (name, histogram.as_dict())
+                for (name, histogram) in self._histograms.items()
+            )
+
+    def format(self):
+        """ Return the metrics as a text table. """
+        lines = ["{0:32} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10} {6:>10}".format(
+            "operation", "count", "total(s)", "mean(ms)", "p50(ms)", "p90(ms)", "max(ms)"
+        )]
+
+        for (name, stats) in sorted(self.as_dict().items()):
+            lines.append("{0:32} {1:8d} {2:10.3f} {3:10.3f} {4:10.3f} {5:10.3f} {6:10.3f}".format(
+                name,
+                stats["count"],
+                stats["total"],
+                stats["mean"] * 1000,
+                stats["p50"] * 1000,
+                stats["p90"] * 1000,
+                stats["max"] * 1000
+            ))
+
+        return "\n".join(lines)
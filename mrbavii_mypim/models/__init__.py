@@ -5,14 +5,31 @@ __copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
 __license__     =   "Apache License 2.0"
 
 
-from .model import Model
+import importlib
 
-# Import others in order for them to be registered.
-from .notes import NotesModel
+from .model import Model
 
 
-# All models
+# All models as (model name, module, class name).  The module of a model is
+# only imported when the model is first used.
 all_models = (
-    NotesModel,
+    ("notes", ".notes", "NotesModel"),
 )
 
+
+def get_model_class(name):
+    """ Import and return the class for a given model name. """
+    for (model_name, module, classname) in all_models:
+        if model_name == name:
+            return getattr(importlib.import_module(module, __name__), classname)
+
+    return None
+
+
+def __getattr__(name):
+    # Allow "from .models import NotesModel" without importing every model
+    for (model_name, module, classname) in all_models:
+        if classname == name:
+            return get_model_class(model_name)
+
+    raise AttributeError(name)
@@ -0,0 +1,167 @@
+""" Content addressed storage of attachments. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import re
+import hashlib
+import threading
+import contextlib
+
+from ..errors import Error
+
+
+class AttachmentStore(object):
+    """
+    Store attachment data once by the hash of its contents.
+
+    Each blob is a file named by its SHA-256 hash, in a sub-directory named
+    by the first two characters of the hash.  Blobs are never modified once
+    written, so they can be shared by any number of notes and hard linked
+    elsewhere.  Blobs no longer referenced by any note are removed by the
+    garbage collector.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    _hash_re = re.compile("^[0-9a-f]{64}$")
+
+    def __init__(self, directory):
+        """ Create the store in a given directory. """
+        self._directory = directory
+
+    def valid_hash(self, hash):
+        """ Determine if a value is a valid blob hash. """
+        return bool(self._hash_re.match(hash))
+
+    def get_file(self, hash):
+        """ Return the file name of a blob. """
+        if not self.valid_hash(hash):
+            raise Error("Invalid attachment hash.")
+
+        return os.path.join(self._directory, hash[:2], hash)
+
+    def exists(self, hash):
+        return os.path.isfile(self.get_file(hash))
+
+    def import_stream(self, handle):
+        """ Store the data read from a binary file object.
+            The data is hashed in chunks while being copied to a temporary
+            file, so a large file is never held in memory.  Returns a tuple
+            of the hash and the size.
+        """
+        if not os.path.isdir(self._directory):
+            try:
+                os.makedirs(self._directory)
+            except (IOError, OSError) as e:
+                raise Error(str(e))
+
+        tmpname = os.path.join(self._directory, ".import.{0}.{1}.tmp".format(
+            os.getpid(), threading.current_thread().ident
+        ))
+
+        hasher = hashlib.sha256()
+        size = 0
+
+        try:
+            with io.open(tmpname, "wb") as output:
+                while True:
+                    chunk = handle.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    hasher.update(chunk)
+                    output.write(chunk)
+                    size += len(chunk)
+
+                output.flush()
+                os.fsync(output.fileno())
+
+            hash = hasher.hexdigest()
+            target = self.get_file(hash)
+
+            if os.path.isfile(target):
+                # Already stored
+                os.unlink(tmpname)
+            else:
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                os.replace(tmpname, target)
+        except (IOError, OSError) as e:
+            try:
+                os.unlink(tmpname)
+            except (IOError, OSError):
+                pass
+            raise Error(str(e))
+
+        return (hash, size)
+
+    def import_file(self, filename):
+        """ Store the contents of a file.  Returns the hash and size. """
+        try:
+            with io.open(filename, "rb") as handle:
+                return self.import_stream(handle)
+        except (IOError, OSError) as e:
+            raise Error(str(e))
+
+    def open(self, hash):
+        """ Open a blob for streaming reads. """
+        try:
+            return io.open(self.get_file(hash), "rb")
+        except (IOError, OSError) as e:
+            raise Error(str(e))
+
+    @contextlib.contextmanager
+    def map(self, hash):
+        """ Context manager giving a read only memory map of a blob. """
+        import mmap
+
+        with self.open(hash) as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                # Empty files can't be mapped
+                yield b""
+                return
+
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+
+    def iter_blobs(self):
+        """ Yield (hash, size) for each stored blob. """
+        if not os.path.isdir(self._directory):
+            return
+
+        with os.scandir(self._directory) as subdirs:
+            for subdir in subdirs:
+                if not subdir.is_dir() or len(subdir.name) != 2:
+                    continue
+
+                with os.scandir(subdir.path) as entries:
+                    for entry in entries:
+                        if self.valid_hash(entry.name):
+                            yield (entry.name, entry.stat().st_size)
+
+    def collect(self, referenced):
+        """ Remove every blob whose hash is not in referenced.
+            Returns the number of blobs and bytes removed.
+        """
+        count = 0
+        size = 0
+        for (hash, blob_size) in list(self.iter_blobs()):
+            if hash in referenced:
+                continue
+
+            try:
+                os.unlink(self.get_file(hash))
+                count += 1
+                size += blob_size
+            except (IOError, OSError):
+                pass
+
+        return (count, size)
@@ -0,0 +1,144 @@
+""" Compression of note contents. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+"""
+Compressed contents format.
+
+A compressed contents file starts with MAGIC followed by one byte naming
+the method, b"z" for zlib or b"x" for lzma, and then the compressed data.
+A NUL can't start a well formed XML document, so a plain file is never
+mistaken for a compressed one and plain and compressed notes can be mixed
+in one store.
+"""
+
+
+import io
+import zlib
+
+from ..errors import Error
+
+
+MAGIC = b"\x00MYPIMZ"
+HEADER_SIZE = len(MAGIC) + 1
+
+CHUNK_SIZE = 64 * 1024
+
+METHODS = {
+    "zlib": b"z",
+    "lzma": b"x",
+}
+
+
+# lzma is only imported once lzma data is met
+_lzma = None
+
+
+def _get_lzma():
+    global _lzma
+    if _lzma is None:
+        import lzma
+        _lzma = lzma
+    return _lzma
+
+
+def _corrupt_errors():
+    """ Return the exceptions the decompressors raise for corrupt data. """
+    return (zlib.error,) if _lzma is None else (zlib.error, _lzma.LZMAError)
+
+
+def _decompressor(method):
+    if method == b"z":
+        return zlib.decompressobj()
+    if method == b"x":
+        return _get_lzma().LZMADecompressor()
+    raise Error("Unknown compression method.")
+
+
+def compress(data, method="zlib"):
+    """ Return bytes compressed with a method from METHODS. """
+    if method == "zlib":
+        body = zlib.compress(data, 6)
+    elif method == "lzma":
+        body = _get_lzma().compress(data, preset=2)
+    else:
+        raise Error("Unknown compression method.")
+
+    return MAGIC + METHODS[method] + body
+
+
+def is_compressed(data):
+    """ Determine if contents start with the compressed header. """
+    return data[:len(MAGIC)] == MAGIC
+
+
+def decompress(data):
+    """ Return the plain contents of possibly compressed bytes. """
+    if not is_compressed(data):
+        return data
+
+    try:
+        decompressor = _decompressor(data[len(MAGIC):HEADER_SIZE])
+        result = decompressor.decompress(data[HEADER_SIZE:])
+    except _corrupt_errors() as e:
+        raise Error("Corrupt compressed note: {0}".format(e))
+
+    if not decompressor.eof:
+        raise Error("Corrupt compressed note: truncated data")
+    return result
+
+
+class _DecompressReader(io.RawIOBase):
+    """ Read the plain contents of a compressed file a chunk at a time. """
+
+    def __init__(self, handle, method):
+        self._handle = handle
+        self._decompressor = _decompressor(method)
+        self._buffer = b""
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._offset >= len(self._buffer):
+            if self._decompressor.eof:
+                return 0
+
+            chunk = self._handle.read(CHUNK_SIZE)
+            if not chunk:
+                raise Error("Corrupt compressed note: truncated data")
+
+            try:
+                self._buffer = self._decompressor.decompress(chunk)
+            except _corrupt_errors() as e:
+                raise Error("Corrupt compressed note: {0}".format(e))
+            self._offset = 0
+
+        size = min(len(buffer), len(self._buffer) - self._offset)
+        buffer[:size] = self._buffer[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._handle.close()
+        io.RawIOBase.close(self)
+
+
+def open_stream(handle):
+    """ Return a binary file object reading the plain contents of a file.
+        handle is a binary file object positioned at the start.  If the
+        file is compressed, the returned object decompresses as it is read,
+        otherwise handle itself is returned.  Closing the result closes
+        handle.
+    """
+    header = handle.read(HEADER_SIZE)
+    if is_compressed(header):
+        return io.BufferedReader(_DecompressReader(handle, header[len(MAGIC):]), CHUNK_SIZE)
+
+    handle.seek(0)
+    return handle
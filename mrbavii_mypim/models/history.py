@@ -0,0 +1,312 @@
+""" Revision history of notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+"""
+History storage format.
+
+The history of a note is kept in its directory so it moves along with the
+note.  Both files are only ever appended to.  When the notes are compacted
+the revisions so far are moved into the pack with the note, and later
+revisions are appended in the directory again, numbered after the packed
+ones.
+
+".history.dat" holds the revisions one after another.  Each is zlib
+compressed, and is either a keyframe holding the full contents, or a delta
+against the previous revision.  Every KEYFRAME_INTERVAL revisions is a
+keyframe, so reading any revision applies at most KEYFRAME_INTERVAL - 1
+deltas.
+
+".history.idx" holds one fixed size record per revision giving the offset
+and length of its data, the size of the contents, the time it was saved and
+whether it is a keyframe.  Revision n starts at byte n times the record size.  The data is
+synced before the record is written, so a crash can only lose the last
+revision.
+
+A delta is a list of operations.  b"C" copies a range of bytes from the
+previous revision, b"I" inserts new bytes.
+
+In a pack, the history of a note is the length of the index, the index and
+then the data, with the offsets of the index records relative to the start
+of the data.
+"""
+
+
+import os
+import io
+import zlib
+import time
+import struct
+import threading
+
+from ..errors import Error
+
+
+_record = struct.Struct("<QIIdB")
+_packed_header = struct.Struct("<Q")
+_copy = struct.Struct("<II")
+_insert = struct.Struct("<I")
+
+KIND_KEYFRAME = 0
+KIND_DELTA = 1
+
+
+def make_delta(old, new):
+    """ Return the operations to turn bytes old into bytes new.
+        Each new line is copied from the line after the last copy if that
+        matches, else from the first old line with the same contents, and
+        the copy runs for as long as the lines keep matching.  This takes
+        time linear in the size of the notes.  It may not find the smallest
+        delta, but edits to a note mostly keep the lines around them in
+        order, which it handles well.
+    """
+    old_lines = old.splitlines(True)
+    new_lines = new.splitlines(True)
+
+    # Offset of the start of each old line, and the first old line with
+    # each contents
+    offsets = [0]
+    first = {}
+    for (index, line) in enumerate(old_lines):
+        offsets.append(offsets[-1] + len(line))
+        first.setdefault(line, index)
+
+    parts = []
+    inserted = []
+    (count, new_count) = (len(old_lines), len(new_lines))
+    i = j = 0
+    while j < new_count:
+        line = new_lines[j]
+        if not (i < count and old_lines[i] == line):
+            if line not in first:
+                inserted.append(line)
+                j += 1
+                continue
+            i = first[line]
+
+        start = i
+        while i < count and j < new_count and old_lines[i] == new_lines[j]:
+            i += 1
+            j += 1
+
+        if inserted:
+            data = b"".join(inserted)
+            parts.append(b"I" + _insert.pack(len(data)) + data)
+            inserted = []
+        parts.append(b"C" + _copy.pack(offsets[start], offsets[i] - offsets[start]))
+
+    if inserted:
+        data = b"".join(inserted)
+        parts.append(b"I" + _insert.pack(len(data)) + data)
+
+    return b"".join(parts)
+
+
+def apply_delta(old, delta):
+    """ Apply operations from make_delta to bytes old. """
+    parts = []
+    pos = 0
+    while pos < len(delta):
+        op = delta[pos:pos + 1]
+        pos += 1
+        if op == b"C":
+            (start, length) = _copy.unpack_from(delta, pos)
+            pos += _copy.size
+            parts.append(old[start:start + length])
+        elif op == b"I":
+            (length,) = _insert.unpack_from(delta, pos)
+            pos += _insert.size
+            parts.append(delta[pos:pos + length])
+            pos += length
+        else:
+            raise Error("Corrupt note history.")
+
+    return b"".join(parts)
+
+
+class NoteHistory(object):
+    """ Record and read the revisions of notes. """
+
+    DATA_FILENAME = ".history.dat"
+    INDEX_FILENAME = ".history.idx"
+    KEYFRAME_INTERVAL = 128
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _files(self, directory):
+        return (
+            os.path.join(directory, self.DATA_FILENAME),
+            os.path.join(directory, self.INDEX_FILENAME)
+        )
+
+    def _read_records(self, directory, packed=None):
+        """ Return a list of (offset, length, size, time, kind, data) records.
+            packed is the history of the note from the pack, if any, and its
+            revisions come first.  data is the packed data a revision is in,
+            or None for a revision in the note directory.
+        """
+        records = []
+        if packed:
+            packed = memoryview(packed)
+            (length,) = _packed_header.unpack_from(packed, 0)
+            start = _packed_header.size + length
+            for i in range(length // _record.size):
+                records.append(_record.unpack_from(packed, _packed_header.size + i * _record.size) + (packed[start:],))
+
+        (_, index_file) = self._files(directory)
+        try:
+            with io.open(index_file, "rb") as handle:
+                data = handle.read()
+        except (IOError, OSError):
+            return records
+
+        # Ignore a record only partly written
+        count = len(data) // _record.size
+        records.extend(_record.unpack_from(data, i * _record.size) + (None,) for i in range(count))
+        return records
+
+    def _read_data(self, directory, records):
+        """ Yield the compressed data of each of the records. """
+        (data_file, _) = self._files(directory)
+        handle = None
+        try:
+            for (offset, length, size, mtime, kind, packed) in records:
+                if packed is not None:
+                    yield packed[offset:offset + length]
+                    continue
+
+                if handle is None:
+                    handle = io.open(data_file, "rb")
+                handle.seek(offset)
+                yield handle.read(length)
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def _read_revision(self, directory, records, revision):
+        """ Rebuild a revision from its keyframe and the deltas after it. """
+        keyframe = revision - revision % self.KEYFRAME_INTERVAL
+        selected = records[keyframe:revision + 1]
+
+        try:
+            contents = None
+            for (record, chunk) in zip(selected, self._read_data(directory, selected)):
+                (offset, length, size, mtime, kind, packed) = record
+                data = zlib.decompress(chunk)
+                if kind == KIND_KEYFRAME:
+                    contents = data
+                else:
+                    contents = apply_delta(contents, data)
+
+                if len(contents) != size:
+                    raise Error("Corrupt note history.")
+        except (IOError, OSError, zlib.error, struct.error, TypeError) as e:
+            raise Error("Corrupt note history: {0}".format(e))
+
+        return contents
+
+    def record(self, directory, contents, packed=None):
+        """ Add a revision with the given bytes to a note's history.
+            packed is the history of the note from the pack, if any.
+            Nothing is recorded if they match the latest revision.  Returns
+            the revision number, or None if nothing was recorded.
+        """
+        with self._lock:
+            records = self._read_records(directory, packed)
+            revision = len(records)
+            loose = sum(1 for record in records if record[5] is None)
+
+            if revision % self.KEYFRAME_INTERVAL == 0:
+                kind = KIND_KEYFRAME
+                if records and self._read_revision(directory, records, revision - 1) == contents:
+                    return None
+                data = contents
+            else:
+                kind = KIND_DELTA
+                previous = self._read_revision(directory, records, revision - 1)
+                if previous == contents:
+                    return None
+                data = make_delta(previous, contents)
+
+            data = zlib.compress(data)
+            (data_file, index_file) = self._files(directory)
+
+            try:
+                with io.open(data_file, "ab") as handle:
+                    offset = handle.seek(0, os.SEEK_END)
+                    handle.write(data)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+
+                with io.open(index_file, "ab") as handle:
+                    # Drop a partial record left by a crash
+                    end = handle.seek(0, os.SEEK_END)
+                    if end != loose * _record.size:
+                        handle.truncate(loose * _record.size)
+                    handle.write(_record.pack(offset, len(data), len(contents), time.time(), kind))
+                    handle.flush()
+                    os.fsync(handle.fileno())
+            except (IOError, OSError) as e:
+                raise Error(str(e))
+
+            return revision
+
+    def get_revisions(self, directory, packed=None):
+        """ Return a list of (revision, time, size) for a note, oldest first. """
+        with self._lock:
+            records = self._read_records(directory, packed)
+
+        return [
+            (revision, record[3], record[2])
+            for (revision, record) in enumerate(records)
+        ]
+
+    def read(self, directory, revision, packed=None):
+        """ Return the bytes of a revision of a note. """
+        with self._lock:
+            records = self._read_records(directory, packed)
+            if revision < 0:
+                revision += len(records)
+            if not 0 <= revision < len(records):
+                raise Error("No such revision.")
+
+            return self._read_revision(directory, records, revision)
+
+    def pack(self, directory, packed=None):
+        """ Return the whole history of a note to be stored in a pack.
+            packed is the history of the note from the current pack, if any.
+            Returns None if the note has no revisions.
+        """
+        with self._lock:
+            records = self._read_records(directory, packed)
+            if not records:
+                return None
+
+            index = []
+            data = []
+            offset = 0
+            try:
+                for (record, chunk) in zip(records, self._read_data(directory, records)):
+                    if len(chunk) != record[1]:
+                        raise Error("Corrupt note history.")
+                    index.append(_record.pack(offset, record[1], record[2], record[3], record[4]))
+                    data.append(bytes(chunk))
+                    offset += record[1]
+            except (IOError, OSError) as e:
+                raise Error("Corrupt note history: {0}".format(e))
+
+        index = b"".join(index)
+        return _packed_header.pack(len(index)) + index + b"".join(data)
+
+    def remove_files(self, directory):
+        """ Remove the history files of a note once they are packed. """
+        with self._lock:
+            for filename in self._files(directory):
+                try:
+                    os.unlink(filename)
+                except (IOError, OSError):
+                    pass
@@ -16,6 +16,9 @@ class Model(object):
     def open(self):
         pass
 
+    def close(self):
+        pass
+
     def isok(self):
         return False
 
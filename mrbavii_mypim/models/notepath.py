@@ -0,0 +1,171 @@
+""" Interned note paths. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import threading
+import weakref
+
+from ..errors import Error
+
+
+class NotePath(object):
+    """
+    An immutable, validated path to a note.
+
+    Instances are only created by a NotePathTable, which guarantees there is
+    only one instance for each path at a time.  A NotePath compares and hashes
+    equal to the tuple of its names, so it can be used anywhere a tuple path
+    was used before.  The directory and file of the note are computed once.
+    """
+
+    __slots__ = ("_parts", "_hash", "_table", "_directory", "_file", "__weakref__")
+
+    def __init__(self, table, parts):
+        self._table = table
+        self._parts = parts
+        self._hash = hash(parts)
+        self._directory = None
+        self._file = None
+
+    @property
+    def parts(self):
+        """ The names of the path as a tuple. """
+        return self._parts
+
+    @property
+    def name(self):
+        """ The last name of the path, or None for the root. """
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def key(self):
+        """ The names joined with "/". """
+        return "/".join(self._parts)
+
+    @property
+    def parent(self):
+        """ The path of the parent, or None for the root. """
+        if not self._parts:
+            return None
+        return self._table._get(self._parts[:-1])
+
+    def child(self, name):
+        """ Return the path of a child note, validating only the new name. """
+        return self._table.get(self._parts + (name,), 1)
+
+    @property
+    def directory(self):
+        """ The directory of the note. """
+        if self._directory is None:
+            self._directory = os.path.join(
+                self._table._directory,
+                *[i.replace(" ", "_") for i in self._parts]
+            )
+        return self._directory
+
+    @property
+    def file(self):
+        """ The contents file of the note. """
+        if self._file is None:
+            self._file = os.path.join(self.directory, self._table._filename)
+        return self._file
+
+    def __len__(self):
+        return len(self._parts)
+
+    def __iter__(self):
+        return iter(self._parts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # Any prefix of a valid path is valid
+            return self._table._get(self._parts[index])
+        return self._parts[index]
+
+    def __add__(self, other):
+        return self._parts + tuple(other)
+
+    def __radd__(self, other):
+        return tuple(other) + self._parts
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, NotePath):
+            return self._parts == other._parts
+        if isinstance(other, tuple):
+            return self._parts == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __lt__(self, other):
+        return self._parts < tuple(other)
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # Sent to other processes as a plain tuple
+        return (tuple, (self._parts,))
+
+    def __repr__(self):
+        return "NotePath({0!r})".format(self._parts)
+
+
+class NotePathTable(object):
+    """ Create and intern the NotePath objects for one notes directory. """
+
+    def __init__(self, directory, filename, valid_name):
+        self._directory = directory
+        self._filename = filename
+        self._valid_name = valid_name
+        self._paths = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, path, check=None):
+        """ Return the interned NotePath for a path.
+            The path may be a NotePath, tuple or list.  Only the last check
+            names are validated, or all of them if check is None.
+        """
+        if isinstance(path, NotePath) and path._table is self:
+            return path
+
+        if not isinstance(path, (list, tuple, NotePath)):
+            raise Error("Invalid note path.")
+
+        parts = tuple(path)
+        with self._lock:
+            result = self._paths.get(parts)
+            if result is not None:
+                return result
+
+        names = parts if check is None else parts[len(parts) - check:]
+        for name in names:
+            if not isinstance(name, str) or not self._valid_name(name):
+                raise Error("Invalid note path.")
+
+        return self._get(parts)
+
+    def get_key(self, key):
+        """ Return the NotePath of a key from the index.
+            Keys are built from names already checked, so aren't validated.
+        """
+        return self._get(tuple(key.split("/")) if key else ())
+
+    def _get(self, parts):
+        with self._lock:
+            result = self._paths.get(parts)
+            if result is None:
+                result = self._paths[parts] = NotePath(self, parts)
+            return result
+
+    def owns(self, path):
+        """ Determine if a NotePath was created by this table. """
+        return isinstance(path, NotePath) and path._table is self
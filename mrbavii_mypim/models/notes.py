@@ -19,23 +19,87 @@ that directory as all attachments and sub-notes are part of the directory.
 import os
 import re
 import io
-
-try:
-    from xml.etree import cElementTree as ET
-except ImportError:
-    from xml.etree import ElemenetTree as ET
-
-from mrbaviirc import template
-from mrbaviirc.template.lib.xml import ElementTreeWrapper
+import sys
+import json
+import time
+import threading
 
 from .. import util
 from .model import Model
 from ..errors import Error
+from ..cache import RenderCache, MemoryCache
+from ..metrics import timed
+from .notesindex import NotesIndex
+from .notessearch import NotesSearch
+from .noteslinks import NotesLinks, rewrite_links
+from .savequeue import SaveQueue
+from .attachments import AttachmentStore
+from .notepath import NotePathTable
+from .history import NoteHistory
+from .notespack import NotesPack, PackStat, write_pack
+from . import compression
+
+
+class _Aborted(Exception):
+    """ Raised inside a long operation when the progress function aborts. """
+    pass
+
+
+class _CachedNote(object):
+    """ The contents of a note kept in the memory cache.
+        Each form is only made when it is first needed.
+    """
+
+    __slots__ = ("key", "stamp", "data", "text", "root", "tree_size", "html", "fingerprint", "digest")
+
+    # Rough memory used by each parsed element beyond its text
+    ELEMENT_SIZE = 120
+
+    def __init__(self, key, stamp):
+        self.key = key
+        self.stamp = stamp
+        self.data = None
+        self.text = None
+        self.root = None
+        self.tree_size = 0
+        self.html = None
+        self.fingerprint = None
+        self.digest = None
+
+    def set_root(self, root):
+        """ Keep the parsed contents and estimate their size. """
+        size = 0
+        for element in root.iter():
+            size += self.ELEMENT_SIZE + len(element.text or "") + len(element.tail or "")
+
+        (self.root, self.tree_size) = (root, size)
+
+    def get_size(self):
+        """ Return the approximate memory used by the entry. """
+        size = 256
+        if self.data is not None:
+            size += sys.getsizeof(self.data)
+        if self.text is not None:
+            size += sys.getsizeof(self.text)
+        if self.root is not None:
+            size += self.tree_size
+        if self.html is not None:
+            size += sys.getsizeof(self.html)
+        return size
+
 
 class NotesModel(Model):
     """ Represent a tree of notes. """
     MODEL_NAME="notes"
     NOTE_FILENAME="contents.note"
+    TRASH_DIRNAME=".trash"
+    ATTACHMENTS_FILENAME=".attachments.json"
+    PACK_FILENAME="notes.pack"
+    PACK_DELETED_FILENAME="notes.pack.deleted"
+    MEMORY_CACHE_BUDGET=32 * 1024 * 1024
+    TREE_STATE_FILENAME="treestate.json"
+    COMPRESSION_FILENAME="compression.json"
+    TREE_STATE_VERSION=1
 
     # Valid name regex uses a literal space character to match a space but
     # not tabs/newlines.
@@ -52,6 +116,32 @@ class NotesModel(Model):
             except (IOError, OSError) as e:
                 raise Error(str(e))
 
+        self._paths = NotePathTable(self._directory, self.NOTE_FILENAME, self.valid_name)
+
+        self._pack_file = os.path.join(pim.get_directory(), self.PACK_FILENAME)
+        self._pack_deleted_file = os.path.join(pim.get_directory(), self.PACK_DELETED_FILENAME)
+        self._pack_lock = threading.RLock()
+        self._open_pack()
+
+        self._render_cache = RenderCache(
+            os.path.join(pim.get_cache_directory(self), "html")
+        )
+        self._memory = MemoryCache(self.MEMORY_CACHE_BUDGET)
+        self._index = NotesIndex(self, lambda: pim.open_database(self, "index"))
+        self._search = NotesSearch(self, lambda: pim.open_database(self, "search"))
+        self._links = NotesLinks(self, lambda: pim.open_database(self, "links"))
+        self._saves = SaveQueue(
+            self.write_note,
+            stamp_fn=self._contents_stamp,
+            error_fn=self._save_failed
+        )
+        self._attachments = AttachmentStore(
+            os.path.join(pim.get_directory(), "attachments")
+        )
+        self._attachments_lock = threading.Lock()
+        self._history = NoteHistory()
+        self._compression = self._read_compression_settings()
+
     def valid_name(self, name):
         """ Determine if a name is valid. """
         # A name may consist of alphanumeric characters and spaces.
@@ -63,10 +153,16 @@ class NotesModel(Model):
 
     def valid_path(self, path):
         """ Return if a path is valid. """
+        if self._paths.owns(path):
+            return True
         return isinstance(path, (list, tuple)) and all(self.valid_name(i) for i in path)
 
+    def get_path(self, path):
+        """ Return the interned NotePath for a NotePath, tuple or list. """
+        return self._paths.get(path)
+
     def _path_to_file(self, path):
-        return os.path.join(i.replace(" ", "_") for i in path)
+        return [i.replace(" ", "_") for i in path]
 
     def _file_to_path_part(self, file):
         return file.replace("_", " ")
@@ -75,52 +171,693 @@ class NotesModel(Model):
         if path is None:
             return (self._directory, None)
         else:
-            if not self.valid_path(path):
-                raise Error("Invalid note path.")
+            path = self._paths.get(path)
+            return (path.directory, path.file)
+
+    @timed("notes.list")
+    def get_children(self, path=None, offset=0, limit=None):
+        """" Return a list of full paths for each note under the parent.
+            Notes are sorted by name.  If limit is not None only that many
+            notes starting at offset are returned.
+        """
+        return self._index.get_children(path, offset, limit)
+
+    @timed("notes.list_info")
+    def get_children_info(self, path=None, offset=0, limit=None):
+        """ Return (path, has_children, mtime, size) for each note under the parent.
+            This answers everything needed to display a level of the tree
+            without listing each child's directory.  Paging is the same as
+            for get_children.
+        """
+        return self._index.get_children_info(path, offset, limit)
+
+    def count_children(self, path=None):
+        """ Return the number of notes under the parent. """
+        return self._index.count_children(path)
+
+    def walk_notes(self, path=None):
+        """ Yield the path of every note below a parent, depth first. """
+        for child in self.get_children(path):
+            yield child
+            for subchild in self.walk_notes(child):
+                yield subchild
+
+    def save_tree_state(self, expanded, selected=None, limit=None):
+        """ Save the state of a tree view of the notes.
+            expanded is a list of the paths of expanded notes, each with all
+            of its parents expanded, and selected is the selected path or
+            None.  The first limit children of the top level and of each
+            expanded note are saved along with it, so the tree can be shown
+            again without listing any directories.
+        """
+        keys = [""] + ["/".join(path) for path in expanded]
+        listings = {}
+        for key in keys:
+            path = self._paths.get_key(key) if key else None
+            listings[key] = [
+                [child[-1], has_children, mtime, size]
+                for (child, has_children, mtime, size) in self.get_children_info(path, 0, limit)
+            ]
+
+        state = {
+            "version": self.TREE_STATE_VERSION,
+            "limit": limit,
+            "expanded": keys[1:],
+            "selected": "/".join(selected) if selected else None,
+            "listings": listings
+        }
+
+        directory = self._pim.get_cache_directory(self)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        except (IOError, OSError) as e:
+            raise Error(str(e))
+
+        self._write_file(os.path.join(directory, self.TREE_STATE_FILENAME), json.dumps(state))
+
+    def load_tree_state(self):
+        """ Return the tree state saved by save_tree_state or None.
+            The result is (expanded, selected, listings, limit) where
+            listings maps the key of the top level, "", and of each expanded
+            note to the saved result of get_children_info.  The listings may
+            be out of date, see check_tree_state.
+        """
+        filename = os.path.join(self._pim.get_cache_directory(self), self.TREE_STATE_FILENAME)
+        try:
+            with io.open(filename, "rt", encoding="utf-8") as handle:
+                state = json.load(handle)
+
+            if state.get("version") != self.TREE_STATE_VERSION:
+                return None
+
+            # The file is outside the notes, so check every name in it
+            def get_path(key):
+                try:
+                    return self._paths.get(key.split("/"))
+                except Error:
+                    return None
+
+            listings = {}
+            for (key, children) in state["listings"].items():
+                if key and get_path(key) is None:
+                    continue
+
+                prefix = key + "/" if key else ""
+                listing = listings[key] = []
+                for (name, has_children, mtime, size) in children:
+                    path = get_path(prefix + name)
+                    if path is not None:
+                        listing.append((path, bool(has_children), mtime, size))
+
+            expanded = [i for i in (get_path(key) for key in state["expanded"]) if i is not None]
+            selected = get_path(state["selected"]) if state["selected"] else None
+            return (expanded, selected, listings, state["limit"])
+        except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    @timed("notes.check_tree_state")
+    def check_tree_state(self, listings, limit=None):
+        """ Return the keys of the saved listings that no longer match.
+            Only the names and whether each child has children are compared.
+            The index revalidates each listing against the directory mtime,
+            so this is cheap unless something changed.
+        """
+        changed = []
+        for (key, children) in listings.items():
+            path = self._paths.get_key(key) if key else None
+            current = self.get_children_info(path, 0, limit)
+            if [(i[0], i[1]) for i in current] != [(i[0], i[1]) for i in children]:
+                changed.append(key)
+
+        return changed
+
+    def path_to_link(self, path):
+        """ Return the link used to refer to a note in HTML. """
+        return "note:" + "/".join(path)
 
-            directory = os.path.join(self._directory, *(self._path_to_file(path)))
-            file = os.path.join(directory, self.NOTE_FILENAME)
+    def link_to_path(self, link):
+        """ Return the note path of a link, or None if it isn't a note link. """
+        if not link.startswith("note:"):
+            return None
 
-            return (directory, file)
+        path = tuple(i for i in link[5:].split("/") if i)
+        return self._paths.get(path) if path and self.valid_path(path) else None
 
-    def get_children(self, path=None):
-        """" Return a list of full paths for each note under the parent. """
+    def _scan_directory(self, directory):
+        """ Return a sorted list of (name, entry) for each note directory. """
         results = []
-        found = []
+        found = set()
 
-        (directory, _) = self._get_note_dir_file(path)
-        if not os.path.isdir(directory):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda i: i.name)
+        except (IOError, OSError):
             return results
 
-        for file in sorted(os.listdir(directory)):
+        for entry in entries:
+            file = entry.name
             if file.startswith("."):
                 continue
 
-            fullfile = os.path.join(directory, file)
-            if os.path.islink(fullfile) or not os.path.isdir(fullfile):
+            if entry.is_symlink() or not entry.is_dir():
                 continue
 
             name = self._file_to_path_part(file)
             if name in found or not self.valid_name(name):
                 continue
 
-            # Append the tuple of the path to the results
-            results.append(tuple(path) + (name,) if path else (name,))
-            found.append(name)
+            results.append((name, entry))
+            found.add(name)
 
         return results
 
+    def _has_children(self, directory):
+        """ Determine if a note directory has any sub-notes. """
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or entry.is_symlink() or not entry.is_dir():
+                        continue
+
+                    if self.valid_name(self._file_to_path_part(entry.name)):
+                        return True
+        except (IOError, OSError):
+            pass
+
+        return False
+
+    def _open_pack(self):
+        """ Open the pack file and replay the changes made to it since.
+            Moves and deletes are recorded as lines of the changes file
+            rather than copying notes out of the pack.  A line is either
+            "D", TAB, key for a note hidden with everything below it, or "M",
+            TAB, old key, TAB, new key for a move.  A line with only a key
+            is a delete written by earlier versions.
+        """
+        self._pack = None
+        self._pack_changes = {}
+
+        if not os.path.isfile(self._pack_file):
+            return
+
+        self._pack = NotesPack(self._pack_file)
+        try:
+            with io.open(self._pack_deleted_file, "rt", encoding="utf-8") as handle:
+                for line in handle:
+                    self._apply_pack_change(line.rstrip("\n").split("\t"))
+        except (IOError, OSError):
+            pass
+
+    def _pack_key(self, path):
+        """ Return the key in the pack a note is read from.
+            The changes map a key, and everything below it, to a key in the
+            pack, or to None if hidden, and the longest one that applies is
+            used.  Returns None if the note is hidden.
+        """
+        changes = self._pack_changes
+        if changes:
+            prefixes = []
+            for name in path:
+                prefixes.append(name if not prefixes else prefixes[-1] + "/" + name)
+
+            for (count, prefix) in reversed(list(enumerate(prefixes, 1))):
+                if prefix in changes:
+                    target = changes[prefix]
+                    if target is None:
+                        return None
+                    return "/".join((target,) + tuple(path[count:]))
+
+        return "/".join(path)
+
+    def _pack_hides(self, key):
+        """ Return if a note seen in the pack under its parent is hidden.
+            The parent itself must not be hidden.
+        """
+        return key in self._pack_changes and self._pack_changes[key] is None
+
+    def _get_packed(self, path):
+        """ Return (pack, index) of a note in the pack.
+            Returns None if the note isn't in the pack or was deleted from it.
+        """
+        pack = self._pack
+        if pack is None or not path:
+            return None
+
+        key = self._pack_key(path)
+        if key is None:
+            return None
+
+        index = pack.find(key)
+        return None if index is None else (pack, index)
+
+    def _iter_packed(self):
+        """ Yield (key, index) of each note in the pack that isn't hidden.
+            The key is where the note is now after the recorded moves.
+        """
+        pack = self._pack
+        if pack is None:
+            return
+
+        changes = self._pack_changes
+        stack = [("", None)]
+        for (key, target) in changes.items():
+            index = None if target is None else pack.find(target)
+            if index is not None:
+                stack.append((key, index))
+
+        while stack:
+            (key, index) = stack.pop()
+            if index is not None:
+                yield (key, index)
+
+            for child in pack.get_children(index):
+                name = pack.get_name(child)
+                child_key = key + "/" + name if key else name
+                # Changed notes are reached from their own entry
+                if child_key not in changes:
+                    stack.append((child_key, child))
+
+    def _apply_pack_change(self, fields):
+        """ Apply a line of the pack changes file split at tabs. """
+        changes = self._pack_changes
+        if fields[0] == "M" and len(fields) == 3:
+            (old_key, new_key) = fields[1:]
+            target = self._pack_key(old_key.split("/"))
+            if target is not None and self._pack.find(target) is None:
+                target = None
+
+            moved = [
+                (new_key + key[len(old_key):], value)
+                for (key, value) in changes.items()
+                if key.startswith(old_key + "/")
+            ]
+
+            self._drop_pack_changes(old_key)
+            self._drop_pack_changes(new_key)
+            changes[old_key] = None
+            changes[new_key] = target
+            changes.update(moved)
+        elif (fields[0] == "D" and len(fields) == 2) or len(fields) == 1:
+            key = fields[-1]
+            if key:
+                self._drop_pack_changes(key)
+                changes[key] = None
+
+    def _drop_pack_changes(self, key):
+        """ Forget the changes of a note and everything below it. """
+        changes = self._pack_changes
+        for change in [i for i in changes if i == key or i.startswith(key + "/")]:
+            del changes[change]
+
+    def _record_pack_change(self, *fields):
+        """ Append a change to the pack changes file and apply it. """
+        if self._pack is None:
+            return
+
+        try:
+            with io.open(self._pack_deleted_file, "at", encoding="utf-8") as handle:
+                handle.write("\t".join(fields) + "\n")
+                handle.flush()
+                os.fsync(handle.fileno())
+        except (IOError, OSError) as e:
+            raise Error(str(e))
+
+        self._apply_pack_change(list(fields))
+
+    def _get_packed_history(self, path):
+        """ Return the revision history of a note from the pack, or None. """
+        packed = self._get_packed(path)
+        return None if packed is None else packed[0].read_history(packed[1])
+
+    def _get_directory_mtime(self, path):
+        """ Return the modification time of a note directory.
+            For a note only in the pack this is the time of the pack.
+            Returns None if the note doesn't exist.
+        """
+        (directory, _) = self._get_note_dir_file(path)
+        try:
+            return os.stat(directory).st_mtime
+        except (IOError, OSError):
+            packed = self._get_packed(path)
+            return None if packed is None else packed[0].get_mtime()
+
+    def _ensure_directory(self, path):
+        """ Create the directory of a note that is only in the pack. """
+        (directory, _) = self._get_note_dir_file(path)
+        if os.path.isdir(directory):
+            return directory
+
+        if self._get_packed(path) is None:
+            raise Error("No such note")
+
+        try:
+            os.makedirs(directory)
+        except (IOError, OSError) as e:
+            raise Error(str(e))
+
+        return directory
+
+    def _list_children(self, path):
+        """ Return a sorted list of (name, mtime) of the children of a note.
+            This merges the note directory with the pack.  The mtime is that
+            of the child's directory, or of the pack if it only is there.
+        """
+        path = self._paths.get(path or ())
+        children = {}
+
+        for (name, entry) in self._scan_directory(path.directory):
+            try:
+                children[name] = entry.stat().st_mtime
+            except (IOError, OSError):
+                pass
+
+        packed = (self._pack, None) if not path else self._get_packed(path)
+        if packed is not None and packed[0] is not None:
+            (pack, index) = packed
+            prefix = "/".join(path) + "/" if path else ""
+            for child in pack.get_children(index):
+                name = pack.get_name(child)
+                if name in children:
+                    continue
+
+                if self._pack_hides(prefix + name):
+                    continue
+
+                children[name] = pack.get_mtime()
+
+        return sorted(children.items())
+
+    def _get_note_info(self, path):
+        """ Return (has_children, note_mtime, note_size) of a note. """
+        (directory, file) = self._get_note_dir_file(path)
+        packed = self._get_packed(path)
+
+        has_children = self._has_children(directory)
+        if not has_children and packed is not None:
+            (pack, index) = packed
+            prefix = "/".join(path) + "/"
+            has_children = any(
+                not self._pack_hides(prefix + pack.get_name(child))
+                for child in pack.get_children(index)
+            )
+
+        try:
+            stat = os.stat(file)
+            return (has_children, stat.st_mtime, stat.st_size)
+        except (IOError, OSError):
+            pass
+
+        if packed is not None:
+            (has_contents, mtime, size) = packed[0].get_info(packed[1])
+            if has_contents:
+                return (has_children, mtime, size)
+
+        return (has_children, None, None)
+
+    def _stat_contents(self, path):
+        """ Return (file, stat) for the contents of a note.
+            For a note in the pack, file is only a name to use as a key and
+            stat is a PackStat.  Returns (None, None) if the note has no
+            contents.
+        """
+        (_, file) = self._get_note_dir_file(path)
+        try:
+            return (file, os.stat(file))
+        except (IOError, OSError):
+            pass
+
+        packed = self._get_packed(path)
+        if packed is not None:
+            (pack, index) = packed
+            (has_contents, mtime, size) = pack.get_info(index)
+            if has_contents:
+                return ("{0}#{1}".format(pack.get_filename(), "/".join(path)), PackStat(mtime, size))
+
+        return (None, None)
+
+    def _open_contents(self, path):
+        """ Open the contents of a note from its file or the pack.
+            Returns a binary file object that decompresses the contents as
+            they are read if they are stored compressed.
+        """
+        (_, file) = self._get_note_dir_file(path)
+        try:
+            return compression.open_stream(io.open(file, "rb"))
+        except (IOError, OSError) as e:
+            packed = self._get_packed(path)
+            if packed is None:
+                raise Error(str(e))
+
+        (pack, index) = packed
+        return io.BytesIO(pack.read(index))
+
+    @timed("notes.read_file")
+    def _read_contents(self, path):
+        """ Return the contents of a note from its file or the pack. """
+        with self._open_contents(path) as handle:
+            try:
+                return handle.read()
+            except (IOError, OSError) as e:
+                raise Error(str(e))
+
+    def _encode_contents(self, contents):
+        """ Return note contents, as str or bytes, the way they are stored.
+            Contents at least as large as the compression threshold are
+            compressed.
+        """
+        (threshold, method) = self._compression
+        if threshold is None:
+            return contents
+
+        data = contents if isinstance(contents, bytes) else contents.encode("utf-8")
+        if len(data) < threshold:
+            return contents
+        return compression.compress(data, method)
+
+    @timed("notes.compact")
+    def compact(self):
+        """ Merge every note into a new pack file.
+            The contents and revision history of each note are moved from the
+            notes directory into the pack, and note directories left empty
+            are removed.  Reports through the PIM's progress function.
+            Returns False if aborted.
+        """
+        pim = self._pim
+        self._saves.flush()
+
+        with self._pack_lock:
+            if not pim.call_progress_function("Scanning notes", 0):
+                return False
+
+            paths = list(self.walk_notes())
+            total = len(paths)
+            loose = []
+            histories = []
+
+            def notes():
+                for (count, path) in enumerate(paths):
+                    if count % 500 == 0 and not pim.call_progress_function("Packing notes", count * 100 // total):
+                        raise _Aborted()
+
+                    (directory, _) = self._get_note_dir_file(path)
+                    try:
+                        history = self._history.pack(directory, self._get_packed_history(path))
+                    except Error as e:
+                        raise Error("{0}: {1}".format("/".join(path), e))
+                    if history is not None:
+                        histories.append(directory)
+
+                    (file, stat) = self._stat_contents(path)
+                    if stat is None:
+                        yield ("/".join(path), None, None, history)
+                        continue
+
+                    data = self._read_contents(path)
+                    if not isinstance(stat, PackStat):
+                        loose.append((file, stat))
+                    yield ("/".join(path), stat.st_mtime, data, history)
+
+            try:
+                write_pack(self._pack_file, notes())
+            except _Aborted:
+                return False
+
+            try:
+                os.unlink(self._pack_deleted_file)
+            except (IOError, OSError):
+                pass
+
+            if self._pack is not None:
+                self._pack.close()
+            self._open_pack()
+
+            # History is only written with the pack lock held
+            for directory in histories:
+                self._history.remove_files(directory)
+
+            # Remove the files now in the pack unless changed since read
+            for (file, stat) in loose:
+                try:
+                    current = os.stat(file)
+                    if (current.st_ino, current.st_mtime, current.st_size) == (stat.st_ino, stat.st_mtime, stat.st_size):
+                        os.unlink(file)
+                except (IOError, OSError):
+                    pass
+
+            trash = os.path.join(self._directory, self.TRASH_DIRNAME)
+            for (dirpath, dirnames, filenames) in os.walk(self._directory, topdown=False):
+                if dirpath == self._directory or dirpath == trash or dirpath.startswith(trash + os.sep):
+                    continue
+
+                try:
+                    os.rmdir(dirpath)
+                except (IOError, OSError):
+                    pass
+
+            self._index.clear()
+
+        pim.call_progress_function("Packing notes", 100)
+        return True
+
     def get_attachments(self, path, attachment=None):
         """ Return the attachment directory for a given note. """
         (directory, file) = self._get_note_dir_file(path)
         return directory
 
+    def get_attachment_files(self, path):
+        """ Return a list of (name, file) for each attachment of a note.
+            This includes attachments in the attachment store as well as
+            plain files placed in the note directory.
+        """
+        (directory, _) = self._get_note_dir_file(path)
+        results = dict(
+            (name, self._attachments.get_file(info["hash"]))
+            for (name, info) in self._read_attachment_refs(directory).items()
+        )
+
+        try:
+            entries = list(os.scandir(directory))
+        except (IOError, OSError):
+            entries = []
+
+        for entry in entries:
+            if entry.name.startswith(".") or entry.name == self.NOTE_FILENAME:
+                continue
+
+            if entry.is_file() and entry.name not in results:
+                results[entry.name] = entry.path
+
+        return sorted(results.items())
+
+    def _read_attachment_refs(self, directory):
+        try:
+            with io.open(os.path.join(directory, self.ATTACHMENTS_FILENAME), "rt", encoding="utf-8") as handle:
+                return json.load(handle)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write_attachment_refs(self, directory, refs):
+        self._write_file(
+            os.path.join(directory, self.ATTACHMENTS_FILENAME),
+            json.dumps(refs, indent=1, sort_keys=True)
+        )
+
+    def _valid_attachment_name(self, name):
+        return (
+            name and not name.startswith(".") and name != self.NOTE_FILENAME and
+            os.path.basename(name) == name and "/" not in name and "\\" not in name
+        )
+
+    def list_attachments(self, path):
+        """ Return a list of (name, hash, size) for each stored attachment. """
+        (directory, _) = self._get_note_dir_file(path)
+        refs = self._read_attachment_refs(directory)
+        return [(name, refs[name]["hash"], refs[name]["size"]) for name in sorted(refs)]
+
+    @timed("notes.attach")
+    def add_attachment(self, path, source, name=None):
+        """ Attach a file or binary file object to a note.
+            The data is stored once in the attachment store no matter how
+            many notes it is attached to.  Returns the hash of the data.
+        """
+        if name is None:
+            if not isinstance(source, str):
+                raise Error("An attachment name is required.")
+            name = os.path.basename(source)
+
+        if not self._valid_attachment_name(name):
+            raise Error("Invalid attachment name.")
+
+        directory = self._ensure_directory(path)
+
+        if isinstance(source, str):
+            (hash, size) = self._attachments.import_file(source)
+        else:
+            (hash, size) = self._attachments.import_stream(source)
+
+        with self._attachments_lock:
+            refs = self._read_attachment_refs(directory)
+            refs[name] = {"hash": hash, "size": size}
+            self._write_attachment_refs(directory, refs)
+
+        return hash
+
+    def remove_attachment(self, path, name):
+        """ Remove an attachment from a note.
+            The stored data is removed by gc_attachments once no note
+            refers to it.
+        """
+        (directory, _) = self._get_note_dir_file(path)
+        with self._attachments_lock:
+            refs = self._read_attachment_refs(directory)
+            if name not in refs:
+                raise Error("No such attachment")
+
+            del refs[name]
+            self._write_attachment_refs(directory, refs)
+
+    def _get_attachment_hash(self, path, name):
+        (directory, _) = self._get_note_dir_file(path)
+        info = self._read_attachment_refs(directory).get(name)
+        if info is None:
+            raise Error("No such attachment")
+        return info["hash"]
+
+    def open_attachment(self, path, name):
+        """ Open an attachment of a note as a binary file object. """
+        return self._attachments.open(self._get_attachment_hash(path, name))
+
+    def map_attachment(self, path, name):
+        """ Return a context manager giving a read only memory map of an attachment. """
+        return self._attachments.map(self._get_attachment_hash(path, name))
+
+    @timed("notes.gc_attachments")
+    def gc_attachments(self):
+        """ Remove stored attachment data no longer used by any note.
+            Notes in the trash still count as using their attachments.
+            Returns the number of blobs and bytes removed.
+        """
+        referenced = set()
+        for (dirpath, dirnames, filenames) in os.walk(self._directory):
+            if self.ATTACHMENTS_FILENAME in filenames:
+                for info in self._read_attachment_refs(dirpath).values():
+                    referenced.add(info["hash"])
+
+        return self._attachments.collect(referenced)
+
+    @timed("notes.create")
     def create_note(self, path):
         """ Create a new note under parent. """
         (directory, file) = self._get_note_dir_file(path)
-        if os.path.isfile(file):
+        if self._stat_contents(path)[1] is not None:
             raise Error("Note already exists")
 
+        (parent, _) = self._get_note_dir_file(tuple(path[:-1]) or None)
+        try:
+            parent_mtime = os.stat(parent).st_mtime
+        except (IOError, OSError):
+            parent_mtime = None
+
         try:
             os.makedirs(directory)
             with io.open(file, "wt", newline=None) as handle:
@@ -128,64 +865,691 @@ class NotesModel(Model):
         except (IOError, OSError) as e:
             raise Error(str(e))
 
+        self._index.note_created(tuple(path), parent_mtime)
+        self._search.update(path)
+        self._links.update(path)
+
+    @timed("notes.read")
     def read_note(self, path):
         """ Read a given note based on the fullpath name. """
-        (directory, file) = self._get_note_dir_file(path)
-        if not os.path.isfile(file):
+        self._saves.flush(path)
+        (_, _, entry) = self._get_cached(path)
+        if entry is None:
             raise Error("Note does not exist.")
 
-        try:
-            with io.open(file, "rt", newline=None) as handle:
-                return handle.read()
-        except (IOError, OSError) as e:
-            raise Error(str(e))
+        return self._get_cached_text(path, entry)
 
+    @timed("notes.write")
     def write_note(self, path, contents):
         """ Save a given note. """
         (directory, file) = self._get_note_dir_file(path)
-        if not os.path.isdir(directory):
-            raise Error("No such note")
+        with self._pack_lock:
+            self._ensure_directory(path)
+            self._write_file(file, self._encode_contents(contents))
+            self._memory.discard("/".join(path))
+
+        self._saves.mark_written(path, contents)
+        self._index.note_written(tuple(path))
+        self._search.update(path, contents)
+        self._links.update(path, contents)
 
         try:
-            with io.open(file, "wt", newline=None) as handle:
+            # Not while compact is moving the history into the pack
+            with self._pack_lock:
+                self._history.record(directory, contents.encode("utf-8"), self._get_packed_history(path))
+        except Error as e:
+            # The note itself was saved
+            self._pim.call_log_function("error", "notes", "{0}: {1}".format("/".join(path), e))
+
+    def get_revisions(self, path):
+        """ Return a list of (revision, time, size) of the saved versions of a note. """
+        (directory, _) = self._get_note_dir_file(path)
+        return self._history.get_revisions(directory, self._get_packed_history(path))
+
+    @timed("notes.read_revision")
+    def read_revision(self, path, revision):
+        """ Return the contents of a saved version of a note.
+            Negative revisions count back from the latest one.
+        """
+        (directory, _) = self._get_note_dir_file(path)
+        return self._history.read(directory, revision, self._get_packed_history(path)).decode("utf-8")
+
+    def restore_revision(self, path, revision):
+        """ Save a previous version of a note as its current contents. """
+        self.write_note(path, self.read_revision(path, revision))
+
+    @timed("notes.write_many")
+    def write_notes(self, items):
+        """ Write the contents of many notes at once.
+            items is an iterable of (path, data) where data is bytes.  Notes
+            and their parents are created as needed.  The indexes are
+            updated in one transaction each at the end.  This is meant for
+            importing, so the files are not synced one by one, and no history
+            is recorded.  Returns the number of notes written.
+        """
+        written = []
+        created = []
+        parent_mtimes = {}
+        with self._pack_lock:
+            try:
+                for (path, data) in items:
+                    path = self._paths.get(path)
+                    if not os.path.isdir(path.directory):
+                        parent = os.path.dirname(path.directory)
+                        if tuple(path[:-1]) not in parent_mtimes:
+                            try:
+                                parent_mtimes[tuple(path[:-1])] = os.stat(parent).st_mtime
+                            except (IOError, OSError):
+                                parent_mtimes[tuple(path[:-1])] = None
+                        os.makedirs(path.directory)
+                        created.append(tuple(path))
+
+                    with io.open(path.file, "wb") as handle:
+                        handle.write(self._encode_contents(data))
+                        handle.flush()
+                        stat = os.fstat(handle.fileno())
+                    self._memory.discard(path.key)
+
+                    written.append((path, data, stat))
+            except (IOError, OSError) as e:
+                raise Error(str(e))
+            finally:
+                if written:
+                    new = set(created)
+                    self._index.notes_written(
+                        created,
+                        [tuple(i[0]) for i in written if tuple(i[0]) not in new],
+                        parent_mtimes
+                    )
+                    self._search.update_many(written)
+                    self._links.update_many(written)
+
+        return len(written)
+
+    def queue_write(self, path, contents):
+        """ Save a note in the background.
+            Writes to the same note made in quick succession are combined
+            and only the last one is written.  Use flush_writes to make
+            sure the contents are on disk.
+        """
+        self._get_note_dir_file(path)
+        self._saves.queue(path, contents)
+
+    def _contents_stamp(self, path):
+        """ Return the modification time and size of a note's contents. """
+        try:
+            (_, stat) = self._stat_contents(path)
+        except Error:
+            return None
+
+        return None if stat is None else (stat.st_mtime, stat.st_size)
+
+    def _save_failed(self, path, e):
+        self._pim.call_log_function("error", "notes", "{0}: {1}".format("/".join(path), e))
+
+    def flush_writes(self, path=None):
+        """ Write any queued contents for a note, or for all notes. """
+        self._saves.flush(path)
+
+    def close(self):
+        """ Write any queued contents before the PIM is closed. """
+        self._saves.close()
+        if self._pack is not None:
+            self._pack.close()
+
+    def _write_file(self, file, contents):
+        """ Replace the contents of a file without leaving a partial file.
+            The contents are written to a temporary file that is moved over
+            the original once it is safely on disk.
+        """
+        (directory, filename) = os.path.split(file)
+        tmpname = os.path.join(directory, ".{0}.{1}.{2}.tmp".format(
+            filename, os.getpid(), threading.current_thread().ident
+        ))
+
+        try:
+            if isinstance(contents, bytes):
+                handle = io.open(tmpname, "wb")
+            else:
+                handle = io.open(tmpname, "wt", newline=None)
+
+            with handle:
                 handle.write(contents)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmpname, file)
         except (IOError, OSError) as e:
+            try:
+                os.unlink(tmpname)
+            except (IOError, OSError):
+                pass
             raise Error(str(e))
 
-    def move_note(self, path, new_parent):
-        pass
+    def _read_compression_settings(self):
+        filename = os.path.join(self._pim.get_directory(), self.COMPRESSION_FILENAME)
+        try:
+            with io.open(filename, "rt", encoding="utf-8") as handle:
+                settings = json.load(handle)
+            if settings["method"] in compression.METHODS:
+                return (int(settings["threshold"]), settings["method"])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+
+        return (None, None)
+
+    def get_compression(self):
+        """ Return (threshold, method) of note compression.
+            Both are None if notes are not compressed.
+        """
+        return self._compression
+
+    def set_compression(self, threshold, method="zlib"):
+        """ Compress notes written from now on that are at least threshold
+            bytes, using method "zlib" or "lzma".  A threshold of None turns
+            compression off.  Existing notes are not changed, see
+            compress_notes.
+        """
+        filename = os.path.join(self._pim.get_directory(), self.COMPRESSION_FILENAME)
+        if threshold is None:
+            try:
+                os.unlink(filename)
+            except (IOError, OSError):
+                pass
+            self._compression = (None, None)
+            return
+
+        if method not in compression.METHODS:
+            raise Error("Unknown compression method.")
+
+        self._write_file(filename, json.dumps({"threshold": threshold, "method": method}))
+        self._compression = (threshold, method)
+
+    @timed("notes.compress")
+    def compress_notes(self, threshold, method="zlib"):
+        """ Change the compression setting and apply it to every note.
+            Notes at least threshold bytes are compressed and all others are
+            stored plain, so a threshold of None decompresses every note.
+            The modification times of the notes are kept.  Notes in the pack
+            are not compressed.  Progress is reported through the PIM's
+            progress function.  Returns the number of notes changed, or None
+            if aborted.  Notes changed before aborting stay changed.
+        """
+        pim = self._pim
+        self.set_compression(threshold, method)
+        self.flush_writes()
+
+        if not pim.call_progress_function("Scanning notes", 0):
+            return None
+
+        paths = list(self.walk_notes())
+        total = len(paths)
+        changed = 0
+
+        for (position, path) in enumerate(paths):
+            if position % 100 == 0 and not pim.call_progress_function("Compressing notes", position * 100 // max(total, 1)):
+                return None
+
+            (_, file) = self._get_note_dir_file(path)
+            try:
+                with io.open(file, "rb") as handle:
+                    stored = handle.read()
+                    stat = os.fstat(handle.fileno())
+            except (IOError, OSError):
+                # Only in the pack or no contents
+                continue
+
+            encoded = self._encode_contents(compression.decompress(stored))
+            if encoded == stored:
+                continue
+
+            with self._pack_lock:
+                self._write_file(file, encoded)
+                try:
+                    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                except (IOError, OSError):
+                    pass
+                self._memory.discard("/".join(path))
+            changed += 1
+
+        pim.call_progress_function("Compressing notes", 100)
+        return changed
+
+    def move_note(self, path, new_parent, update_links=True):
+        """ Move a note and everything under it to a new parent. """
+        self.move_notes([(path, new_parent)], update_links)
+
+    @timed("notes.rename")
+    def rename_note(self, path, new_name, update_links=True):
+        """ Give a note a new name under the same parent.
+            If update_links is true, links to the note and the notes below
+            it are changed to the new name.
+        """
+        if not self.valid_name(new_name):
+            raise Error("Invalid note name.")
+
+        self._move_notes([(tuple(path), tuple(path[:-1]) + (new_name,))], update_links)
+
+    @timed("notes.move")
+    def move_notes(self, moves, update_links=True):
+        """ Move many notes at once.
+            moves is a list of (path, new_parent).  Each move is a single
+            rename of the note directory and the indexes are updated in one
+            transaction at the end, so the cost doesn't depend on how many
+            notes are below the moved ones.  If update_links is true, the
+            notes linking to the moved notes are rewritten.  Which notes
+            those are comes from the link index, so only they are read.
+        """
+        self._move_notes([
+            (tuple(path), tuple(new_parent or ()) + (path[-1],))
+            for (path, new_parent) in moves
+        ], update_links)
+
+    def _move_notes(self, moves, update_links):
+        # Saves wait for the pack lock, so they are waited for before it
+        paths = [old_path for (old_path, _) in moves]
+        done = []
+        self._saves.hold(paths)
+        try:
+            with self._pack_lock:
+                self._move_notes_locked(moves, done)
+        finally:
+            self._saves.release(paths)
+
+            # Also for the moves made before one failed
+            if done and update_links:
+                self._rewrite_links(done)
+
+    def _move_notes_locked(self, moves, done):
+        parents = {}
+        for (old_path, new_path) in moves:
+            if not old_path:
+                raise Error("Can not move the root note.")
+
+            if new_path[:len(old_path)] == old_path:
+                raise Error("Can not move a note under itself.")
+
+            if self._get_packed(new_path) is not None:
+                raise Error("Note already exists")
+
+            self._ensure_directory(new_path[:-1])
+
+            for parent in (old_path[:-1], new_path[:-1]):
+                if parent not in parents:
+                    parents[parent] = self._get_directory_mtime(parent)
+                    if parents[parent] is None:
+                        raise Error("No such note")
+
+        try:
+            for (old_path, new_path) in moves:
+                (old_dir, _) = self._get_note_dir_file(old_path)
+                (new_dir, _) = self._get_note_dir_file(new_path)
+
+                # The part of a note in the pack is moved by recording it,
+                # so only the note's own directory is renamed or created
+                loose = os.path.isdir(old_dir)
+                if not loose and self._get_packed(old_path) is None:
+                    raise Error("No such note")
+
+                if os.path.lexists(new_dir):
+                    raise Error("Note already exists")
 
-    def rename_note(self, path, new_name):
-        pass
+                self._saves.move(old_path, new_path)
+                try:
+                    if loose:
+                        os.rename(old_dir, new_dir)
+                    else:
+                        os.mkdir(new_dir)
+                except (IOError, OSError) as e:
+                    self._saves.move(new_path, old_path)
+                    raise Error(str(e))
 
+                try:
+                    self._record_pack_change("M", "/".join(old_path), "/".join(new_path))
+                except Error:
+                    try:
+                        if loose:
+                            os.rename(new_dir, old_dir)
+                        else:
+                            os.rmdir(new_dir)
+                    except (IOError, OSError):
+                        pass
+                    self._saves.move(new_path, old_path)
+                    raise
+
+                done.append((old_path, new_path))
+        finally:
+            # Update for the moves that were made even if a later one failed
+            if done:
+                self._index.notes_moved(done, parents)
+                self._search.notes_moved(done)
+                self._links.notes_moved(done)
+                for (old_path, new_path) in done:
+                    self._memory.discard_prefix("/".join(old_path))
+                    self._memory.discard_prefix("/".join(new_path))
+
+    @timed("notes.rewrite_links")
+    def _rewrite_links(self, moves):
+        """ Point the links to moved notes at their new paths. """
+        keys = [("/".join(old_path), "/".join(new_path)) for (old_path, new_path) in moves]
+
+        def replace(key):
+            result = key
+            for (old_key, new_key) in keys:
+                if result == old_key or result.startswith(old_key + "/"):
+                    result = new_key + result[len(old_key):]
+            return None if result == key else result
+
+        for path in self._links.get_linking([old_path for (old_path, _) in moves]):
+            try:
+                contents = self.read_note(path)
+                updated = rewrite_links(contents, replace)
+                if updated != contents:
+                    self.write_note(path, updated)
+            except Error as e:
+                # The notes themselves were moved
+                self._pim.call_log_function("error", "notes", "{0}: {1}".format("/".join(path), e))
+
+    @timed("notes.delete")
     def delete_note(self, path):
-        pass
+        """ Delete a note and everything under it.
+            The note directory is moved into the trash directory in the
+            notes storage rather than being removed file by file.  The
+            part of the note in the pack is hidden there until the next
+            compact.
+        """
+        path = tuple(path)
+        if not path:
+            raise Error("Can not delete the root note.")
+
+        (directory, _) = self._get_note_dir_file(path)
 
+        # Saves wait for the pack lock, so they are waited for before it
+        self._saves.hold([path])
+        try:
+            with self._pack_lock:
+                loose = os.path.isdir(directory)
+                if not loose and self._get_packed(path) is None:
+                    raise Error("No such note")
+
+                parent_mtime = self._get_directory_mtime(path[:-1])
+                self._saves.remove(path)
+
+                if loose:
+                    trash = os.path.join(self._directory, self.TRASH_DIRNAME)
+                    try:
+                        if not os.path.isdir(trash):
+                            os.makedirs(trash)
+
+                        target = "{0}-{1}".format(time.strftime("%Y%m%d%H%M%S"), os.path.basename(directory))
+                        count = 0
+                        while os.path.lexists(os.path.join(trash, target)):
+                            count += 1
+                            target = "{0}-{1}-{2}".format(time.strftime("%Y%m%d%H%M%S"), count, os.path.basename(directory))
+
+                        os.rename(directory, os.path.join(trash, target))
+                    except (IOError, OSError) as e:
+                        raise Error(str(e))
+
+                self._record_pack_change("D", "/".join(path))
+        finally:
+            self._saves.release([path])
+
+        self._memory.discard_prefix("/".join(path))
+        self._index.notes_deleted([path], {path[:-1]: parent_mtime})
+        self._search.notes_deleted([path])
+        self._links.notes_deleted([path])
+
+    @timed("notes.parse")
     def parse_note(self, path):
         """ Parse note into HTML. """
         # This sould possible be with the view instead the model
 
-        (_, file) = self._get_note_dir_file(path)
-        if not os.path.isfile(file):
+        self._saves.flush(path)
+        (file, stat, entry) = self._get_cached(path)
+        if entry is None:
             return # Error if note file doesn't exist?
 
+        return self._render_file(path, file, stat, entry)
+
+    @timed("notes.load")
+    def load_note(self, path):
+        """ Read a note and render it to HTML.
+            The note file is read only once, and not at all if the note is
+            in the memory cache.  Returns a tuple of the note source and the
+            HTML.
+        """
+        self._saves.flush(path)
+        (file, stat, entry) = self._get_cached(path)
+        if entry is None:
+            raise Error("Note does not exist.")
+
+        html = self._render_file(path, file, stat, entry)
+
+        contents = self._get_cached_text(path, entry)
+        self._saves.mark_written(path, contents)
+        return (contents, html)
+
+    def get_note_digest(self, path):
+        """ Return the hash of the contents of a note.
+            It is kept in the memory cache, so it is only computed again
+            after the note changes.
+        """
+        self._saves.flush(path)
+        (_, _, entry) = self._get_cached(path)
+        if entry is None:
+            raise Error("Note does not exist.")
+
+        if entry.digest is None:
+            entry.digest = RenderCache.hash_data(self._get_cached_data(path, entry))
+        return entry.digest
+
+    def get_note_xml(self, path):
+        """ Return the root element of a note's parsed contents.
+            The tree is shared through the memory cache and must not be
+            modified.
+        """
+        self._saves.flush(path)
+        (_, _, entry) = self._get_cached(path)
+        if entry is None:
+            raise Error("Note does not exist.")
+
+        return self._get_cached_root(path, entry)
+
+    @timed("notes.render_text")
+    def render_note_text(self, contents):
+        """ Render note source that may not have been saved to HTML. """
+        if not isinstance(contents, bytes):
+            contents = contents.encode("utf-8")
+
+        return self._render_data(contents)
+
+    def _get_cached(self, path):
+        """ Return (file, stat, entry) for the contents of a note.
+            entry is the note's memory cache entry, which is created empty
+            if the note isn't cached or has changed since.  Returns (None,
+            None, None) if the note has no contents.
+        """
+        (file, stat) = self._stat_contents(path)
+        if stat is None:
+            return (None, None, None)
+
+        key = "/".join(path)
+        stamp = (stat.st_mtime, stat.st_size)
+        entry = self._memory.get(key, stamp)
+        if entry is None:
+            entry = _CachedNote(key, stamp)
+            self._memory.set(key, stamp, entry, entry.get_size())
+
+        return (file, stat, entry)
+
+    def _update_cached(self, entry):
+        """ Account for a new form added to a memory cache entry. """
+        self._memory.resize(entry.key, entry, entry.get_size())
+
+    def _get_cached_data(self, path, entry):
+        data = entry.data
+        if data is None:
+            data = entry.data = self._read_contents(path)
+            self._update_cached(entry)
+        return data
+
+    def _get_cached_text(self, path, entry):
+        text = entry.text
+        if text is None:
+            text = entry.text = self._decode_text(self._get_cached_data(path, entry))
+            self._update_cached(entry)
+        return text
+
+    def _get_cached_root(self, path, entry):
+        root = entry.root
+        if root is None:
+            if entry.data is None:
+                # Parse as the contents are read rather than reading them all first
+                with self._open_contents(path) as handle:
+                    root = self._parse_data(handle)
+            else:
+                root = self._parse_data(entry.data)
+
+            entry.set_root(root)
+            self._update_cached(entry)
+        return root
+
+    def _render_file(self, path, file, stat, entry):
+        """ Render a note, using the memory and disk caches if possible. """
+        fingerprint = self._pim.get_template_cache().digest()
+        html = entry.html
+        if html is not None and entry.fingerprint == fingerprint:
+            return html
+
+        key = RenderCache.make_key(entry.key)
+        loader = lambda: self._get_cached_data(path, entry)
+
+        metrics = self._pim.get_metrics_function()
+        start = time.perf_counter() if metrics else 0
+
+        html = self._render_cache.get(key, stat, fingerprint, loader)
+
+        if metrics:
+            result = "miss" if html is None else "hit"
+            metrics("notes.cache." + result, time.perf_counter() - start)
+
+        if html is not None:
+            html = html.decode("utf-8")
+        else:
+            data = self._get_cached_data(path, entry)
+            html = self._render_data(data, self._get_cached_root(path, entry))
+            with self._pim.timed("notes.cache.store"):
+                self._render_cache.set(key, stat, RenderCache.hash_data(data), fingerprint, html.encode("utf-8"))
+
+        (entry.html, entry.fingerprint) = (html, fingerprint)
+        self._update_cached(entry)
+        return html
+
+    @timed("notes.parse_xml")
+    def _parse_data(self, data):
+        """ Parse note contents, as bytes or a binary file object, into an
+            ElementTree element.
+        """
+        from xml.etree import ElementTree as ET
+
+        try:
+            if isinstance(data, bytes):
+                return ET.fromstring(data)
+            return ET.parse(data).getroot()
+        except ET.ParseError as e:
+            raise Error(str(e))
+
+    @timed("notes.render")
+    def _render_data(self, data, root=None):
+        """ Render note contents already in memory to HTML.
+            root is the parsed contents if already available.
+        """
+        # The XML and template libraries are only needed once a note is
+        # shown, so don't slow down startup by importing them earlier.
+        from mrbaviirc import template
+        from mrbaviirc.template.lib.xml import ElementTreeWrapper
+
+        if root is None:
+            root = self._parse_data(data)
+
         try:
-            xml = ET.parse(file)
-            root = xml.getroot()
 
             context = {
                 "xml": ElementTreeWrapper(root)
             }
 
-            paths = map(lambda i: os.path.join(i, "templates"), self._pim.get_data_directories())
-            loader = template.SearchPathLoader(paths)
-            env = template.Environment(loader=loader)
-
             renderer = template.StringRenderer()
-            tmpl = env.load_file("notes/main.tmpl")
+            tmpl = self._pim.get_template_cache().load("notes/main.tmpl")
             tmpl.render(renderer, context)
         except Exception as e:
             raise Error(str(e))
 
         return renderer.get()
 
+    def _decode_text(self, data):
+        """ Decode note file contents the same way read_note does. """
+        return io.TextIOWrapper(io.BytesIO(data), newline=None).read()
+
+    @timed("notes.search")
+    def search(self, query, limit=50):
+        """ Search the note contents.
+            Returns a list of (path, snippet) ordered by relevance.
+        """
+        return self._search.search(query, limit)
+
+    @timed("notes.reindex_search")
+    def reindex_search(self):
+        """ Update the search index for notes changed outside the model.
+            This may take a while and reports through the PIM's progress
+            function, so it is normally run in a background thread.
+            Returns False if aborted.
+        """
+        return self._search.reindex()
+
+    def get_links(self, path):
+        """ Return (target, exists) for each note a note links to.
+            target is a tuple rather than a NotePath as the note may not
+            exist.
+        """
+        return self._links.get_links(path)
+
+    def get_backlinks(self, path):
+        """ Return the paths of the notes that link to a note. """
+        return self._links.get_backlinks(path)
+
+    def get_broken_links(self):
+        """ Return (path, target) for every link to a note that doesn't exist. """
+        return self._links.get_broken_links()
+
+    @timed("notes.reindex_links")
+    def reindex_links(self):
+        """ Update the link index for notes changed outside the model.
+            Like reindex_search this reports progress and returns False if
+            aborted.
+        """
+        return self._links.reindex()
+
+    def reindex_if_needed(self):
+        """ Build the search and link indexes if they are new or were made
+            by an older version.  Notes changed outside the model since are
+            only picked up by reindex_search and reindex_links.  Returns
+            False if aborted.
+        """
+        for index in (self._search, self._links):
+            if index.needs_reindex() and not index.reindex():
+                return False
+
+        return True
+
+    def set_memory_cache_budget(self, budget):
+        """ Set the most memory in bytes used to keep recent notes. """
+        self._memory.set_budget(budget)
+
+    def get_memory_cache_stats(self):
+        """ Return the hits, misses, evictions and size of the memory cache. """
+        return self._memory.get_stats()
+
+    def clear_cache(self):
+        """ Remove all cached rendered notes. """
+        self._render_cache.clear()
+        self._memory.clear()
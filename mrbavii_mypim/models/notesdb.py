@@ -0,0 +1,285 @@
+""" Helpers shared by the Sqlite databases of the notes model. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import threading
+
+from ..errors import Error
+
+
+def subtree_range(key):
+    """ Return (low, high) bounding the keys of the notes below a key.
+        A key is below another if it starts with that key and a "/", so
+        it sorts at or after key + "/" and before key + "0", "0" being the
+        character after "/".  Unlike LIKE this compares case, and Sqlite
+        can answer "column >= low AND column < high" from an index.
+    """
+    return (key + "/", key + "0")
+
+
+class NotesDatabase(object):
+    """
+    Base of the Sqlite databases of the notes model.
+
+    The database is only opened, and its schema created, when it is first
+    used, so creating the model neither imports sqlite3 nor opens any
+    files.  Access to the connection is serialized by the lock.
+    """
+
+    # Used in error messages
+    DESCRIPTION = "database"
+
+    def __init__(self, model, connect):
+        """ Create the database for a notes model.
+            connect is called without arguments to open the connection.
+        """
+        self._model = model
+        self._connect = connect
+        self._connection = None
+        self._lock = threading.RLock()
+
+    @property
+    def _db(self):
+        """ The connection, opened on first use. """
+        with self._lock:
+            if self._connection is None:
+                import sqlite3
+
+                connection = self._connect()
+                try:
+                    self._create_schema(connection)
+                except sqlite3.Error as e:
+                    connection.close()
+                    raise Error("Unable to create {0}: {1}".format(self.DESCRIPTION, e))
+                self._connection = connection
+
+            return self._connection
+
+    def _create_schema(self, db):
+        """ Create the tables if they don't exist. """
+        raise NotImplementedError()
+
+
+class NotesDocuments(NotesDatabase):
+    """
+    Base of the indexes holding data about the contents of each note in a
+    Sqlite database.
+
+    A documents table records each note that was indexed along with the
+    modification time and size of its contents, so a reindex only reads
+    notes that have changed.  A subclass keeps its own data about each
+    document in DATA_TABLE, keyed by the document id in DATA_COLUMN, and
+    provides _create_tables and _add_data.  Moving and deleting notes only
+    changes the documents table, apart from removing the data of deleted
+    notes.  A meta table records whether the index was ever brought up to
+    date with a complete reindex.
+    """
+
+    # Bump this in a subclass when its schema changes.  The index only
+    # holds information that can be recreated from the notes, so an old
+    # index is simply dropped.
+    SCHEMA_VERSION = 1
+
+    # Where the subclass keeps the data of each document
+    DATA_TABLE = None
+    DATA_COLUMN = None
+
+    # Used in error and progress messages
+    DESCRIPTION = "index"
+    PROGRESS_MESSAGE = "Indexing notes"
+
+    # Number of notes to index between commits and progress reports
+    BATCH_SIZE = 500
+
+    def _create_schema(self, db):
+        with db:
+            (version,) = db.execute("PRAGMA user_version").fetchone()
+            if version != self.SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS docs")
+                db.execute("DROP TABLE IF EXISTS meta")
+                db.execute("DROP TABLE IF EXISTS {0}".format(self.DATA_TABLE))
+                db.execute("PRAGMA user_version = {0}".format(self.SCHEMA_VERSION))
+
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS docs (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE NOT NULL,
+                    mtime REAL,
+                    size INTEGER
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value
+                )
+            """)
+            self._create_tables(db)
+
+    def _create_tables(self, db):
+        """ Create the tables of the subclass if they don't exist. """
+        raise NotImplementedError()
+
+    def _add_data(self, docid, path, data):
+        """ Add the data of a document from the contents of its note. """
+        raise NotImplementedError()
+
+    def _note_moved(self, old_path, new_path):
+        """ Called for each note moved, after its document is renamed. """
+        pass
+
+    def _update(self, key, path, data, stat):
+        row = self._db.execute("SELECT id FROM docs WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            cursor = self._db.execute(
+                "INSERT INTO docs (path, mtime, size) VALUES (?, ?, ?)",
+                (key, stat.st_mtime, stat.st_size)
+            )
+            docid = cursor.lastrowid
+        else:
+            docid = row[0]
+            self._db.execute(
+                "UPDATE docs SET mtime = ?, size = ? WHERE id = ?",
+                (stat.st_mtime, stat.st_size, docid)
+            )
+            self._db.execute(
+                "DELETE FROM {0} WHERE {1} = ?".format(self.DATA_TABLE, self.DATA_COLUMN),
+                (docid,)
+            )
+
+        self._add_data(docid, path, data)
+
+    def _remove(self, key):
+        row = self._db.execute("SELECT id FROM docs WHERE path = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute(
+                "DELETE FROM {0} WHERE {1} = ?".format(self.DATA_TABLE, self.DATA_COLUMN),
+                (row[0],)
+            )
+            self._db.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+
+    def _delete_tree(self, key):
+        (low, high) = subtree_range(key)
+        self._db.execute(
+            "DELETE FROM {0} WHERE {1} IN (SELECT id FROM docs WHERE path = ? OR (path >= ? AND path < ?))".format(
+                self.DATA_TABLE, self.DATA_COLUMN
+            ),
+            (key, low, high)
+        )
+        self._db.execute("DELETE FROM docs WHERE path = ? OR (path >= ? AND path < ?)", (key, low, high))
+
+    def update(self, path, data=None):
+        """ Update the index for one note.
+            If data is not given, the contents are read from the note.
+        """
+        key = "/".join(path)
+
+        try:
+            (_, stat) = self._model._stat_contents(path)
+            if stat is None:
+                raise Error("Note does not exist.")
+            if data is None:
+                data = self._model._read_contents(path)
+        except Error:
+            with self._lock, self._db:
+                self._remove(key)
+            return
+
+        with self._lock, self._db:
+            self._update(key, tuple(path), data, stat)
+
+    def update_many(self, items):
+        """ Update the index for many notes in one transaction.
+            items is an iterable of (path, data, stat).
+        """
+        with self._lock, self._db:
+            for (path, data, stat) in items:
+                self._update("/".join(path), tuple(path), data, stat)
+
+    def remove(self, path):
+        """ Remove a note from the index. """
+        with self._lock, self._db:
+            self._remove("/".join(path))
+
+    def notes_moved(self, moves):
+        """ Rename notes and everything below them in the index.
+            moves is a list of (old_path, new_path).
+        """
+        with self._lock, self._db:
+            for (old_path, new_path) in moves:
+                old_key = "/".join(old_path)
+                new_key = "/".join(new_path)
+                (low, high) = subtree_range(old_key)
+
+                self._delete_tree(new_key)
+                self._db.execute(
+                    "UPDATE docs SET path = ? || substr(path, ?) WHERE path = ? OR (path >= ? AND path < ?)",
+                    (new_key, len(old_key) + 1, old_key, low, high)
+                )
+                self._note_moved(tuple(old_path), tuple(new_path))
+
+    def notes_deleted(self, paths):
+        """ Remove notes and everything below them from the index. """
+        with self._lock, self._db:
+            for path in paths:
+                self._delete_tree("/".join(path))
+
+    def needs_reindex(self):
+        """ Determine if the index is new or was made by an older version,
+            and so has never been brought up to date by reindex.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'indexed'").fetchone()
+
+        return row is None
+
+    def reindex(self):
+        """ Bring the whole index up to date with the notes.
+            Progress is reported through the PIM's progress function.
+            Returns False if the progress function asked to abort.
+        """
+        pim = self._model._pim
+        if not pim.call_progress_function("Scanning notes", 0):
+            return False
+
+        paths = list(self._model.walk_notes())
+        total = len(paths)
+
+        with self._lock:
+            known = dict(
+                (row[0], (row[1], row[2]))
+                for row in self._db.execute("SELECT path, mtime, size FROM docs")
+            )
+
+        for start in range(0, total, self.BATCH_SIZE):
+            if not pim.call_progress_function(self.PROGRESS_MESSAGE, start * 100 // max(total, 1)):
+                return False
+
+            with self._lock, self._db:
+                for path in paths[start:start + self.BATCH_SIZE]:
+                    key = "/".join(path)
+                    (_, stat) = self._model._stat_contents(path)
+                    if stat is None:
+                        continue
+
+                    if known.pop(key, None) == (stat.st_mtime, stat.st_size):
+                        continue
+
+                    try:
+                        data = self._model._read_contents(path)
+                    except Error:
+                        continue
+
+                    self._update(key, tuple(path), data, stat)
+
+        # Anything not seen is gone
+        with self._lock, self._db:
+            for key in known:
+                self._remove(key)
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('indexed', 1)")
+
+        pim.call_progress_function(self.PROGRESS_MESSAGE, 100)
+        return True
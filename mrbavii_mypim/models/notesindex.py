@@ -0,0 +1,368 @@
+""" Sqlite index of the notes hierarchy. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+
+from .notesdb import NotesDatabase, subtree_range
+
+
+class NotesIndex(NotesDatabase):
+    """
+    Index of the note tree stored in a Sqlite database.
+
+    Each note has a row with its path, parent path, directory modification
+    time, whether it has any sub-notes, and the modification time and size
+    of its contents file.  The modification time of every directory whose
+    children have been scanned is also recorded.  Listing the children of a
+    note costs one stat of the note directory and one indexed query.  The
+    directory is only rescanned, in a single os.scandir pass, when its
+    modification time differs from the recorded one.  Changes inside a
+    child directory don't show in the parent's modification time, so the
+    information returned about each child is checked against a stat of its
+    own directory and contents.
+
+    Paths are stored as the note names joined with "/", which can not be
+    part of a valid note name.  The root of the tree is the empty string.
+    """
+
+    # Bump this when the schema changes.  The index only holds information
+    # that can be recreated from the notes directory, so an old index is
+    # simply dropped.
+    SCHEMA_VERSION = 2
+
+    DESCRIPTION = "notes index"
+
+    def _create_schema(self, db):
+        with db:
+            (version,) = db.execute("PRAGMA user_version").fetchone()
+            if version != self.SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS notes")
+                db.execute("DROP TABLE IF EXISTS dirs")
+                db.execute("PRAGMA user_version = {0}".format(self.SCHEMA_VERSION))
+
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS notes (
+                    path TEXT PRIMARY KEY,
+                    parent TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    mtime REAL NOT NULL,
+                    has_children INTEGER NOT NULL,
+                    note_mtime REAL,
+                    note_size INTEGER
+                )
+            """)
+            db.execute("""
+                CREATE INDEX IF NOT EXISTS notes_parent ON notes (parent, name)
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS dirs (
+                    path TEXT PRIMARY KEY,
+                    mtime REAL NOT NULL
+                )
+            """)
+
+    @staticmethod
+    def path_to_key(path):
+        """ Convert a note path to the key used in the index. """
+        return "/".join(path) if path else ""
+
+    def key_to_path(self, key):
+        """ Convert an index key to a note path. """
+        return self._model._paths.get_key(key)
+
+    @staticmethod
+    def _parent_key(key):
+        return key.rpartition("/")[0]
+
+    def _delete_tree(self, key):
+        """ Remove a note and everything below it. """
+        (low, high) = subtree_range(key)
+        self._db.execute("DELETE FROM notes WHERE path = ? OR (path >= ? AND path < ?)", (key, low, high))
+        self._db.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (key, low, high))
+
+    def _rescan(self, path, key, mtime):
+        """ Bring the children of one directory up to date. """
+        existing = dict(self._db.execute(
+            "SELECT name, mtime FROM notes WHERE parent = ?",
+            (key,)
+        ).fetchall())
+
+        prefix = key + "/" if key else ""
+        path = tuple(path or ())
+        for (name, child_mtime) in self._model._list_children(path):
+            old_mtime = existing.pop(name, None)
+            if old_mtime == child_mtime:
+                continue
+
+            # Only children that changed get looked into
+            (has_children, note_mtime, note_size) = self._model._get_note_info(path + (name,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO notes (path, parent, name, mtime, has_children, note_mtime, note_size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (prefix + name, key, name, child_mtime, int(has_children), note_mtime, note_size)
+            )
+
+        # Anything left is gone
+        for name in existing:
+            self._delete_tree(prefix + name)
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)",
+            (key, mtime)
+        )
+
+        # The scan tells us for certain if this note has children
+        self._update_has_children(key)
+
+    @staticmethod
+    def _stat_note(file):
+        try:
+            stat = os.stat(file)
+            return (stat.st_mtime, stat.st_size)
+        except (IOError, OSError):
+            return (None, None)
+
+    def refresh(self, path):
+        """ Rescan the directory for a note if it has changed.
+            Returns the index key of the note, or None if the note directory
+            does not exist.
+        """
+        key = self.path_to_key(path)
+
+        mtime = self._model._get_directory_mtime(path)
+        if mtime is None:
+            with self._lock, self._db:
+                self._delete_tree(key)
+            return None
+
+        with self._lock, self._db:
+            row = self._db.execute("SELECT mtime FROM dirs WHERE path = ?", (key,)).fetchone()
+            if row is None or row[0] != mtime:
+                self._rescan(path, key, mtime)
+
+        return key
+
+    def _page(self, columns, key, offset, limit):
+        """ Return rows for a page of the children of a key.
+            Names are unique under a parent, so sorting by name keeps pages
+            stable, and the (parent, name) index avoids a sort.
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT " + columns + " FROM notes WHERE parent = ? ORDER BY name LIMIT ? OFFSET ?",
+                (key, -1 if limit is None else limit, offset)
+            ).fetchall()
+
+    def get_children(self, path=None, offset=0, limit=None):
+        """ Return the paths of the children of a note.
+            Only limit children starting at offset are returned if limit
+            is not None.
+        """
+        key = self.refresh(path)
+        if key is None:
+            return []
+
+        rows = self._page("path", key, offset, limit)
+        return [self.key_to_path(row[0]) for row in rows]
+
+    def get_children_info(self, path=None, offset=0, limit=None):
+        """ Return (path, has_children, mtime, size) for each child of a note.
+            The mtime and size are those of the child's contents file, or
+            None if it has none.
+        """
+        key = self.refresh(path)
+        if key is None:
+            return []
+
+        rows = self._page("path, mtime, has_children, note_mtime, note_size", key, offset, limit)
+        return self._check_children(rows)
+
+    def _check_children(self, rows):
+        """ Bring the information in rows of the notes table up to date.
+            A child whose directory changed is looked into again, otherwise
+            only its contents are checked.  Returns the child information
+            for get_children_info.
+        """
+        result = []
+        changed = []
+        for (key, mtime, has_children, note_mtime, note_size) in rows:
+            path = self.key_to_path(key)
+            child_mtime = self._model._get_directory_mtime(path)
+            if child_mtime is None:
+                # Gone since the parent was scanned
+                pass
+            elif child_mtime != mtime:
+                (has_children, note_mtime, note_size) = self._model._get_note_info(path)
+                changed.append((child_mtime, int(has_children), note_mtime, note_size, key))
+            else:
+                (_, stat) = self._model._stat_contents(path)
+                stamp = (None, None) if stat is None else (stat.st_mtime, stat.st_size)
+                if stamp != (note_mtime, note_size):
+                    (note_mtime, note_size) = stamp
+                    changed.append((mtime, has_children, note_mtime, note_size, key))
+
+            result.append((path, bool(has_children), note_mtime, note_size))
+
+        if changed:
+            with self._lock, self._db:
+                self._db.executemany(
+                    "UPDATE notes SET mtime = ?, has_children = ?, note_mtime = ?, note_size = ? WHERE path = ?",
+                    changed
+                )
+
+        return result
+
+    def count_children(self, path=None):
+        """ Return the number of children of a note. """
+        key = self.refresh(path)
+        if key is None:
+            return 0
+
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM notes WHERE parent = ?",
+                (key,)
+            ).fetchone()[0]
+
+    def note_created(self, path, parent_mtime):
+        """ Record a note created through the model.
+            The parent_mtime is the modification time of the parent
+            directory before the note was created.  If the parent listing
+            was current then, it is marked as current again.
+        """
+        with self._lock, self._db:
+            self._note_created(path)
+            self._restamp(path[:-1], parent_mtime)
+
+    def _note_created(self, path):
+        # Any missing parents may have been created as well
+        for count in range(1, len(path) + 1):
+            subpath = path[:count]
+            subkey = self.path_to_key(subpath)
+            (directory, _) = self._model._get_note_dir_file(subpath)
+            try:
+                mtime = os.stat(directory).st_mtime
+            except (IOError, OSError):
+                return
+
+            (note_mtime, note_size) = self._stat_note(os.path.join(directory, self._model.NOTE_FILENAME))
+            self._db.execute(
+                "INSERT OR REPLACE INTO notes (path, parent, name, mtime, has_children, note_mtime, note_size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (subkey, self._parent_key(subkey), subpath[-1], mtime, int(count < len(path)), note_mtime, note_size)
+            )
+
+    def _restamp(self, path, old_mtime):
+        """ Mark a directory listing current after a change made by the model.
+            This is only done if the listing was current before the change,
+            when the directory had the given modification time.
+        """
+        key = self.path_to_key(path)
+        row = self._db.execute("SELECT mtime FROM dirs WHERE path = ?", (key,)).fetchone()
+        if row is None or row[0] != old_mtime:
+            return
+
+        (directory, _) = self._model._get_note_dir_file(path)
+        try:
+            mtime = os.stat(directory).st_mtime
+        except (IOError, OSError):
+            return
+
+        self._db.execute("UPDATE dirs SET mtime = ? WHERE path = ?", (mtime, key))
+
+    def _update_has_children(self, key):
+        if key:
+            self._db.execute(
+                "UPDATE notes SET has_children = EXISTS (SELECT 1 FROM notes WHERE parent = ?) WHERE path = ?",
+                (key, key)
+            )
+
+    def notes_moved(self, moves, parent_mtimes):
+        """ Record notes moved by the model.
+            moves is a list of (old_path, new_path) and parent_mtimes maps
+            each affected parent path to its modification time before the
+            moves.  The rows of all descendants are renamed in the index
+            without looking at their directories.
+        """
+        with self._lock, self._db:
+            for (old_path, new_path) in moves:
+                old_key = self.path_to_key(old_path)
+                new_key = self.path_to_key(new_path)
+                new_parent = self._parent_key(new_key)
+                (low, high) = subtree_range(old_key)
+                start = len(old_key) + 1
+
+                self._delete_tree(new_key)
+                self._db.execute(
+                    "UPDATE notes SET path = ? || substr(path, ?), parent = ? || substr(parent, ?) WHERE path >= ? AND path < ?",
+                    (new_key, start, new_key, start, low, high)
+                )
+                self._db.execute(
+                    "UPDATE dirs SET path = ? || substr(path, ?) WHERE path = ? OR (path >= ? AND path < ?)",
+                    (new_key, start, old_key, low, high)
+                )
+                self._db.execute(
+                    "UPDATE notes SET path = ?, parent = ?, name = ? WHERE path = ?",
+                    (new_key, new_parent, new_path[-1], old_key)
+                )
+
+                self._update_has_children(self._parent_key(old_key))
+                self._update_has_children(new_parent)
+
+            for (parent, mtime) in parent_mtimes.items():
+                self._restamp(parent, mtime)
+
+    def notes_deleted(self, paths, parent_mtimes):
+        """ Record notes deleted by the model. """
+        with self._lock, self._db:
+            for path in paths:
+                key = self.path_to_key(path)
+                self._delete_tree(key)
+                self._update_has_children(self._parent_key(key))
+
+            for (parent, mtime) in parent_mtimes.items():
+                self._restamp(parent, mtime)
+
+    def note_written(self, path):
+        """ Record that the contents of a note were written. """
+        with self._lock, self._db:
+            self._note_written(path)
+
+    def _note_written(self, path):
+        key = self.path_to_key(path)
+        (directory, file) = self._model._get_note_dir_file(path)
+
+        try:
+            mtime = os.stat(directory).st_mtime
+        except (IOError, OSError):
+            return
+
+        (note_mtime, note_size) = self._stat_note(file)
+        self._db.execute(
+            "UPDATE notes SET mtime = ?, note_mtime = ?, note_size = ? WHERE path = ?",
+            (mtime, note_mtime, note_size, key)
+        )
+
+    def notes_written(self, created, written, parent_mtimes):
+        """ Record many notes created and written by the model at once.
+            created and written are lists of paths, and parent_mtimes maps
+            the parents of the created notes to their modification times
+            before the first of them was created.
+        """
+        with self._lock, self._db:
+            for path in created:
+                self._note_created(path)
+
+            for path in written:
+                self._note_written(path)
+
+            for (parent, mtime) in parent_mtimes.items():
+                self._restamp(parent, mtime)
+
+    def clear(self):
+        """ Remove everything from the index. """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM notes")
+            self._db.execute("DELETE FROM dirs")
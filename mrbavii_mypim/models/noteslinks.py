@@ -0,0 +1,156 @@
+""" Index of the links between notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import re
+
+from .notesdb import NotesDocuments, subtree_range
+
+
+# A note link is an attribute value such as href="note:A/B"
+_link_re = re.compile(r"""(=\s*)(["'])note:([^"'<>]*)\2""")
+
+# A note link in rendered HTML is an href such as href="note:A/B"
+_html_link_re = re.compile(r"""href=(["'])note:([^"']*)\1""")
+
+
+def _link_key(link):
+    """ Return the key of the note a link refers to. """
+    return "/".join(i for i in link.split("/") if i)
+
+
+def extract_links(data):
+    """ Return the set of keys of the notes linked to from note contents. """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", "replace")
+
+    return set(
+        key for key in (_link_key(match.group(3)) for match in _link_re.finditer(data))
+        if key
+    )
+
+
+def rewrite_links(contents, replace):
+    """ Change the note links in note contents.
+        replace is called with the key of each linked note and returns the
+        new key, or None to leave the link alone.
+    """
+    def substitute(match):
+        key = replace(_link_key(match.group(3)))
+        if key is None:
+            return match.group(0)
+        return "{0}{1}note:{2}{1}".format(match.group(1), match.group(2), key)
+
+    return _link_re.sub(substitute, contents)
+
+
+def rewrite_html_links(html, url_fn):
+    """ Replace the note: links in rendered HTML with other URLs.
+        url_fn is called with the path of each linked note as a tuple of
+        names and returns the URL to use instead.
+    """
+    def replace(match):
+        target = tuple(i for i in match.group(2).split("/") if i)
+        return "href={0}{1}{0}".format(match.group(1), url_fn(target))
+
+    return _html_link_re.sub(replace, html)
+
+
+class NotesLinks(NotesDocuments):
+    """
+    Forward and backward links between notes in a Sqlite database.
+
+    The links of a note are extracted from its contents whenever it is
+    written.  Each link is a row from the document of the linking note to
+    the key of the linked note.  The key is kept as text so links to notes
+    that don't exist can be found.  Links to moved notes are left as they
+    are, since they still say the same thing until the linking notes are
+    rewritten.
+    """
+
+    SCHEMA_VERSION = 1
+
+    DATA_TABLE = "links"
+    DATA_COLUMN = "source"
+
+    DESCRIPTION = "link index"
+    PROGRESS_MESSAGE = "Indexing links"
+
+    def _create_tables(self, db):
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS links (
+                source INTEGER NOT NULL,
+                target TEXT NOT NULL,
+                PRIMARY KEY (source, target)
+            ) WITHOUT ROWID
+        """)
+        db.execute("""
+            CREATE INDEX IF NOT EXISTS links_target ON links (target)
+        """)
+
+    def _add_data(self, docid, path, data):
+        self._db.executemany(
+            "INSERT INTO links (source, target) VALUES (?, ?)",
+            ((docid, target) for target in extract_links(data))
+        )
+
+    def get_links(self, path):
+        """ Return (target, exists) for each note a note links to, sorted.
+            target is the path of the linked note as a tuple, since it may
+            not exist.
+        """
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT links.target, links.target IN (SELECT path FROM docs)
+                FROM links JOIN docs ON docs.id = links.source
+                WHERE docs.path = ?
+                ORDER BY links.target
+            """, ("/".join(path),)).fetchall()
+
+        return [(tuple(row[0].split("/")), bool(row[1])) for row in rows]
+
+    def get_backlinks(self, path):
+        """ Return the paths of the notes that link to a note, sorted. """
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT docs.path FROM links JOIN docs ON docs.id = links.source
+                WHERE links.target = ?
+                ORDER BY docs.path
+            """, ("/".join(path),)).fetchall()
+
+        get_key = self._model._paths.get_key
+        return [get_key(row[0]) for row in rows]
+
+    def get_linking(self, paths):
+        """ Return the paths of the notes that link to any of the given notes
+            or to a note below them.
+        """
+        result = set()
+        with self._lock:
+            for path in paths:
+                key = "/".join(path)
+                (low, high) = subtree_range(key)
+                result.update(row[0] for row in self._db.execute("""
+                    SELECT DISTINCT docs.path FROM links JOIN docs ON docs.id = links.source
+                    WHERE links.target = ? OR (links.target >= ? AND links.target < ?)
+                """, (key, low, high)))
+
+        get_key = self._model._paths.get_key
+        return [get_key(key) for key in sorted(result)]
+
+    def get_broken_links(self):
+        """ Return (path, target) for every link to a note that doesn't exist.
+            target is the path of the missing note as a tuple.
+        """
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT docs.path, links.target FROM links JOIN docs ON docs.id = links.source
+                WHERE links.target NOT IN (SELECT path FROM docs)
+                ORDER BY docs.path, links.target
+            """).fetchall()
+
+        get_key = self._model._paths.get_key
+        return [(get_key(row[0]), tuple(row[1].split("/"))) for row in rows]
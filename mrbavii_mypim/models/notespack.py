@@ -0,0 +1,256 @@
+""" Packed storage of notes in a single file. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+"""
+Pack file format.
+
+All integers are little endian.
+
+The header holds the magic string, the number of notes, the number of top
+level notes, and the offsets of the index and of the keys.  The contents of
+each note follow the header.
+
+The index has one fixed size record per note, sorted by the parent key and
+then the name.  This puts the children of a note next to each other, and
+each record gives the range of its children, so listing a note needs no
+search.  The top level notes come first.  A record also gives the offset
+and length of the note's sort key, the offset and length of its contents,
+the modification time of the contents, flags, and the offset and length of
+the note's revision history.  The history follows the contents of the note
+and is in the format made by NoteHistory.pack.  Packs of the first version
+have no history in their records.
+
+The sort key of a note is its parent's key, a NUL, then its name, encoded
+as UTF-8.  A key is the names of the path joined with "/".  Comparing sort
+keys as bytes orders by parent and then name.  A note is found by looking
+up each name of its path among the children of the previous one.
+
+A pack is never modified.  It is read through mmap, so opening it costs
+the same however many notes it holds.
+"""
+
+
+import os
+import io
+import struct
+
+from ..errors import Error
+
+
+MAGIC = b"MYPIMPK2"
+MAGIC_V1 = b"MYPIMPK1"
+
+_header = struct.Struct("<8sQQQQ")
+_record = struct.Struct("<QIIIQQdBQQ")
+_record_v1 = struct.Struct("<QIIIQQdB")
+_key_ref = struct.Struct("<QI")
+
+FLAG_CONTENTS = 1
+
+
+class PackStat(object):
+    """ Stand in for os.stat results of a note stored in a pack. """
+
+    __slots__ = ("st_mtime", "st_size")
+
+    st_dev = 0
+    st_ino = 0
+
+    def __init__(self, mtime, size):
+        self.st_mtime = mtime
+        self.st_size = size
+
+
+class NotesPack(object):
+    """ Read only access to a pack file. """
+
+    def __init__(self, filename):
+        import mmap
+
+        self._filename = filename
+
+        try:
+            with io.open(filename, "rb") as handle:
+                self._stat = os.fstat(handle.fileno())
+                if self._stat.st_size < _header.size:
+                    raise Error("Invalid pack file.")
+                self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError) as e:
+            raise Error(str(e))
+
+        (magic, self._count, self._root_count, self._index, self._keys) = _header.unpack_from(self._map, 0)
+        self._record = {MAGIC: _record, MAGIC_V1: _record_v1}.get(magic)
+        if self._record is None or self._index + self._count * self._record.size > len(self._map):
+            self._map.close()
+            raise Error("Invalid pack file.")
+
+        self._names = {}
+
+    def get_filename(self):
+        return self._filename
+
+    def get_mtime(self):
+        """ Return the modification time of the pack file. """
+        return self._stat.st_mtime
+
+    def __len__(self):
+        return self._count
+
+    def _get_record(self, index):
+        return self._record.unpack_from(self._map, self._index + index * self._record.size)
+
+    def _sort_key(self, index):
+        (offset, length) = _key_ref.unpack_from(self._map, self._index + index * self._record.size)
+        offset += self._keys
+        return self._map[offset:offset + length]
+
+    def _get_child_names(self, index):
+        """ Return a dictionary of name to index of the children of a note.
+            It is built when a note is first looked into.
+        """
+        names = self._names.get(index)
+        if names is None:
+            names = self._names[index] = dict(
+                (self.get_name(child), child) for child in self.get_children(index)
+            )
+        return names
+
+    def find(self, key):
+        """ Return the index of a note by its key, or None. """
+        index = None
+        for name in key.split("/"):
+            index = self._get_child_names(index).get(name)
+            if index is None:
+                return None
+        return index
+
+    def get_children(self, index=None):
+        """ Return the range of indexes of the children of a note.
+            The top level notes are the children of index None.
+        """
+        if index is None:
+            return range(0, self._root_count)
+
+        (_, _, first, count) = self._get_record(index)[:4]
+        return range(first, first + count)
+
+    def get_key(self, index):
+        sort_key = self._sort_key(index)
+        if sort_key[:1] == b"\x00":
+            return sort_key[1:].decode("utf-8")
+        return sort_key.replace(b"\x00", b"/").decode("utf-8")
+
+    def get_name(self, index):
+        return self._sort_key(index).rpartition(b"\x00")[2].decode("utf-8")
+
+    def get_info(self, index):
+        """ Return (has_contents, mtime, size) of a note. """
+        (_, _, _, _, _, length, mtime, flags) = self._get_record(index)[:8]
+        return (bool(flags & FLAG_CONTENTS), mtime, length)
+
+    def read(self, index):
+        """ Return the contents of a note. """
+        (_, _, _, _, offset, length, _, flags) = self._get_record(index)[:8]
+        if not flags & FLAG_CONTENTS:
+            raise Error("Note does not exist.")
+        return self._map[offset:offset + length]
+
+    def read_history(self, index):
+        """ Return the packed revision history of a note, or None. """
+        record = self._get_record(index)
+        if len(record) < 10 or not record[9]:
+            return None
+
+        (offset, length) = record[8:10]
+        return self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
+
+
+def make_sort_key(key):
+    """ Return the sort key of a note key. """
+    (parent, _, name) = key.rpartition("/")
+    return (parent + "\x00" + name).encode("utf-8")
+
+
+def write_pack(filename, notes):
+    """ Write a new pack file.
+        notes is an iterable of (key, mtime, data, history) in any order,
+        where data is None for a note without contents and history is None
+        for a note without revisions.  The parent of each note must be
+        included.  The file is written beside the target and moved over
+        it once complete.
+    """
+    tmpname = filename + ".{0}.tmp".format(os.getpid())
+    records = []
+
+    try:
+        with io.open(tmpname, "wb") as handle:
+            handle.write(b"\x00" * _header.size)
+            offset = _header.size
+
+            for (key, mtime, data, history) in notes:
+                if data is None:
+                    (flags, length, data_offset) = (0, 0, 0)
+                else:
+                    handle.write(data)
+                    (flags, length, data_offset) = (FLAG_CONTENTS, len(data), offset)
+                    offset += length
+
+                if history is None:
+                    (history_offset, history_length) = (0, 0)
+                else:
+                    handle.write(history)
+                    (history_offset, history_length) = (offset, len(history))
+                    offset += history_length
+
+                records.append((make_sort_key(key), data_offset, length, mtime or 0.0, flags, history_offset, history_length))
+
+            records.sort(key=lambda i: i[0])
+
+            # The children of each parent are together after sorting
+            children = {}
+            for (index, record) in enumerate(records):
+                parent = record[0].partition(b"\x00")[0]
+                if parent in children:
+                    children[parent][1] += 1
+                else:
+                    children[parent] = [index, 1]
+
+            index_offset = offset
+            keys_offset = index_offset + len(records) * _record.size
+            key_offset = 0
+            for (sort_key, data_offset, length, mtime, flags, history_offset, history_length) in records:
+                key = sort_key[1:] if sort_key[:1] == b"\x00" else sort_key.replace(b"\x00", b"/")
+                (first, count) = children.get(key, (0, 0))
+                handle.write(_record.pack(
+                    key_offset, len(sort_key), first, count, data_offset, length, mtime, flags,
+                    history_offset, history_length
+                ))
+                key_offset += len(sort_key)
+
+            for record in records:
+                handle.write(record[0])
+
+            root_count = children.get(b"", (0, 0))[1]
+            handle.seek(0)
+            handle.write(_header.pack(MAGIC, len(records), root_count, index_offset, keys_offset))
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        os.replace(tmpname, filename)
+    except BaseException as e:
+        # Also when the notes iterable raised
+        try:
+            os.unlink(tmpname)
+        except (IOError, OSError):
+            pass
+
+        if isinstance(e, (IOError, OSError)):
+            raise Error(str(e))
+        raise
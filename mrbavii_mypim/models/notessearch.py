@@ -0,0 +1,89 @@
+""" Full text search of notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import re
+
+from ..errors import Error
+from .notesdb import NotesDocuments
+
+
+class NotesSearch(NotesDocuments):
+    """
+    Full text index of the note contents using Sqlite FTS5.
+
+    The text of each note is taken from its XML contents and kept in the
+    docs_fts table with the document id as its rowid.
+    """
+
+    SCHEMA_VERSION = 1
+
+    DATA_TABLE = "docs_fts"
+    DATA_COLUMN = "rowid"
+
+    DESCRIPTION = "search index"
+    PROGRESS_MESSAGE = "Indexing notes"
+
+    _tag_re = re.compile("<[^>]*>")
+
+    def _create_tables(self, db):
+        db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5 (
+                title, body, tokenize = 'unicode61'
+            )
+        """)
+
+    @classmethod
+    def extract_text(cls, data):
+        """ Return the searchable text of a note's contents. """
+        from xml.etree import ElementTree as ET
+
+        try:
+            root = ET.fromstring(data)
+            return " ".join(i.strip() for i in root.itertext() if i.strip())
+        except ET.ParseError:
+            # Still index a malformed note as well as possible
+            if isinstance(data, bytes):
+                data = data.decode("utf-8", "replace")
+            return cls._tag_re.sub(" ", data)
+
+    def _add_data(self, docid, path, data):
+        self._db.execute(
+            "INSERT INTO docs_fts (rowid, title, body) VALUES (?, ?, ?)",
+            (docid, path[-1] if path else "", self.extract_text(data))
+        )
+
+    def _note_moved(self, old_path, new_path):
+        # Only the moved note itself can have a new title
+        if old_path[-1] != new_path[-1]:
+            row = self._db.execute("SELECT id FROM docs WHERE path = ?", ("/".join(new_path),)).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE docs_fts SET title = ? WHERE rowid = ?",
+                    (new_path[-1], row[0])
+                )
+
+    def search(self, query, limit=50):
+        """ Search the notes.
+            Returns a list of (path, snippet) in order of relevance.  The
+            matched terms in the snippet are surrounded by the characters
+            "\\x01" and "\\x02" so the caller can highlight them.
+        """
+        import sqlite3
+
+        try:
+            with self._lock:
+                rows = self._db.execute("""
+                    SELECT docs.path, snippet(docs_fts, 1, '\x01', '\x02', '...', 12)
+                    FROM docs_fts JOIN docs ON docs.id = docs_fts.rowid
+                    WHERE docs_fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                """, (query, limit)).fetchall()
+        except sqlite3.Error as e:
+            raise Error("Invalid search: {0}".format(e))
+
+        return [(self._model._paths.get_key(row[0]), row[1]) for row in rows]
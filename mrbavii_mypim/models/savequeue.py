@@ -0,0 +1,275 @@
+""" Write-behind queue for saving notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import time
+import hashlib
+import threading
+
+
+class SaveQueue(object):
+    """
+    Delay and coalesce writes of note contents.
+
+    Each queued write replaces any write still pending for the same note
+    and is performed once no new write for that note has been queued for
+    the delay time, or once the first of them has waited max_wait, so a
+    note being edited without pause is still saved.  Contents that are the
+    same as those last written are not written again, unless the stamp of
+    the note shows it has been changed since.  The actual write is done by
+    the write function, which is called on a background thread or on the
+    thread calling flush.  A write that fails is queued again.
+    """
+
+    def __init__(self, write_fn, delay=2.0, max_wait=10.0, stamp_fn=None, error_fn=None):
+        """ Create the queue.
+            write_fn is called with the path and contents to write.
+            stamp_fn is called with a path and returns a value that changes
+            whenever the note is written, such as its modification time and
+            size.  error_fn is called with the path and the exception when
+            a background write fails.
+        """
+        self._write_fn = write_fn
+        self._delay = delay
+        self._max_wait = max_wait
+        self._stamp_fn = stamp_fn
+        self._error_fn = error_fn
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._active = set()
+        self._held = []
+        self._written = {}
+        self._thread = None
+        self._closed = False
+        self._errors = {}
+
+    @staticmethod
+    def _hash(contents):
+        if not isinstance(contents, bytes):
+            contents = contents.encode("utf-8")
+        return hashlib.sha1(contents).hexdigest()
+
+    def queue(self, path, contents):
+        """ Queue contents to be written to a note. """
+        path = tuple(path)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Save queue is closed")
+
+            now = time.time()
+            first = self._pending[path][2] if path in self._pending else now
+            self._pending[path] = (contents, min(now + self._delay, first + self._max_wait), first)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._cond.notify_all()
+
+    def is_pending(self, path):
+        """ Determine if a write is pending for a note. """
+        with self._cond:
+            return tuple(path) in self._pending
+
+    def get_pending(self, path):
+        """ Return the pending contents of a note, or None. """
+        with self._cond:
+            item = self._pending.get(tuple(path))
+            return item[0] if item else None
+
+    def discard(self, path):
+        """ Forget a pending write for a note. """
+        with self._cond:
+            self._pending.pop(tuple(path), None)
+            self._written.pop(tuple(path), None)
+
+    @staticmethod
+    def _moved(path, old, new):
+        if path[:len(old)] == old:
+            return new + path[len(old):]
+        return None
+
+    def move(self, old, new):
+        """ Move pending writes for a note and its descendants to a new path.
+            Writes in progress are waited for so they don't land in the old
+            location.
+        """
+        (old, new) = (tuple(old), tuple(new))
+        with self._cond:
+            while any(self._moved(i, old, new) for i in self._active):
+                self._cond.wait()
+
+            for table in (self._pending, self._written, self._errors):
+                for path in list(table):
+                    moved = self._moved(path, old, new)
+                    if moved is not None:
+                        table[moved] = table.pop(path)
+
+    def _is_held(self, path):
+        # Must be called with the lock held
+        return any(self._moved(path, held, held) is not None for held in self._held)
+
+    def hold(self, paths):
+        """ Stop writing the notes below the paths until released.
+            Writes in progress are waited for.  This is done before a note is
+            moved or deleted, as writes need the locks held while doing so.
+        """
+        paths = [tuple(path) for path in paths]
+        with self._cond:
+            self._held.extend(paths)
+            while any(self._moved(i, path, path) is not None for i in self._active for path in paths):
+                self._cond.wait()
+
+    def release(self, paths):
+        """ Allow the notes held by hold to be written again. """
+        with self._cond:
+            for path in paths:
+                self._held.remove(tuple(path))
+            self._cond.notify_all()
+
+    def remove(self, path):
+        """ Forget pending writes for a note and its descendants. """
+        path = tuple(path)
+        with self._cond:
+            while any(self._moved(i, path, ()) is not None for i in self._active):
+                self._cond.wait()
+
+            for table in (self._pending, self._written, self._errors):
+                for item in list(table):
+                    if self._moved(item, path, ()) is not None:
+                        del table[item]
+
+    def _stamp(self, path):
+        return None if self._stamp_fn is None else self._stamp_fn(path)
+
+    def _mark(self, path, digest):
+        stamp = self._stamp(path)
+        with self._cond:
+            self._written[path] = (digest, stamp)
+
+    def mark_written(self, path, contents):
+        """ Record contents known to be on disk for a note.
+            This must be called whenever a note is written other than
+            through the queue.
+        """
+        self._mark(tuple(path), self._hash(contents))
+
+    def _take(self, paths):
+        # Must be called with the lock held
+        items = []
+        for path in paths:
+            (contents, deadline, first) = self._pending.pop(path)
+            items.append((path, contents))
+            self._active.add(path)
+        return items
+
+    def _write(self, items, background=False):
+        """ Write items taken from the queue.
+            Items that fail are queued again, unless newer contents have
+            been queued meanwhile.  The errors of a background write are
+            also kept to be raised by the next flush of the note.  Returns
+            a list of (path, exception) for the failures.
+        """
+        failed = []
+        try:
+            for (path, contents) in items:
+                digest = self._hash(contents)
+                with self._cond:
+                    written = self._written.get(path)
+                if written is not None and written[0] == digest and written[1] == self._stamp(path):
+                    continue
+
+                try:
+                    self._write_fn(path, contents)
+                except Exception as e:
+                    failed.append((path, contents, e))
+                    continue
+
+                self._mark(path, digest)
+        finally:
+            with self._cond:
+                now = time.time()
+                for (path, contents, e) in failed:
+                    if path not in self._pending:
+                        self._pending[path] = (contents, now + self._max_wait, now)
+                    if background:
+                        self._errors.setdefault(path, e)
+                for (path, contents) in items:
+                    self._active.discard(path)
+                self._cond.notify_all()
+
+        return [(path, e) for (path, contents, e) in failed]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.time()
+                    waiting = [i for i in self._pending if not self._is_held(i)]
+                    due = [i for i in waiting if self._pending[i][1] <= now]
+                    if due:
+                        break
+
+                    if waiting:
+                        timeout = min(self._pending[i][1] for i in waiting) - now
+                    else:
+                        timeout = None
+                    self._cond.wait(timeout)
+                else:
+                    return
+
+                items = self._take(due)
+
+            failed = self._write(items, True)
+            for (path, e) in failed:
+                if self._error_fn is not None:
+                    self._error_fn(path, e)
+
+    def flush(self, path=None):
+        """ Write pending contents now.
+            If path is given only that note is written.  The first error
+            from these writes or from an earlier background write of the
+            notes flushed is raised here.  The contents that failed to be
+            written stay queued.  Notes held by hold are written once
+            released.
+        """
+        with self._cond:
+            while self._held if path is None else self._is_held(tuple(path)):
+                self._cond.wait()
+
+            if path is None:
+                paths = list(self._pending)
+            else:
+                path = tuple(path)
+                paths = [path] if path in self._pending else []
+
+            items = self._take(paths)
+
+        failed = self._write(items)
+
+        # Wait for any write the background thread is in the middle of
+        with self._cond:
+            while self._active if path is None else path in self._active:
+                self._cond.wait()
+
+            errors = [e for (_, e) in failed]
+            if path is None:
+                errors.extend(self._errors.values())
+                self._errors.clear()
+            elif path in self._errors:
+                errors.append(self._errors.pop(path))
+
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """ Flush all pending writes and stop the background thread. """
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
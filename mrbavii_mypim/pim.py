@@ -6,10 +6,12 @@ __license__     =   "Apache License 2.0"
 
 
 import os
+import threading
 
 from mrbaviirc.pattern.listener import ListenerMixin
 
 from . import errors
+from .metrics import Timer, NULL_TIMER
 
 from . import platform
 
@@ -36,17 +38,35 @@ class Pim(ListenerMixin):
         # Basic setup
         self._directory = directory
         self._progress_fn = None
+        self._log_fn = None
+        self._metrics_fn = None
         self._models = {}
+        self._models_lock = threading.RLock()
+        self._template_cache = None
 
-        # Next open/create each model
-        import models
+    def get_model(self, name):
+        """ Return the instance for a given model.
+            Each model is imported and opened the first time it is asked for.
+        """
+        with self._models_lock:
+            model = self._models.get(name, None)
+            if model is None:
+                from . import models
 
-        for model in models.all_models:
-            self._models[model.MODEL_NAME] = model(self)
+                with self.timed("pim.open_model"):
+                    cls = models.get_model_class(name)
+                    if cls is None:
+                        return None
 
-    def get_model(self, name):
-        """ Return the instance for a given model. """
-        return self._models.get(name, None)
+                    model = self._models[name] = cls(self)
+
+            return model
+
+    def close(self):
+        """ Close each opened model, saving anything still pending. """
+        with self._models_lock:
+            for model in self._models.values():
+                model.close()
 
     def register_progress_function(self, callback=None):
         """ Register a progress function.
@@ -82,6 +102,28 @@ class Pim(ListenerMixin):
         if self._log_fn:
             self._log_fn(level, source, message)
 
+    def register_metrics_function(self, callback=None):
+        """ Register a metrics function.
+            The metrics function is called after each timed model operation
+            with the following arguments:
+                1. The name of the operation, such as "notes.read"
+                2. The time taken in seconds
+            The metrics function may be called from any thread.  A
+            metrics.MetricsCollector can be used to aggregate the timings.
+            With no metrics function registered timing is disabled.
+        """
+        self._metrics_fn = callback
+
+    def get_metrics_function(self):
+        """ Return the registered metrics function or None. """
+        return self._metrics_fn
+
+    def timed(self, name):
+        """ Return a context manager that times its block as an operation. """
+        if self._metrics_fn is None:
+            return NULL_TIMER
+        return Timer(self._metrics_fn, name)
+
     def get_directory(self):
         """ Return the PIM directory. """
         return self._directory
@@ -96,6 +138,14 @@ class Pim(ListenerMixin):
 
         return dirs
 
+    def get_template_cache(self):
+        """ Return the template cache shared by all models of this PIM. """
+        if self._template_cache is None:
+            from .templates import TemplateCache
+            self._template_cache = TemplateCache(self)
+
+        return self._template_cache
+
     def get_storage_directory(self, model):
         """ Return the storage directory. IE where the model puts it's files. """
         return os.path.join(self._directory, model.MODEL_NAME)
@@ -104,3 +154,26 @@ class Pim(ListenerMixin):
         """ Return a cache directory. """
         return os.path.join(self._directory, "cache", model.MODEL_NAME)
 
+    def get_database_directory(self, model):
+        """ Return the directory where a model's database files are kept. """
+        return os.path.join(self._directory, "db", model.MODEL_NAME)
+
+    def open_database(self, model, name):
+        """ Open a Sqlite database file for a model.
+            The connection may be shared between threads, so the caller is
+            responsible for serializing access to it.
+        """
+        import sqlite3
+
+        directory = self.get_database_directory(model)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            return sqlite3.connect(
+                os.path.join(directory, name + ".sqlite"),
+                check_same_thread=False
+            )
+        except (IOError, OSError, sqlite3.Error) as e:
+            raise Error(str(e))
+
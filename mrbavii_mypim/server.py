@@ -0,0 +1,470 @@
+""" Local HTTP server for reading the PIM in a browser. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+"""
+URLs served.
+
+    /                           Redirect to /browse/
+    /browse/<note>              HTML list of the children of a note
+    /note/<note>                The rendered HTML of a note
+    /source/<note>              The XML source of a note
+    /tree/<note>                JSON list of the children of a note
+    /attachment/<note>/<name>   An attachment of a note
+
+<note> is the names of the note path separated by "/" and percent encoded.
+It is empty for the top of the tree in /browse/ and /tree/.  /tree/
+accepts "offset" and "limit" query parameters for paging.
+
+Only GET and HEAD are supported.  Connections are kept alive between
+requests.  Notes and attachments are sent with an ETag so a browser can
+revalidate them with If-None-Match.  The ETag of a note comes from the
+hash of its contents, plus the template fingerprint for rendered HTML.
+The hash is kept in the model's memory cache, so answering "not modified"
+only reads a note once after it changes.  Stored attachments use their
+content hash.  An invalid paging parameter gets 400 Bad Request.
+
+All model calls run in a thread pool, so the event loop only parses
+requests and writes responses.
+"""
+
+
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import argparse
+import mimetypes
+import email.utils
+from concurrent import futures
+from urllib.parse import unquote, quote, urlsplit, parse_qs
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+from .pim import Pim
+from .errors import Error
+from .models.noteslinks import rewrite_html_links
+
+
+# Seconds a kept alive connection may wait for its next request
+KEEP_ALIVE_TIMEOUT = 15
+
+# Largest request head accepted
+MAX_HEADER_SIZE = 64 * 1024
+
+CHUNK_SIZE = 256 * 1024
+
+_reasons = {
+    200: "OK",
+    301: "Moved Permanently",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+class _BadRequest(Error):
+    """ Raised for a request with invalid parameters. """
+    pass
+
+
+class _Request(object):
+    """ A parsed request head. """
+
+    __slots__ = ("method", "path", "query", "version", "headers")
+
+    def __init__(self, method, path, query, version, headers):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = headers
+
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+class _Response(object):
+    """ A response with either a body in memory or a file to stream. """
+
+    __slots__ = ("status", "headers", "body", "file", "size")
+
+    def __init__(self, status, body=b"", content_type=None, headers=None):
+        self.status = status
+        self.headers = list(headers or ())
+        self.body = body
+        self.file = None
+        self.size = len(body)
+        if content_type:
+            self.headers.append(("Content-Type", content_type))
+
+
+def _error(status, message=None):
+    text = message or _reasons[status]
+    body = "<html><body><h1>{0} {1}</h1><p>{2}</p></body></html>".format(
+        status, _reasons[status], escape(text)
+    ).encode("utf-8")
+    return _Response(status, body, "text/html; charset=utf-8")
+
+
+def _make_etag(*parts):
+    """ Return a quoted ETag built from the given values. """
+    digest = hashlib.sha1("\x00".join(str(i) for i in parts).encode("utf-8"))
+    return '"{0}"'.format(digest.hexdigest())
+
+
+def _etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag or tag == "*":
+            return True
+    return False
+
+
+def note_url(prefix, path):
+    """ Return the URL of a note under a given prefix such as "/note/". """
+    return prefix + "/".join(quote(i) for i in path)
+
+
+def rewrite_links(html):
+    """ Replace note: links in rendered HTML with server URLs. """
+    return rewrite_html_links(html, lambda target: note_url("/note/", target))
+
+
+class NotesServer(object):
+    """
+    Serve the notes of a PIM over HTTP.
+
+    One server handles any number of connections.  Each connection is a
+    coroutine on the event loop, and the blocking work of each request is
+    done by the thread pool, so slow requests don't hold up others.
+    """
+
+    def __init__(self, pim, workers=None):
+        self._pim = pim
+        self._model = pim.get_model("notes")
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _read_request(self, reader):
+        """ Read a request head.  Returns None when the connection is done. """
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise ValueError("Invalid request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            (name, sep, value) = line.partition(":")
+            if not sep:
+                raise ValueError("Invalid header")
+            headers[name.strip().lower()] = value.strip()
+
+        # Requests this server accepts have no body, but skip one if sent
+        length = int(headers.get("content-length", "0") or "0")
+        if length:
+            await reader.readexactly(length)
+
+        url = urlsplit(parts[1])
+        return _Request(parts[0].upper(), url.path, parse_qs(url.query), parts[2], headers)
+
+    async def handle_connection(self, reader, writer):
+        """ Serve requests on one connection until it is closed. """
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (ValueError, asyncio.LimitOverrunError) as e:
+                    status = 431 if isinstance(e, asyncio.LimitOverrunError) else 400
+                    await self._send(writer, None, _error(status), False)
+                    break
+
+                if request is None:
+                    break
+
+                keep_alive = request.keep_alive()
+                try:
+                    response = await self._dispatch(request)
+                except _BadRequest as e:
+                    response = _error(400, str(e))
+                except Error as e:
+                    response = _error(404, str(e))
+                except Exception as e:
+                    self._pim.call_log_function("error", "server", "{0}: {1}".format(request.path, e))
+                    response = _error(500)
+
+                await self._send(writer, request, response, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, request, response, keep_alive):
+        lines = ["HTTP/1.1 {0} {1}".format(response.status, _reasons[response.status])]
+        lines.append("Date: {0}".format(email.utils.formatdate(usegmt=True)))
+        lines.append("Connection: {0}".format("keep-alive" if keep_alive else "close"))
+        if response.status != 304:
+            lines.append("Content-Length: {0}".format(response.size))
+        for (name, value) in response.headers:
+            lines.append("{0}: {1}".format(name, value))
+
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+        if request is not None and request.method == "HEAD" or response.status == 304:
+            if response.file is not None:
+                await self._run(response.file.close)
+        elif response.file is not None:
+            await self._stream(writer, response.file)
+        else:
+            writer.write(response.body)
+
+        await writer.drain()
+
+    async def _stream(self, writer, handle):
+        """ Send a file without holding it all in memory. """
+        try:
+            while True:
+                data = await self._run(handle.read, CHUNK_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        finally:
+            await self._run(handle.close)
+
+    async def _dispatch(self, request):
+        if request.method not in ("GET", "HEAD"):
+            return _error(405)
+
+        path = request.path
+        if path == "/":
+            return _Response(301, headers=[("Location", "/browse/")])
+
+        (_, prefix, rest) = path.partition("/")
+        (prefix, _, rest) = rest.partition("/")
+        names = [unquote(i) for i in rest.split("/") if i]
+
+        if prefix == "attachment" and len(names) >= 2:
+            return await self._run(self._attachment, request, names[:-1], names[-1])
+
+        handler = {
+            "browse": self._browse,
+            "note": self._note,
+            "source": self._source,
+            "tree": self._tree,
+        }.get(prefix)
+
+        if handler is None:
+            return _error(404)
+        return await self._run(handler, request, names)
+
+    def _get_path(self, names, root=False):
+        """ Return the NotePath of the names from a URL, or None for the root. """
+        if not names:
+            if not root:
+                raise Error("No such note")
+            return None
+        return self._model.get_path(tuple(names))
+
+    def _note_etag(self, path, *extra):
+        return _make_etag(self._model.get_note_digest(path), *extra)
+
+    def _cached(self, request, etag):
+        """ Return a 304 response if the client already has the content. """
+        if _etag_matches(request, etag):
+            return _Response(304, headers=[("ETag", etag)])
+        return None
+
+    def _note(self, request, names):
+        path = self._get_path(names)
+        self._model.flush_writes(path)
+        etag = self._note_etag(path, self._pim.get_template_cache().digest())
+        response = self._cached(request, etag)
+        if response is not None:
+            return response
+
+        html = rewrite_links(self._model.parse_note(path) or "")
+        return _Response(
+            200, html.encode("utf-8"), "text/html; charset=utf-8",
+            [("ETag", etag), ("Cache-Control", "no-cache")]
+        )
+
+    def _source(self, request, names):
+        path = self._get_path(names)
+        self._model.flush_writes(path)
+        etag = self._note_etag(path)
+        response = self._cached(request, etag)
+        if response is not None:
+            return response
+
+        return _Response(
+            200, self._model.read_note(path).encode("utf-8"), "application/xml; charset=utf-8",
+            [("ETag", etag), ("Cache-Control", "no-cache")]
+        )
+
+    def _get_children(self, request, path):
+        try:
+            offset = int(request.query.get("offset", ["0"])[0])
+            limit = request.query.get("limit")
+            limit = int(limit[0]) if limit else None
+        except ValueError:
+            raise _BadRequest("Invalid paging.")
+
+        if offset < 0 or (limit is not None and limit < 0):
+            raise _BadRequest("Invalid paging.")
+
+        return self._model.get_children_info(path, offset, limit)
+
+    def _tree(self, request, names):
+        path = self._get_path(names, True)
+        children = [
+            {
+                "name": child[-1],
+                "path": "/".join(child),
+                "has_children": bool(has_children),
+                "mtime": mtime,
+                "size": size,
+            }
+            for (child, has_children, mtime, size) in self._get_children(request, path)
+        ]
+
+        return _Response(
+            200, json.dumps(children).encode("utf-8"), "application/json",
+            [("Cache-Control", "no-cache")]
+        )
+
+    def _browse(self, request, names):
+        path = self._get_path(names, True)
+        title = " / ".join(path) if path else "Notes"
+
+        parts = ["<html><head><title>{0}</title></head><body><h3>{0}</h3>".format(escape(title))]
+        if path:
+            parts.append('<p><a href="{0}">Up</a> | <a href="{1}">View</a></p>'.format(
+                escape(note_url("/browse/", path[:-1]), True),
+                escape(note_url("/note/", path), True)
+            ))
+
+        parts.append("<ul>")
+        for (child, has_children, mtime, size) in self._get_children(request, path):
+            parts.append('<li><a href="{0}">{1}</a>{2}</li>'.format(
+                escape(note_url("/note/", child), True),
+                escape(child[-1]),
+                ' [<a href="{0}">+</a>]'.format(escape(note_url("/browse/", child), True))
+                if has_children else ""
+            ))
+        parts.append("</ul>")
+
+        attachments = self._model.get_attachment_files(path) if path else []
+        if attachments:
+            parts.append("<h4>Attachments</h4><ul>")
+            for (name, _) in attachments:
+                parts.append('<li><a href="{0}/{1}">{2}</a></li>'.format(
+                    escape(note_url("/attachment/", path), True),
+                    escape(quote(name), True),
+                    escape(name)
+                ))
+            parts.append("</ul>")
+
+        parts.append("</body></html>")
+        return _Response(200, "".join(parts).encode("utf-8"), "text/html; charset=utf-8")
+
+    def _attachment(self, request, names, name):
+        path = self._get_path(names)
+        files = dict(self._model.get_attachment_files(path))
+        if name not in files:
+            raise Error("No such attachment")
+
+        # Stored attachments are named by their hash, which never changes
+        hashes = dict((i[0], i[1]) for i in self._model.list_attachments(path))
+        try:
+            handle = open(files[name], "rb")
+        except (IOError, OSError) as e:
+            raise Error(str(e))
+
+        stat = os.fstat(handle.fileno())
+        etag = '"{0}"'.format(hashes[name]) if name in hashes else _make_etag(stat.st_mtime, stat.st_size, stat.st_ino)
+
+        response = self._cached(request, etag)
+        if response is not None:
+            handle.close()
+            return response
+
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        response = _Response(200, content_type=content_type, headers=[("ETag", etag), ("Cache-Control", "no-cache")])
+        response.file = handle
+        response.size = stat.st_size
+        return response
+
+    async def serve(self, host, port):
+        """ Serve until cancelled. """
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_SIZE)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self._executor.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mrbavii_mypim.server")
+    parser.add_argument("directory", help="The PIM directory.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker threads.")
+    args = parser.parse_args(argv)
+
+    try:
+        pim = Pim(args.directory)
+        pim.register_log_function(
+            lambda level, source, message: sys.stderr.write("{0}: {1}: {2}\n".format(level, source, message))
+        )
+        server = NotesServer(pim, args.workers)
+    except Error as e:
+        sys.stderr.write("Error: {0}\n".format(e))
+        return 1
+
+    sys.stderr.write("Serving {0} on http://{1}:{2}/\n".format(args.directory, args.host, args.port))
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        pim.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
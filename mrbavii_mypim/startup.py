@@ -0,0 +1,118 @@
+""" Report on the time taken to start up. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+
+# Run in a fresh interpreter so nothing is imported already.  Opening the
+# PIM and each model are timed separately from the imports.
+_script = """
+import sys, time, json
+start = time.perf_counter()
+from mrbavii_mypim.pim import Pim
+imported = time.perf_counter()
+pim = Pim(sys.argv[1])
+opened = time.perf_counter()
+models = {}
+for name in sys.argv[2:]:
+    model_start = time.perf_counter()
+    pim.get_model(name)
+    models[name] = time.perf_counter() - model_start
+sys.stdout.write(json.dumps({
+    "import": imported - start,
+    "open": opened - imported,
+    "models": models
+}))
+"""
+
+_importtime_re = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(text):
+    """ Parse the output of "python -X importtime".
+        Returns a list of (module, self seconds, cumulative seconds, depth).
+    """
+    results = []
+    for line in text.splitlines():
+        match = _importtime_re.match(line)
+        if match:
+            results.append((
+                match.group(4),
+                int(match.group(1)) / 1000000.0,
+                int(match.group(2)) / 1000000.0,
+                (len(match.group(3)) - 1) // 2
+            ))
+    return results
+
+
+def measure(directory, models=("notes",)):
+    """ Measure the startup of a PIM in a separate interpreter. """
+    env = dict(os.environ)
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (package, env.get("PYTHONPATH"))))
+
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", _script, directory] + list(models),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        universal_newlines=True
+    )
+    (out, err) = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(err.strip().splitlines()[-1] if err.strip() else "Startup failed")
+
+    result = json.loads(out)
+    imports = parse_importtime(err)
+    result["imports"] = [
+        {"module": module, "self": self, "cumulative": cumulative}
+        for (module, self, cumulative, depth) in imports
+    ]
+    result["import_total"] = sum(i[1] for i in imports)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mrbavii_mypim.startup")
+    parser.add_argument("directory", help="The PIM directory to open.")
+    parser.add_argument("--model", action="append", dest="models", help="Model to open, may be repeated.  Default notes.")
+    parser.add_argument("--top", type=int, default=20, help="Number of slowest imports to list.")
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    result = measure(args.directory, args.models or ("notes",))
+
+    if args.output:
+        outdir = os.path.dirname(args.output)
+        if outdir and not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        with io.open(args.output, "wt") as handle:
+            json.dump(result, handle, indent=2, sort_keys=True)
+
+    write = sys.stdout.write
+    write("import pim      {0:10.3f} ms\n".format(result["import"] * 1000))
+    write("open pim       {0:10.3f} ms\n".format(result["open"] * 1000))
+    for (name, seconds) in sorted(result["models"].items()):
+        write("open {0:10}{1:10.3f} ms\n".format(name, seconds * 1000))
+    write("all imports    {0:10.3f} ms\n\n".format(result["import_total"] * 1000))
+
+    write("slowest imports (cumulative ms):\n")
+    imports = sorted(result["imports"], key=lambda i: i["cumulative"], reverse=True)
+    for item in imports[:args.top]:
+        write("{0:10.3f}  {1}\n".format(item["cumulative"] * 1000, item["module"]))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+""" Template loading and caching. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import time
+import hashlib
+import threading
+
+from mrbaviirc import template
+
+from .metrics import timed
+
+
+class TemplateCache(object):
+    """
+    Keep a template environment and the compiled templates alive for a PIM.
+
+    Templates are searched for in the "templates" directory of each of the
+    PIM's data directories.  Before a cached template is returned, the
+    modification times of the files under those directories are compared to
+    the ones recorded when the template was compiled.  If any of them has
+    changed, the environment is recreated so included templates are reloaded
+    as well.  The files are looked at no more than once every CHECK_INTERVAL
+    seconds, so a change to a template may take that long to show.
+    """
+
+    CHECK_INTERVAL = 2.0
+
+    def __init__(self, pim):
+        """ Create the template cache for a PIM. """
+        self._pim = pim
+        self._lock = threading.RLock()
+        self._env = None
+        self._templates = {}
+        self._hits = 0
+        self._misses = 0
+        self._stamp = None
+        self._digest = None
+        self._checked = None
+
+    def get_search_paths(self):
+        """ Return the template search paths. """
+        return tuple(
+            os.path.join(i, "templates")
+            for i in self._pim.get_data_directories()
+        )
+
+    def fingerprint(self):
+        """ Return a value that changes when any template file changes.
+            The result of the last look at the files is returned if it was
+            less than CHECK_INTERVAL seconds ago.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._checked is None or now - self._checked >= self.CHECK_INTERVAL:
+                stamp = self._scan()
+                if stamp != self._stamp:
+                    (self._stamp, self._digest) = (stamp, None)
+                self._checked = now
+
+            return self._stamp
+
+    def _scan(self):
+        stamp = []
+        for (index, path) in enumerate(self.get_search_paths()):
+            for (dirpath, dirnames, filenames) in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    fullname = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(fullname)
+                    except (IOError, OSError):
+                        continue
+
+                    stamp.append((
+                        index,
+                        os.path.relpath(fullname, path),
+                        stat.st_mtime,
+                        stat.st_size
+                    ))
+
+        return tuple(stamp)
+
+    def digest(self):
+        """ Return the fingerprint of the template set as a string. """
+        with self._lock:
+            stamp = self.fingerprint()
+            if self._digest is None:
+                self._digest = hashlib.sha1(repr(stamp).encode("utf-8")).hexdigest()
+            return self._digest
+
+    def get_environment(self):
+        """ Return the template environment, creating it if needed. """
+        with self._lock:
+            if self._env is None:
+                loader = template.SearchPathLoader(self.get_search_paths())
+                self._env = template.Environment(loader=loader)
+
+            return self._env
+
+    @timed("templates.load")
+    def load(self, name):
+        """ Return the compiled template for a given name. """
+        stamp = self.fingerprint()
+
+        with self._lock:
+            entry = self._templates.get(name)
+            if entry is not None and entry[0] == stamp:
+                self._hits += 1
+                return entry[1]
+
+            self._misses += 1
+            if entry is not None:
+                # Some template file changed, so anything the environment
+                # has loaded, including other templates, may be out of date.
+                self.clear()
+
+            tmpl = self.get_environment().load_file(name)
+            self._templates[name] = (stamp, tmpl)
+            return tmpl
+
+    def clear(self):
+        """ Drop the environment and all compiled templates.
+            The template files are looked at again on the next use.
+        """
+        with self._lock:
+            self._env = None
+            self._templates.clear()
+            self._checked = None
+
+    def get_stats(self):
+        """ Return the hit and miss counts as a dictionary. """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "templates": len(self._templates)
+            }
@@ -0,0 +1,241 @@
+""" Command line maintenance tool. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import sys
+import json
+import argparse
+
+from .pim import Pim
+from .errors import Error
+from .metrics import MetricsCollector
+
+
+def _progress():
+    """ Return a progress function that writes to stderr. """
+    last = [None]
+
+    def progress(message, percent):
+        if (message, percent) != last[0]:
+            last[0] = (message, percent)
+            sys.stderr.write("\r{0}: {1}%\x1b[K".format(message, percent))
+        return True
+
+    return progress
+
+
+def cmd_clear_cache(pim, args):
+    """ Clear the rendered note cache. """
+    pim.get_model("notes").clear_cache()
+    return 0
+
+
+def cmd_profile(pim, args):
+    """ Time listing, loading and rendering every note. """
+    collector = MetricsCollector()
+    pim.register_metrics_function(collector)
+
+    model = pim.get_model("notes")
+    count = 0
+    for path in model.walk_notes():
+        model.get_children_info(path)
+        try:
+            model.load_note(path)
+        except Error as e:
+            sys.stderr.write("{0}: {1}\n".format("/".join(path), e))
+
+        count += 1
+        if args.limit and count >= args.limit:
+            break
+
+    if args.json:
+        json.dump(collector.as_dict(), sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        sys.stdout.write(collector.format() + "\n")
+        stats = model.get_memory_cache_stats()
+        sys.stdout.write("\nmemory cache: {0} hits, {1} misses, {2} evictions, {3} bytes\n".format(
+            stats["hits"], stats["misses"], stats["evictions"], stats["size"]
+        ))
+        stats = pim.get_template_cache().get_stats()
+        sys.stdout.write("template cache: {0} hits, {1} misses, {2} templates\n".format(
+            stats["hits"], stats["misses"], stats["templates"]
+        ))
+    return 0
+
+
+def setup_profile(parser):
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many notes.")
+    parser.add_argument("--json", action="store_true", help="Write the metrics as JSON.")
+
+
+def cmd_export(pim, args):
+    """ Export the notes as static HTML. """
+    from .export import export_notes
+
+    pim.register_progress_function(_progress())
+    result = export_notes(pim, args.output, args.jobs, not args.copy)
+    sys.stderr.write("\n")
+    return 0 if result else 1
+
+
+def setup_export(parser):
+    parser.add_argument("output", help="The output directory.")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--copy", action="store_true", help="Copy attachments instead of hard linking.")
+
+
+def cmd_gc_attachments(pim, args):
+    """ Remove attachment data no longer used by any note. """
+    (count, size) = pim.get_model("notes").gc_attachments()
+    sys.stdout.write("Removed {0} attachments, {1} bytes\n".format(count, size))
+    return 0
+
+
+def cmd_compact(pim, args):
+    """ Merge the notes into the pack file. """
+    pim.register_progress_function(_progress())
+    result = pim.get_model("notes").compact()
+    sys.stderr.write("\n")
+    return 0 if result else 1
+
+
+def cmd_check_links(pim, args):
+    """ List the links to notes that don't exist. """
+    model = pim.get_model("notes")
+    pim.register_progress_function(_progress())
+    result = model.reindex_links()
+    sys.stderr.write("\n")
+    if not result:
+        return 1
+
+    broken = model.get_broken_links()
+    for (path, target) in broken:
+        sys.stdout.write("{0}: {1}\n".format("/".join(path), model.path_to_link(target)))
+    return 1 if broken else 0
+
+
+def cmd_reindex(pim, args):
+    """ Bring the search and link indexes up to date with the notes. """
+    model = pim.get_model("notes")
+    pim.register_progress_function(_progress())
+    result = model.reindex_search() and model.reindex_links()
+    sys.stderr.write("\n")
+    return 0 if result else 1
+
+
+def cmd_check(pim, args):
+    """ Check the notes for problems and optionally repair them. """
+    from .check import check_pim
+
+    pim.register_progress_function(_progress())
+    report = check_pim(pim, args.jobs, args.repair)
+    sys.stderr.write("\n")
+    if report is None:
+        return 1
+
+    if args.output:
+        with open(args.output, "wt") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+    remaining = [i for i in report["issues"] if not i["repaired"]]
+    sys.stderr.write("{0} notes, {1} issues, {2} repaired\n".format(
+        report["notes"], len(report["issues"]), len(report["issues"]) - len(remaining)
+    ))
+    return 1 if remaining else 0
+
+
+def setup_check(parser):
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--repair", action="store_true", help="Fix the issues that can be fixed safely.")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file.")
+
+
+def cmd_import(pim, args):
+    """ Import notes from a directory of files or another PIM. """
+    from .importer import import_notes
+
+    parent = tuple(args.parent.split("/")) if args.parent else None
+    pim.register_progress_function(_progress())
+    result = import_notes(pim, args.source, parent, args.batch_size)
+    sys.stderr.write("\n")
+    if result is None:
+        return 1
+
+    sys.stdout.write("Imported {0} notes\n".format(result))
+    return 0
+
+
+def setup_import(parser):
+    parser.add_argument(
+        "source",
+        help="The directory or PIM to import.  Only the contents of the notes of a PIM are imported, not their attachments or history."
+    )
+    parser.add_argument("--parent", default=None, help="Import below this note, as names separated by \"/\".")
+    parser.add_argument("--batch-size", type=int, default=500, help="Notes written per batch.")
+
+
+def cmd_compress(pim, args):
+    """ Compress or decompress the stored notes in place. """
+    threshold = None if args.off else args.threshold
+    pim.register_progress_function(_progress())
+    result = pim.get_model("notes").compress_notes(threshold, args.method)
+    sys.stderr.write("\n")
+    if result is None:
+        return 1
+
+    sys.stdout.write("Changed {0} notes\n".format(result))
+    return 0
+
+
+def setup_compress(parser):
+    parser.add_argument("--threshold", type=int, default=64 * 1024, help="Compress notes of at least this many bytes.")
+    parser.add_argument("--method", choices=("zlib", "lzma"), default="zlib", help="The compression method.")
+    parser.add_argument("--off", action="store_true", help="Store every note uncompressed.")
+
+
+# All commands: name -> (function, help, argument setup)
+commands = (
+    ("clear-cache", cmd_clear_cache, "Remove cached rendered notes.", None),
+    ("profile", cmd_profile, "Time model operations on every note.", setup_profile),
+    ("export", cmd_export, "Export the notes as static HTML.", setup_export),
+    ("gc-attachments", cmd_gc_attachments, "Remove unused attachment data.", None),
+    ("compact", cmd_compact, "Merge the notes into a single pack file.", None),
+    ("check-links", cmd_check_links, "List links to notes that don't exist.", None),
+    ("reindex", cmd_reindex, "Index notes changed outside the program for search and links.", None),
+    ("check", cmd_check, "Check the notes for problems.", setup_check),
+    ("import", cmd_import, "Import notes from files or another PIM.", setup_import),
+    ("compress", cmd_compress, "Compress large notes, or decompress all notes.", setup_compress),
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mrbavii_mypim.tool")
+    parser.add_argument("directory", help="The PIM directory.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    for (name, fn, help, setup) in commands:
+        subparser = subparsers.add_parser(name, help=help)
+        subparser.set_defaults(fn=fn)
+        if setup:
+            setup(subparser)
+
+    args = parser.parse_args(argv)
+
+    try:
+        pim = Pim(args.directory)
+        return args.fn(pim, args)
+    except Error as e:
+        sys.stderr.write("Error: {0}\n".format(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+""" Running work on the notes in a pool of processes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import functools
+import multiprocessing
+
+
+# State made by the setup function in each worker process
+_state = None
+
+
+def _init(setup, args):
+    global _state
+    _state = setup(*args)
+
+
+def _run(function, task):
+    return function(_state, task)
+
+
+def pool_map(function, tasks, jobs=None, setup=None, args=(), max_chunk=64):
+    """ Call function(state, task) for each task in a pool of processes.
+        setup(*args) is called once in each of the jobs processes to make
+        the state, which is None without a setup function.  Both functions
+        must be defined at module level so they can be sent to the workers.
+        Yields the results in the order they finish.  The pool is closed
+        once every result has been yielded, and terminated if the generator
+        is closed or raises before that, so wrap it in contextlib.closing
+        to stop early.
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return
+
+    pool = multiprocessing.Pool(
+        jobs,
+        initializer=_init if setup else None,
+        initargs=(setup, args) if setup else ()
+    )
+    try:
+        chunksize = max(1, min(max_chunk, len(tasks) // ((jobs or os.cpu_count() or 1) * 8)))
+        for result in pool.imap_unordered(functools.partial(_run, function), tasks, chunksize):
+            yield result
+    except BaseException:
+        # Also reached when the generator is closed early
+        pool.terminate()
+        pool.join()
+        raise
+
+    pool.close()
+    pool.join()
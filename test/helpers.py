@@ -0,0 +1,53 @@
+""" Helpers shared by the tests. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import shutil
+import tempfile
+
+from mrbavii_mypim.pim import Pim
+
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
+
+
+def make_directory(testcase):
+    """ Return a new empty directory removed when the test is done. """
+    if not os.path.isdir(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    directory = tempfile.mkdtemp(dir=OUTPUT_DIR)
+    testcase.addCleanup(shutil.rmtree, directory, True)
+    return directory
+
+
+def make_pim(testcase, directory=None):
+    """ Return a PIM in a new directory, closed when the test is done. """
+    pim = Pim(directory or make_directory(testcase))
+    testcase.addCleanup(pim.close)
+    return pim
+
+
+def make_notes(model, notes):
+    """ Create notes from a dictionary of key to contents.
+        Parents are created before their children.
+    """
+    for key in sorted(notes, key=lambda i: i.split("/")):
+        path = tuple(key.split("/"))
+        model.create_note(path)
+        if notes[key] is not None:
+            model.write_note(path, notes[key])
+
+
+def key(path):
+    """ Return a path as the names joined with "/". """
+    return "/".join(path)
+
+
+def keys(paths):
+    """ Return a list of paths as keys. """
+    return [key(i) for i in paths]
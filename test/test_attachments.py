@@ -0,0 +1,93 @@
+""" Tests of the attachment store. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import shutil
+import hashlib
+import unittest
+
+from mrbavii_mypim.errors import Error
+from mrbavii_mypim.models.attachments import AttachmentStore
+
+from helpers import make_directory, make_pim, make_notes
+
+
+class AttachmentStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = AttachmentStore(os.path.join(make_directory(self), "attachments"))
+
+    def test_store_once(self):
+        (hash, size) = self.store.import_stream(io.BytesIO(b"data"))
+        self.assertEqual((hash, size), (hashlib.sha256(b"data").hexdigest(), 4))
+        self.assertEqual(self.store.import_stream(io.BytesIO(b"data")), (hash, size))
+        self.assertEqual(list(self.store.iter_blobs()), [(hash, 4)])
+
+        with self.store.open(hash) as handle:
+            self.assertEqual(handle.read(), b"data")
+
+    def test_map(self):
+        (hash, _) = self.store.import_stream(io.BytesIO(b"mapped"))
+        with self.store.map(hash) as mapped:
+            self.assertEqual(mapped[:], b"mapped")
+
+        (empty, _) = self.store.import_stream(io.BytesIO(b""))
+        with self.store.map(empty) as mapped:
+            self.assertEqual(mapped, b"")
+
+    def test_invalid_hash(self):
+        self.assertRaises(Error, self.store.get_file, "../../etc/passwd")
+        self.assertRaises(Error, self.store.open, "0" * 64)
+
+    def test_collect(self):
+        (kept, _) = self.store.import_stream(io.BytesIO(b"kept"))
+        (removed, _) = self.store.import_stream(io.BytesIO(b"removed"))
+        self.assertEqual(self.store.collect(set([kept])), (1, 7))
+        self.assertTrue(self.store.exists(kept))
+        self.assertFalse(self.store.exists(removed))
+
+
+class ModelAttachmentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = make_pim(self).get_model("notes")
+        make_notes(self.model, {"A": "<note>a</note>", "B": "<note>b</note>"})
+        self.hash = self.model.add_attachment(("A",), io.BytesIO(b"shared"), "one.txt")
+        self.model.add_attachment(("B",), io.BytesIO(b"shared"), "two.txt")
+
+    def blobs(self):
+        return [hash for (hash, size) in self.model._attachments.iter_blobs()]
+
+    def test_shared(self):
+        self.assertEqual(self.blobs(), [self.hash])
+        self.assertEqual(self.model.list_attachments(("B",)), [("two.txt", self.hash, 6)])
+
+        with self.model.open_attachment(("A",), "one.txt") as handle:
+            self.assertEqual(handle.read(), b"shared")
+        with self.model.map_attachment(("B",), "two.txt") as mapped:
+            self.assertEqual(mapped[:], b"shared")
+
+        self.assertRaises(Error, self.model.open_attachment, ("A",), "two.txt")
+        self.assertRaises(Error, self.model.add_attachment, ("A",), io.BytesIO(b"x"), "../x")
+
+    def test_gc(self):
+        self.model.remove_attachment(("A",), "one.txt")
+        self.assertEqual(self.model.gc_attachments(), (0, 0))
+
+        # Still used by the deleted note in the trash
+        self.model.delete_note(("B",))
+        self.assertEqual(self.model.gc_attachments(), (0, 0))
+        self.assertEqual(self.blobs(), [self.hash])
+
+        shutil.rmtree(os.path.join(self.model._directory, self.model.TRASH_DIRNAME))
+        self.assertEqual(self.model.gc_attachments(), (1, 6))
+        self.assertEqual(self.blobs(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
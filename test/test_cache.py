@@ -0,0 +1,109 @@
+""" Tests of the caches of rendered notes and of the memory cache. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import unittest
+
+from mrbavii_mypim.cache import MemoryCache
+
+from helpers import make_pim, make_notes
+
+
+class RenderCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+        make_notes(self.model, {"A": "<note><p>one</p></note>", "B": "<note><p>two</p></note>"})
+
+    def entries(self):
+        directory = self.model._render_cache.get_directory()
+        return sorted(
+            name
+            for (dirpath, dirnames, filenames) in os.walk(directory)
+            for name in filenames
+            if not name.startswith(".")
+        )
+
+    def test_one_entry_per_note(self):
+        self.model.parse_note(("A",))
+        entries = self.entries()
+        self.assertEqual(len(entries), 1)
+
+        # Each save replaces the file, but the entry stays the same
+        for text in ("three", "four"):
+            self.model.write_note(("A",), "<note><p>{0}</p></note>".format(text))
+            self.assertIn(text, self.model.parse_note(("A",)))
+        self.assertEqual(self.entries(), entries)
+
+    def test_notes_kept_apart(self):
+        self.assertIn("one", self.model.parse_note(("A",)))
+        self.assertIn("two", self.model.parse_note(("B",)))
+        self.assertEqual(len(self.entries()), 2)
+
+        self.model._memory.clear()
+        self.assertIn("one", self.model.parse_note(("A",)))
+        self.assertIn("two", self.model.parse_note(("B",)))
+
+
+class MemoryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = MemoryCache(100)
+
+    def stats(self, *names):
+        stats = self.cache.get_stats()
+        return tuple(stats[i] for i in names)
+
+    def test_stamp(self):
+        self.cache.set("A", 1, "a", 10)
+        self.assertEqual(self.cache.get("A", 1), "a")
+        self.assertIsNone(self.cache.get("A", 2))
+        self.assertIsNone(self.cache.get("B", 1))
+        self.assertEqual(self.stats("hits", "misses", "entries", "size"), (1, 2, 0, 0))
+
+    def test_lru(self):
+        for key in ("A", "B", "C"):
+            self.cache.set(key, 1, key, 40)
+
+        self.assertEqual(self.stats("evictions", "entries", "size"), (1, 2, 80))
+        self.assertIsNone(self.cache.get("A", 1))
+
+        # B is used, so C goes next
+        self.assertEqual(self.cache.get("B", 1), "B")
+        self.cache.set("D", 1, "D", 40)
+        self.assertIsNone(self.cache.get("C", 1))
+        self.assertEqual(self.cache.get("B", 1), "B")
+        self.assertEqual(self.stats("evictions", "size"), (2, 80))
+
+    def test_budget(self):
+        self.cache.set("A", 1, "a", 200)
+        self.assertIsNone(self.cache.get("A", 1))
+
+        self.cache.set("A", 1, "a", 50)
+        self.cache.set("B", 1, "b", 50)
+        self.cache.set_budget(60)
+        self.assertEqual(self.stats("entries", "size", "budget"), (1, 50, 60))
+        self.assertEqual(self.cache.get("B", 1), "b")
+
+        value = self.cache.get("B", 1)
+        self.cache.resize("B", value, 80)
+        self.assertIsNone(self.cache.get("B", 1))
+
+    def test_discard_prefix(self):
+        for key in ("A", "A/B", "A/B/C", "AB"):
+            self.cache.set(key, 1, key, 1)
+
+        self.cache.discard_prefix("A")
+        self.assertEqual([i for i in ("A", "A/B", "A/B/C", "AB") if self.cache.get(i, 1)], ["AB"])
+
+        self.cache.clear()
+        self.assertEqual(self.stats("entries", "size"), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+""" Tests of the integrity check. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import unittest
+
+from mrbavii_mypim.check import check_pim
+
+from helpers import make_pim, make_notes
+
+
+class CheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+
+    def check(self, repair=False):
+        report = check_pim(self.pim, 1, repair)
+        return sorted((i["type"], i["note"]) for i in report["issues"])
+
+    def test_packed(self):
+        make_notes(self.model, {"A": "<note>a</note>", "A/B": "<note>broken"})
+        self.model.parse_note(("A",))
+        self.assertTrue(self.model.compact())
+
+        # A sub-note written since makes the directories again
+        make_notes(self.model, {"A/B/C": "<note>c</note>"})
+        self.assertTrue(os.path.isdir(self.model._get_note_dir_file(("A", "B"))[0]))
+        self.assertEqual(self.check(), [("invalid-xml", "A/B")])
+
+    def test_clean(self):
+        make_notes(self.model, {"A": "<note>a</note>", "A/B C": "<note>b</note>"})
+        self.model.parse_note(("A",))
+        self.assertEqual(self.check(), [])
+
+    def test_names(self):
+        make_notes(self.model, {"A": "<note>a</note>", "B C": "<note>b</note>"})
+        os.mkdir(os.path.join(self.model._directory, "bad-name"))
+        os.mkdir(os.path.join(self.model._directory, "D E"))
+        os.mkdir(os.path.join(self.model._directory, "B C"))
+
+        # "B_C" is already taken by the note
+        self.assertEqual(self.check(), [
+            ("invalid-name", None),
+            ("misplaced-name", "D E"),
+            ("name-collision", "B C"),
+        ])
+
+        report = check_pim(self.pim, 1, True)
+        repaired = sorted((i["type"], i["note"], i["repaired"]) for i in report["issues"])
+        self.assertEqual(repaired, [
+            ("invalid-name", None, False),
+            ("misplaced-name", "D E", True),
+            ("name-collision", "B C", False),
+        ])
+        self.assertTrue(os.path.isdir(os.path.join(self.model._directory, "D_E")))
+        self.assertTrue(os.path.isdir(os.path.join(self.model._directory, "B C")))
+
+    def test_invalid_xml_repair(self):
+        make_notes(self.model, {"A": "<note>good</note>"})
+        self.model.write_note(("A",), "<note>bad")
+        self.assertEqual(self.check(), [("invalid-xml", "A")])
+
+        self.assertEqual(self.check(True), [("invalid-xml", "A")])
+        self.assertEqual(self.model.read_note(("A",)), "<note>good</note>")
+        self.assertEqual(self.check(), [])
+
+    def test_orphan_cache(self):
+        make_notes(self.model, {"A": "<note>a</note>", "B": "<note>b</note>"})
+        self.model.parse_note(("A",))
+        self.model.parse_note(("B",))
+        self.model.delete_note(("B",))
+
+        self.assertEqual(self.check(), [("orphan-cache", None)])
+        self.assertEqual(self.check(True), [("orphan-cache", None)])
+        self.assertEqual(self.check(), [])
+        self.assertIsNotNone(self.model.parse_note(("A",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+""" Tests of the compression of note contents. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import unittest
+
+from mrbavii_mypim.errors import Error
+from mrbavii_mypim.models import compression
+
+from helpers import make_directory, make_pim, make_notes
+
+
+_contents = "<note>" + "<p>some text to compress</p>" * 100 + "</note>"
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = _contents.encode("utf-8")
+        for method in ("zlib", "lzma"):
+            compressed = compression.compress(data, method)
+            self.assertTrue(compression.is_compressed(compressed))
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(compression.decompress(compressed), data)
+            with compression.open_stream(io.BytesIO(compressed)) as stream:
+                self.assertEqual(stream.read(), data)
+
+    def test_plain(self):
+        data = b"<note>plain</note>"
+        self.assertFalse(compression.is_compressed(data))
+        self.assertEqual(compression.decompress(data), data)
+        with compression.open_stream(io.BytesIO(data)) as stream:
+            self.assertEqual(stream.read(), data)
+
+    def test_truncated(self):
+        compressed = compression.compress(_contents.encode("utf-8"))[:-20]
+        self.assertRaises(Error, compression.decompress, compressed)
+        with compression.open_stream(io.BytesIO(compressed)) as stream:
+            self.assertRaises(Error, stream.read)
+
+    def test_unknown_method(self):
+        self.assertRaises(Error, compression.compress, b"data", "other")
+        self.assertRaises(Error, compression.decompress, compression.MAGIC + b"?data")
+
+
+class ModelCompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = make_directory(self)
+        self.model = make_pim(self, self.directory).get_model("notes")
+
+    def stored(self, *path):
+        (_, file) = self.model._get_note_dir_file(path)
+        with io.open(file, "rb") as handle:
+            return handle.read()
+
+    def test_write(self):
+        self.model.set_compression(1000)
+        make_notes(self.model, {"A": _contents, "B": "<note>short</note>"})
+
+        self.assertTrue(compression.is_compressed(self.stored("A")))
+        self.assertFalse(compression.is_compressed(self.stored("B")))
+        self.assertEqual(self.model.read_note(("A",)), _contents)
+        self.assertEqual(len(self.model.get_note_xml(("A",))), 100)
+
+        # The setting is kept with the PIM
+        model = make_pim(self, self.directory).get_model("notes")
+        self.assertEqual(model.get_compression(), (1000, "zlib"))
+        self.assertEqual(model.read_note(("A",)), _contents)
+
+    def test_compress_notes(self):
+        make_notes(self.model, {"A": _contents, "B": "<note>short</note>"})
+        (_, file) = self.model._get_note_dir_file(("A",))
+        os.utime(file, (1000000000, 1000000000))
+
+        self.assertEqual(self.model.compress_notes(1000, "lzma"), 1)
+        self.assertTrue(compression.is_compressed(self.stored("A")))
+        self.assertEqual(os.stat(file).st_mtime, 1000000000)
+        self.assertEqual(self.model.read_note(("A",)), _contents)
+
+        # Switched off in place
+        self.assertEqual(self.model.compress_notes(None), 1)
+        self.assertEqual(self.model.get_compression(), (None, None))
+        self.assertEqual(self.stored("A"), _contents.encode("utf-8"))
+        self.assertEqual(os.stat(file).st_mtime, 1000000000)
+
+    def test_truncated(self):
+        self.model.set_compression(1000)
+        make_notes(self.model, {"A": _contents})
+        (_, file) = self.model._get_note_dir_file(("A",))
+        data = self.stored("A")
+        with io.open(file, "wb") as handle:
+            handle.write(data[:len(data) // 2])
+
+        self.model.clear_cache()
+        self.assertRaises(Error, self.model.read_note, ("A",))
+
+
+if __name__ == "__main__":
+    unittest.main()
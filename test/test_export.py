@@ -0,0 +1,68 @@
+""" Tests of the export of notes as static HTML. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import unittest
+
+from mrbavii_mypim.export import export_notes, rewrite_links
+
+from helpers import make_directory, make_pim, make_notes
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+        self.outdir = make_directory(self)
+        make_notes(self.model, {
+            "A": """<note><a href="note:B/C">c</a></note>""",
+            "B": "<note>b</note>",
+            "B/C": "<note>c</note>",
+        })
+        self.model.add_attachment(("B",), io.BytesIO(b"data"), "file.txt")
+
+    def export(self):
+        self.assertTrue(export_notes(self.pim, self.outdir, 1))
+
+    def output(self, *names):
+        return os.path.join(self.outdir, *names)
+
+    def test_rewrite_links(self):
+        self.assertEqual(
+            rewrite_links('<a href="note:B/C">', ("A",)),
+            '<a href="../B/C/index.html">'
+        )
+
+    def test_export(self):
+        self.export()
+        self.assertTrue(os.path.isfile(self.output("index.html")))
+        self.assertTrue(os.path.isfile(self.output("B", "C", "index.html")))
+        with io.open(self.output("B", "file.txt"), "rb") as handle:
+            self.assertEqual(handle.read(), b"data")
+
+    def test_attachments_changed(self):
+        self.export()
+        self.model.add_attachment(("B",), io.BytesIO(b"more"), "other.txt")
+        self.model.remove_attachment(("B",), "file.txt")
+
+        self.export()
+        self.assertTrue(os.path.isfile(self.output("B", "other.txt")))
+        self.assertFalse(os.path.exists(self.output("B", "file.txt")))
+
+    def test_deleted(self):
+        self.export()
+        self.model.delete_note(("B",))
+
+        self.export()
+        self.assertFalse(os.path.exists(self.output("B")))
+        self.assertTrue(os.path.isfile(self.output("A", "index.html")))
+
+
+if __name__ == "__main__":
+    unittest.main()
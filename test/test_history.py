@@ -0,0 +1,85 @@
+""" Tests of the revision history of notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import time
+import unittest
+
+from mrbavii_mypim.models.history import NoteHistory, make_delta, apply_delta
+
+from helpers import make_directory, make_pim, make_notes
+
+
+class DeltaTest(unittest.TestCase):
+
+    def check(self, old, new):
+        self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+
+    def test_round_trip(self):
+        old = b"".join(b"line %d\n" % i for i in range(100))
+        self.check(old, old)
+        self.check(old, b"")
+        self.check(b"", old)
+        self.check(old, old.replace(b"line 50\n", b"changed\n"))
+        self.check(old, old.replace(b"line 1\n", b"") + b"end")
+        self.check(old, b"start\n" + old[::-1])
+
+    def test_small_change(self):
+        old = b"".join(b"line %d\n" % i for i in range(1000))
+        delta = make_delta(old, old.replace(b"line 500\n", b"changed\n"))
+        self.assertLess(len(delta), 100)
+
+    def test_large_repetitive(self):
+        old = b"<p>same line of text</p>\n" * 70000
+        new = old[:len(old) // 2] + b"<p>changed</p>\n" + old[len(old) // 2:]
+
+        start = time.time()
+        delta = make_delta(old, new)
+        self.assertLess(time.time() - start, 5)
+        self.assertLess(len(delta), 100)
+        self.assertEqual(apply_delta(old, delta), new)
+
+
+class _History(NoteHistory):
+    KEYFRAME_INTERVAL = 4
+
+
+class NoteHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = make_directory(self)
+        self.history = _History()
+
+    def test_revisions(self):
+        versions = [("version %d\n" % i).encode("utf-8") * (i + 1) for i in range(10)]
+        for (count, data) in enumerate(versions):
+            self.assertEqual(self.history.record(self.directory, data), count)
+
+        revisions = self.history.get_revisions(self.directory)
+        self.assertEqual([i[0] for i in revisions], list(range(10)))
+        self.assertEqual([i[2] for i in revisions], [len(i) for i in versions])
+
+        for (count, data) in enumerate(versions):
+            self.assertEqual(self.history.read(self.directory, count), data)
+        self.assertEqual(self.history.read(self.directory, -1), versions[-1])
+
+    def test_unchanged(self):
+        self.assertEqual(self.history.record(self.directory, b"one"), 0)
+        self.assertIsNone(self.history.record(self.directory, b"one"))
+        self.assertEqual(len(self.history.get_revisions(self.directory)), 1)
+
+    def test_model(self):
+        model = make_pim(self).get_model("notes")
+        make_notes(model, {"A": "<note>one</note>"})
+        model.write_note(("A",), "<note>two</note>")
+        self.assertEqual(model.read_revision(("A",), -2), "<note>one</note>")
+
+        model.restore_revision(("A",), -2)
+        self.assertEqual(model.read_note(("A",)), "<note>one</note>")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+""" Tests of the bulk import of notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import time
+import shutil
+import unittest
+
+from mrbavii_mypim import importer
+
+from helpers import make_directory, make_pim, make_notes, key, keys
+
+
+def write_files(directory, files):
+    for (name, text) in files.items():
+        filename = os.path.join(directory, *name.split("/"))
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with io.open(filename, "wt", encoding="utf-8") as handle:
+            handle.write(text)
+
+
+class ConvertTest(unittest.TestCase):
+
+    def test_make_name(self):
+        self.assertEqual(importer.make_name("my-file_name (2)"), "my file name 2")
+        self.assertEqual(importer.make_name("..."), "Untitled")
+
+    def test_text(self):
+        self.assertEqual(
+            importer.text_to_note("one\ntwo\n\n<three>"),
+            "<note>\n<p>one<br/>two</p>\n<p>&lt;three&gt;</p>\n</note>"
+        )
+
+    def test_markdown(self):
+        result = importer.markdown_to_note("# Title\n\n* one\n* **two**\n\ntext `a<b`")
+        self.assertIn("<h1>Title</h1>", result)
+        self.assertIn("<ul><li>one</li><li><b>two</b></li></ul>", result)
+        self.assertIn("<p>text <code>a&lt;b</code></p>", result)
+
+    def test_html(self):
+        result = importer.html_to_note("<html><head><title>x</title></head><body><p>one<p>two<br></body>")
+        self.assertEqual(result, "<note>\n<p>one</p><p>two<br/></p>\n</note>")
+
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = make_directory(self)
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+
+    def test_import_directory(self):
+        write_files(self.source, {
+            "Alpha.md": "alpha",
+            "Alpha/child.txt": "child",
+            "Beta/inner.html": "<p>inner</p>",
+            "Beta.txt": "beta",
+            "ignored.bin": "",
+        })
+
+        self.assertEqual(importer.import_notes(self.pim, self.source, batch_size=2), 4)
+        self.assertEqual(keys(self.model.walk_notes()), ["Alpha", "Alpha/child", "Beta", "Beta/inner"])
+        self.assertIn("alpha", self.model.read_note(("Alpha",)))
+        self.assertIn("beta", self.model.read_note(("Beta",)))
+        self.assertIn("<p>inner</p>", self.model.read_note(("Beta", "inner")))
+
+    def test_unique_names(self):
+        make_notes(self.model, {"Parent": None, "Parent/Note": None})
+        write_files(self.source, {"Note.txt": "one", "note.md": "two"})
+
+        importer.import_notes(self.pim, self.source, ("Parent",))
+        self.assertEqual(keys(self.model.get_children(("Parent",))), ["Parent/Note", "Parent/Note 2", "Parent/note"])
+        self.assertIn("one", self.model.read_note(("Parent", "Note 2")))
+
+    def test_children_indexed(self):
+        make_notes(self.model, {"Parent": None})
+        self.assertFalse(self.model.get_children_info()[0][1])
+        write_files(self.source, {"Child.txt": "child"})
+
+        importer.import_notes(self.pim, self.source, ("Parent",))
+        self.assertTrue(self.model.get_children_info()[0][1])
+        info = self.model.get_children_info(("Parent",))
+        self.assertEqual(keys(i[0] for i in info), ["Parent/Child"])
+        self.assertEqual(info[0][3], len(self.model.read_note(("Parent", "Child")).encode("utf-8")))
+
+    def test_many_siblings(self):
+        items = [(("n{0}".format(i % 10000),), b"<note></note>") for i in range(20000)]
+
+        start = time.time()
+        paths = [path for (path, data) in importer.assign_paths(self.model, None, items)]
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(len(set(paths)), 20000)
+        self.assertEqual(key(paths[10000]), "n0 2")
+
+    def test_import_pim(self):
+        other = make_pim(self)
+        make_notes(other.get_model("notes"), {"A": "<note>a</note>", "A/B": "<note>b</note>"})
+        other.close()
+
+        importer.import_notes(self.pim, other.get_directory())
+        self.assertEqual(keys(self.model.walk_notes()), ["A", "A/B"])
+        self.assertEqual(self.model.read_note(("A", "B")), "<note>b</note>")
+
+    def test_import_pim_read_only(self):
+        other = make_pim(self)
+        make_notes(other.get_model("notes"), {"A": "<note>a</note>", "A/B": "<note>b</note>"})
+        self.assertTrue(other.get_model("notes").compact())
+        other.close()
+
+        directory = other.get_directory()
+        for name in ("db", "cache"):
+            shutil.rmtree(os.path.join(directory, name), True)
+        before = sorted(os.listdir(directory))
+
+        self.assertEqual(importer.import_notes(self.pim, directory), 2)
+        self.assertEqual(self.model.read_note(("A", "B")), "<note>b</note>")
+        self.assertEqual(sorted(os.listdir(directory)), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
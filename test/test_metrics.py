@@ -0,0 +1,95 @@
+""" Tests of the timing of model operations. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import unittest
+
+from mrbavii_mypim.metrics import Histogram, MetricsCollector
+
+from helpers import make_pim, make_notes
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(50), 0.0)
+        self.assertEqual(histogram.as_dict()["mean"], 0.0)
+
+    def test_percentile(self):
+        histogram = Histogram()
+        for i in range(90):
+            histogram.add(0.000010)
+        for i in range(10):
+            histogram.add(0.001000)
+
+        # 10us is in the bucket up to 16us, 1000us in the one up to 1024us
+        self.assertEqual(histogram.percentile(50), 0.000016)
+        self.assertEqual(histogram.percentile(90), 0.000016)
+        self.assertEqual(histogram.percentile(99), 0.001)
+        self.assertEqual(histogram.percentile(100), 0.001)
+
+        stats = histogram.as_dict()
+        self.assertEqual((stats["count"], stats["min"], stats["max"]), (100, 0.000010, 0.001))
+        self.assertAlmostEqual(stats["mean"], 0.000109)
+        self.assertEqual(sum(stats["buckets"]), 100)
+
+    def test_limits(self):
+        histogram = Histogram()
+        histogram.add(0.0)
+        histogram.add(1e6)
+        self.assertEqual(histogram.buckets[0], 1)
+        self.assertEqual(histogram.buckets[Histogram.BUCKETS - 1], 1)
+        self.assertEqual(histogram.percentile(50), 0.000001)
+        self.assertEqual(histogram.percentile(100), 1e6)
+
+
+class MetricsCollectorTest(unittest.TestCase):
+
+    def test_collect(self):
+        metrics = MetricsCollector()
+        metrics("a", 0.001)
+        metrics("a", 0.003)
+        metrics("b", 0.002)
+
+        stats = metrics.as_dict()
+        self.assertEqual(sorted(stats), ["a", "b"])
+        self.assertEqual(stats["a"]["count"], 2)
+        self.assertAlmostEqual(stats["a"]["total"], 0.004)
+
+        lines = metrics.format().split("\n")
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("a "))
+        self.assertTrue(lines[2].startswith("b "))
+
+        metrics.reset()
+        self.assertEqual(metrics.as_dict(), {})
+
+    def test_model(self):
+        pim = make_pim(self)
+        model = pim.get_model("notes")
+        metrics = MetricsCollector()
+
+        make_notes(model, {"A": "<note>a</note>"})
+        model.read_note(("A",))
+        self.assertEqual(metrics.as_dict(), {})
+
+        pim.register_metrics_function(metrics)
+        model.read_note(("A",))
+        with pim.timed("custom"):
+            pass
+
+        stats = metrics.as_dict()
+        self.assertEqual(stats["notes.read"]["count"], 1)
+        self.assertEqual(stats["custom"]["count"], 1)
+
+        pim.register_metrics_function(None)
+        model.read_note(("A",))
+        self.assertEqual(metrics.as_dict()["notes.read"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+""" Tests of the interned note paths. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import re
+import pickle
+import unittest
+
+from mrbavii_mypim.errors import Error
+from mrbavii_mypim.models.notepath import NotePathTable
+
+
+_valid_name_re = re.compile("^[A-Za-z0-9]+( [A-Za-z0-9]+)*$")
+
+
+class NotePathTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = NotePathTable(os.path.join("root", "notes"), "contents.note", _valid_name_re.match)
+
+    def test_interned(self):
+        path = self.table.get(("A", "B C"))
+        self.assertIs(self.table.get(["A", "B C"]), path)
+        self.assertIs(self.table.get(path), path)
+        self.assertIs(self.table.get_key("A/B C"), path)
+        self.assertTrue(self.table.owns(path))
+        self.assertFalse(self.table.owns(("A", "B C")))
+
+        other = NotePathTable("other", "contents.note", _valid_name_re.match)
+        self.assertIsNot(other.get(path), path)
+
+    def test_validation(self):
+        for path in (("A", ".."), ("A", "B/C"), ("A", " B"), ("A", 1), "A"):
+            self.assertRaises(Error, self.table.get, path)
+
+        # Only the new name of a child is checked
+        self.assertRaises(Error, self.table.get(("A",)).child, "..")
+        self.assertEqual(self.table.get(("A",)).child("B"), ("A", "B"))
+
+    def test_parent_and_slices(self):
+        path = self.table.get(("A", "B", "C"))
+        self.assertIs(path.parent, self.table.get(("A", "B")))
+        self.assertIs(path[:-1], path.parent)
+        self.assertIs(path[:1], self.table.get(("A",)))
+        self.assertIs(path[:0], self.table.get(()))
+        self.assertIsNone(path[:0].parent)
+        self.assertEqual(path[-1], "C")
+        self.assertEqual((path.name, path.key), ("C", "A/B/C"))
+
+    def test_tuple_equality(self):
+        path = self.table.get(("A", "B"))
+        self.assertEqual(path, ("A", "B"))
+        self.assertNotEqual(path, ("A",))
+        self.assertEqual(hash(path), hash(("A", "B")))
+        self.assertEqual({("A", "B"): 1}[path], 1)
+        self.assertEqual(path + ("C",), ("A", "B", "C"))
+        self.assertEqual(("Z",) + path, ("Z", "A", "B"))
+        self.assertLess(path, ("B",))
+        self.assertEqual(pickle.loads(pickle.dumps(path)), ("A", "B"))
+        self.assertIsInstance(pickle.loads(pickle.dumps(path)), tuple)
+
+    def test_files(self):
+        path = self.table.get(("A", "B C"))
+        self.assertEqual(path.directory, os.path.join("root", "notes", "A", "B_C"))
+        self.assertEqual(path.file, os.path.join("root", "notes", "A", "B_C", "contents.note"))
+
+
+if __name__ == "__main__":
+    unittest.main()
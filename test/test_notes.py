@@ -0,0 +1,171 @@
+""" Tests of the notes model. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+from mrbavii_mypim.errors import Error
+
+from helpers import make_directory, make_pim, make_notes
+
+
+_load_script = """
+import sys, os, json
+from mrbavii_mypim.pim import Pim
+pim = Pim(sys.argv[1])
+pim.get_model("notes")
+json.dump({
+    "modules": sorted(i for i in ("sqlite3", "lzma", "difflib", "mmap") if i in sys.modules),
+    "databases": os.path.isdir(os.path.join(sys.argv[1], "db")),
+}, sys.stdout)
+"""
+
+
+class LoadTest(unittest.TestCase):
+
+    def test_lazy(self):
+        directory = make_directory(self)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output(
+            [sys.executable, "-c", _load_script, directory],
+            cwd=root
+        )
+
+        result = json.loads(output.decode("utf-8"))
+        self.assertEqual(result["modules"], [])
+        self.assertFalse(result["databases"])
+
+    def test_reindex_if_needed(self):
+        directory = make_directory(self)
+        model = make_pim(self, directory).get_model("notes")
+        make_notes(model, {"A": "<note>apple</note>"})
+        self.assertTrue(model._search.needs_reindex())
+
+        self.assertTrue(model.reindex_if_needed())
+        self.assertFalse(model._search.needs_reindex())
+        self.assertFalse(model._links.needs_reindex())
+
+        # Kept when the PIM is opened again
+        model = make_pim(self, directory).get_model("notes")
+        self.assertFalse(model._search.needs_reindex())
+        self.assertEqual([i[0][-1] for i in model.search("apple")], ["A"])
+
+
+class TreeStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+        make_notes(self.model, {"A": None, "A/B": None})
+
+    def test_round_trip(self):
+        self.model.save_tree_state([("A",)], ("A", "B"))
+        (expanded, selected, listings, limit) = self.model.load_tree_state()
+        self.assertEqual(expanded, [("A",)])
+        self.assertEqual(selected, ("A", "B"))
+        self.assertEqual([i[0] for i in listings["A"]], [("A", "B")])
+        self.assertEqual(self.model.check_tree_state(listings), [])
+
+    def test_invalid_paths(self):
+        self.model.save_tree_state([("A",)], ("A", "B"))
+        filename = os.path.join(self.pim.get_cache_directory(self.model), self.model.TREE_STATE_FILENAME)
+        with open(filename, "rt") as handle:
+            state = json.load(handle)
+
+        state["expanded"].append("..")
+        state["selected"] = "A/../.."
+        state["listings"][".."] = [["etc", True, None, None]]
+        state["listings"]["A"].append(["..", True, None, None])
+        with open(filename, "wt") as handle:
+            json.dump(state, handle)
+
+        (expanded, selected, listings, limit) = self.model.load_tree_state()
+        self.assertEqual(expanded, [("A",)])
+        self.assertIsNone(selected)
+        self.assertEqual(sorted(listings), ["", "A"])
+        self.assertEqual([i[0] for i in listings["A"]], [("A", "B")])
+
+class PackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = make_directory(self)
+        self.model = make_pim(self, self.directory).get_model("notes")
+        make_notes(self.model, {
+            "A": "<note>a</note>",
+            "A/B": "<note>b</note>",
+            "A/B/C": "<note>c</note>",
+            "D": "<note>d</note>",
+        })
+        self.assertTrue(self.model.compact())
+
+        # The history is in the pack too
+        self.assertEqual(os.listdir(self.model._directory), [])
+
+    def reopen(self):
+        self.model = make_pim(self, self.directory).get_model("notes")
+
+    def children(self, *path):
+        return [i[0][-1] for i in self.model.get_children_info(path)]
+
+    def test_move(self):
+        self.model.move_note(("A", "B"), ("D",))
+        # Only the moved note itself is touched
+        self.assertTrue(os.path.isdir(self.model._get_note_dir_file(("D", "B"))[0]))
+        self.assertFalse(os.path.exists(self.model._get_note_dir_file(("D", "B", "C"))[0]))
+
+        for model in (self.model, None):
+            if model is None:
+                self.reopen()
+            self.assertEqual(self.model.read_note(("D", "B", "C")), "<note>c</note>")
+            self.assertEqual(self.children("D"), ["B"])
+            self.assertEqual(self.children("A"), [])
+            self.assertRaises(Error, self.model.read_note, ("A", "B"))
+            self.assertEqual(sorted(i[0] for i in self.model._iter_packed()), ["A", "D", "D/B", "D/B/C"])
+
+        # Moved again and then written
+        self.model.rename_note(("D", "B"), "E")
+        self.model.write_note(("D", "E", "C"), "<note>changed</note>")
+        self.assertEqual(self.model.read_note(("D", "E", "C")), "<note>changed</note>")
+        self.assertEqual(self.model.read_note(("D", "E")), "<note>b</note>")
+        self.assertEqual(sorted("/".join(i) for i in self.model.walk_notes()), ["A", "D", "D/E", "D/E/C"])
+
+        self.assertTrue(self.model.compact())
+        self.reopen()
+        self.assertEqual(self.model.read_note(("D", "E", "C")), "<note>changed</note>")
+
+    def test_history(self):
+        self.model.write_note(("A", "B"), "<note>b2</note>")
+        self.model.move_note(("A", "B"), ("D",))
+        self.assertEqual([i[0] for i in self.model.get_revisions(("D", "B"))], [0, 1])
+
+        self.assertTrue(self.model.compact())
+        self.assertEqual(os.listdir(self.model._directory), [])
+        self.reopen()
+        self.assertEqual(self.model.read_revision(("D", "B"), 0), "<note>b</note>")
+        self.assertEqual(self.model.read_revision(("D", "B"), 1), "<note>b2</note>")
+        self.model.restore_revision(("D", "B"), 0)
+        self.assertEqual(len(self.model.get_revisions(("D", "B"))), 3)
+
+    def test_delete(self):
+        self.model.delete_note(("A", "B"))
+        self.model.move_note(("D",), ("A",))
+        self.model.rename_note(("A", "D"), "B")
+
+        for model in (self.model, None):
+            if model is None:
+                self.reopen()
+            self.assertEqual(self.children("A"), ["B"])
+            self.assertEqual(self.children("A", "B"), [])
+            self.assertEqual(self.model.read_note(("A", "B")), "<note>d</note>")
+            self.assertRaises(Error, self.model.read_note, ("A", "B", "C"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+""" Tests of the index of the notes hierarchy. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import unittest
+
+from helpers import make_pim, make_notes, keys
+
+
+class NotesIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+        make_notes(self.model, {
+            "B": None,
+            "A": None,
+            "A/x": None,
+            "A/y": None,
+            "A/y/z": None,
+        })
+
+    def test_children_sorted(self):
+        self.assertEqual(keys(self.model.get_children()), ["A", "B"])
+        self.assertEqual(keys(self.model.get_children(("A",))), ["A/x", "A/y"])
+
+    def test_children_info(self):
+        info = self.model.get_children_info(("A",))
+        self.assertEqual([(i[0][-1], i[1]) for i in info], [("x", False), ("y", True)])
+        self.assertEqual(info[0][3], len("<note></note>"))
+
+    def test_paging(self):
+        make_notes(self.model, dict(("C/n{0:02}".format(i), None) for i in range(10)))
+        page = self.model.get_children(("C",), 3, 4)
+        self.assertEqual(keys(page), ["C/n03", "C/n04", "C/n05", "C/n06"])
+        self.assertEqual(self.model.count_children(("C",)), 10)
+
+    def test_move(self):
+        self.model.move_note(("A",), ("B",))
+        self.assertEqual(keys(self.model.get_children()), ["B"])
+        self.assertEqual(keys(self.model.get_children(("B", "A", "y"))), ["B/A/y/z"])
+        self.assertTrue(self.model.get_children_info()[0][1])
+
+    def test_rename(self):
+        self.model.rename_note(("A", "y"), "w")
+        self.assertEqual(keys(self.model.get_children(("A",))), ["A/w", "A/x"])
+        self.assertEqual(keys(self.model.get_children(("A", "w"))), ["A/w/z"])
+
+    def test_delete(self):
+        self.model.delete_note(("A", "y"))
+        self.assertEqual(keys(self.model.get_children(("A",))), ["A/x"])
+        self.assertEqual(self.model.get_children(("A", "y")), [])
+
+        self.model.delete_note(("A", "x"))
+        self.assertFalse(self.model.get_children_info()[0][1])
+
+    def test_names_differing_in_case(self):
+        make_notes(self.model, {"Ab": None, "Ab/x": None, "ab": None, "ab/y": None, "Q": None})
+        if self.model.get_attachments(("Ab",)) == self.model.get_attachments(("ab",)):
+            self.skipTest("File names are not case sensitive")
+
+        self.model.move_note(("ab",), ("Q",))
+        self.assertEqual(keys(self.model.get_children(("Ab",))), ["Ab/x"])
+        self.assertEqual(keys(self.model.get_children(("Q", "ab"))), ["Q/ab/y"])
+
+        self.model.delete_note(("Q",))
+        self.model.delete_note(("Ab",))
+        self.assertEqual(keys(self.model.get_children()), ["A", "B"])
+
+    def test_outside_changes(self):
+        directory = self.model.get_attachments(("B",))
+        os.mkdir(os.path.join(directory, "New_note"))
+        self.assertEqual(keys(self.model.get_children(("B",))), ["B/New note"])
+
+        os.rmdir(os.path.join(directory, "New_note"))
+        self.assertEqual(self.model.get_children(("B",)), [])
+
+    def test_child_changes(self):
+        self.assertEqual([i[1] for i in self.model.get_children_info(("A",))], [False, True])
+
+        # Changes below a child don't touch the directory of A
+        directory = self.model.get_attachments(("A", "x"))
+        os.mkdir(os.path.join(directory, "New_note"))
+        with open(os.path.join(directory, self.model.NOTE_FILENAME), "wb") as handle:
+            handle.write(b"<note>changed outside</note>")
+
+        info = self.model.get_children_info(("A",))
+        self.assertEqual([i[1] for i in info], [True, True])
+        self.assertEqual(info[0][3], len(b"<note>changed outside</note>"))
+
+
+if __name__ == "__main__":
+    unittest.main()
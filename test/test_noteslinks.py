@@ -0,0 +1,87 @@
+""" Tests of the index of links between notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import unittest
+
+from mrbavii_mypim.models.noteslinks import extract_links, rewrite_links
+
+from helpers import make_pim, make_notes, key, keys
+
+
+class LinkFunctionsTest(unittest.TestCase):
+
+    def test_extract(self):
+        data = """<note><a href="note:A/B">x</a><a href='note:/C//'>y</a><a href="http://x">z</a></note>"""
+        self.assertEqual(extract_links(data), set(["A/B", "C"]))
+        self.assertEqual(extract_links(data.encode("utf-8")), set(["A/B", "C"]))
+
+    def test_rewrite(self):
+        data = """<note><a href="note:A/B">x</a><a href="note:C">y</a></note>"""
+        result = rewrite_links(data, lambda key: "D/B" if key == "A/B" else None)
+        self.assertEqual(result, """<note><a href="note:D/B">x</a><a href="note:C">y</a></note>""")
+
+
+class NotesLinksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+        make_notes(self.model, {
+            "A": """<note><a href="note:B">b</a><a href="note:B/C">c</a></note>""",
+            "B": None,
+            "B/C": None,
+            "D": """<note><a href="note:Missing">m</a><a href="note:B/C">c</a></note>""",
+        })
+
+    def links(self, path):
+        return [(key(target), exists) for (target, exists) in self.model.get_links(path)]
+
+    def test_links(self):
+        self.assertEqual(self.links(("A",)), [("B", True), ("B/C", True)])
+        self.assertEqual(keys(self.model.get_backlinks(("B", "C"))), ["A", "D"])
+        self.assertEqual(keys(self.model.get_backlinks(("A",))), [])
+
+    def test_broken(self):
+        broken = [(key(path), key(target)) for (path, target) in self.model.get_broken_links()]
+        self.assertEqual(broken, [("D", "Missing")])
+
+    def test_write(self):
+        self.model.write_note(("D",), "<note></note>")
+        self.assertEqual(self.links(("D",)), [])
+        self.assertEqual(keys(self.model.get_backlinks(("B", "C"))), ["A"])
+
+    def test_move_rewrites_links(self):
+        self.model.rename_note(("B",), "E")
+        self.assertIn('href="note:E/C"', self.model.read_note(("A",)))
+        self.assertIn('href="note:E/C"', self.model.read_note(("D",)))
+        self.assertEqual(self.links(("A",)), [("E", True), ("E/C", True)])
+
+    def test_move_without_rewrite(self):
+        self.model.rename_note(("B",), "E", False)
+        self.assertIn('href="note:B/C"', self.model.read_note(("A",)))
+        self.assertEqual(self.links(("A",)), [("B", False), ("B/C", False)])
+
+    def test_delete(self):
+        self.model.delete_note(("A",))
+        self.assertEqual(keys(self.model.get_backlinks(("B",))), [])
+
+    def test_names_differing_in_case(self):
+        make_notes(self.model, {"b": None, "b/C": """<note><a href="note:B/C">c</a></note>"""})
+        if self.model.get_attachments(("B",)) == self.model.get_attachments(("b",)):
+            self.skipTest("File names are not case sensitive")
+
+        self.model.rename_note(("b",), "F")
+        self.assertEqual(self.links(("F", "C")), [("B/C", True)])
+        self.assertEqual(keys(self.model.get_backlinks(("B", "C"))), ["A", "D", "F/C"])
+
+        self.model.delete_note(("F",))
+        self.assertEqual(self.links(("A",)), [("B", True), ("B/C", True)])
+        self.assertEqual(keys(self.model.get_backlinks(("B", "C"))), ["A", "D"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+""" Tests of the full text search of notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import io
+import unittest
+
+from helpers import make_pim, make_notes, keys
+
+
+class NotesSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+        make_notes(self.model, {
+            "Fruit": "<note><p>apple banana</p></note>",
+            "Fruit/Citrus": "<note><p>orange lemon</p></note>",
+            "Vegetables": "<note><p>carrot <b>potato</b></p></note>",
+        })
+
+    def search(self, query):
+        return keys(i[0] for i in self.model.search(query))
+
+    def test_search(self):
+        self.assertEqual(self.search("banana"), ["Fruit"])
+        self.assertEqual(self.search("potato"), ["Vegetables"])
+        self.assertEqual(self.search("missing"), [])
+
+    def test_title(self):
+        self.assertEqual(self.search("title:citrus"), ["Fruit/Citrus"])
+
+    def test_write(self):
+        self.model.write_note(("Vegetables",), "<note>cabbage</note>")
+        self.assertEqual(self.search("potato"), [])
+        self.assertEqual(self.search("cabbage"), ["Vegetables"])
+
+    def test_move(self):
+        self.model.rename_note(("Fruit",), "Food")
+        self.assertEqual(self.search("lemon"), ["Food/Citrus"])
+        self.assertEqual(self.search("title:food"), ["Food"])
+
+    def test_delete(self):
+        self.model.delete_note(("Fruit",))
+        self.assertEqual(self.search("banana"), [])
+        self.assertEqual(self.search("lemon"), [])
+
+    def test_names_differing_in_case(self):
+        make_notes(self.model, {"fruit": "<note>cherry</note>", "fruit/Berry": "<note>strawberry</note>"})
+        if self.model.get_attachments(("Fruit",)) == self.model.get_attachments(("fruit",)):
+            self.skipTest("File names are not case sensitive")
+
+        self.model.rename_note(("fruit",), "Other")
+        self.assertEqual(self.search("lemon"), ["Fruit/Citrus"])
+        self.assertEqual(self.search("strawberry"), ["Other/Berry"])
+
+        self.model.delete_note(("Other",))
+        self.assertEqual(self.search("lemon"), ["Fruit/Citrus"])
+        self.assertEqual(self.search("strawberry"), [])
+
+    def test_reindex(self):
+        (_, file) = self.model._get_note_dir_file(("Vegetables",))
+        with io.open(file, "wt") as handle:
+            handle.write("<note>turnip and more text</note>")
+
+        self.assertTrue(self.model.reindex_search())
+        self.assertEqual(self.search("turnip"), ["Vegetables"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+""" Tests of the write-behind queue for notes. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import time
+import threading
+import unittest
+
+from mrbavii_mypim.models.savequeue import SaveQueue
+
+from helpers import make_pim, make_notes
+
+
+class SaveQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.writes = []
+        self.queue = SaveQueue(lambda path, contents: self.writes.append((path, contents)), 60.0)
+        self.addCleanup(self.queue.close)
+
+    def test_coalesce(self):
+        self.queue.queue(("A",), "one")
+        self.queue.queue(("A",), "two")
+        self.assertTrue(self.queue.is_pending(("A",)))
+        self.assertEqual(self.queue.get_pending(("A",)), "two")
+
+        self.queue.flush()
+        self.assertEqual(self.writes, [(("A",), "two")])
+        self.assertFalse(self.queue.is_pending(("A",)))
+
+    def test_flush_one(self):
+        self.queue.queue(("A",), "a")
+        self.queue.queue(("B",), "b")
+        self.queue.flush(("B",))
+        self.assertEqual(self.writes, [(("B",), "b")])
+        self.assertTrue(self.queue.is_pending(("A",)))
+
+    def test_unchanged(self):
+        self.queue.queue(("A",), "same")
+        self.queue.flush()
+        self.queue.queue(("A",), "same")
+        self.queue.flush()
+        self.assertEqual(len(self.writes), 1)
+
+    def test_move(self):
+        self.queue.queue(("A", "B"), "b")
+        self.queue.move(("A",), ("C",))
+        self.queue.flush()
+        self.assertEqual(self.writes, [(("C", "B"), "b")])
+
+    def test_remove(self):
+        self.queue.queue(("A", "B"), "b")
+        self.queue.queue(("AB",), "ab")
+        self.queue.remove(("A",))
+        self.queue.flush()
+        self.assertEqual(self.writes, [(("AB",), "ab")])
+
+    def test_background(self):
+        queue = SaveQueue(lambda path, contents: self.writes.append((path, contents)), 0.05)
+        self.addCleanup(queue.close)
+        queue.queue(("A",), "a")
+
+        deadline = time.time() + 5
+        while not self.writes and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.writes, [(("A",), "a")])
+
+    def wait_for(self, test):
+        deadline = time.time() + 5
+        while not test() and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_max_wait(self):
+        queue = SaveQueue(lambda path, contents: self.writes.append((path, contents)), 0.2, 0.3)
+        self.addCleanup(queue.close)
+
+        # Never pausing long enough for the delay
+        deadline = time.time() + 2
+        while not self.writes and time.time() < deadline:
+            queue.queue(("A",), "a")
+            time.sleep(0.05)
+        self.assertEqual(self.writes, [(("A",), "a")])
+
+    def test_changed_outside(self):
+        stamps = {("A",): 1}
+        queue = SaveQueue(
+            lambda path, contents: self.writes.append((path, contents)),
+            60.0,
+            stamp_fn=stamps.get
+        )
+        self.addCleanup(queue.close)
+
+        queue.queue(("A",), "same")
+        queue.flush()
+        stamps[("A",)] = 2
+        queue.queue(("A",), "same")
+        queue.flush()
+        self.assertEqual(len(self.writes), 2)
+
+    def test_written_directly(self):
+        self.queue.queue(("A",), "one")
+        self.queue.flush()
+        self.queue.mark_written(("A",), "two")
+        self.queue.queue(("A",), "one")
+        self.queue.flush()
+        self.assertEqual(self.writes, [(("A",), "one"), (("A",), "one")])
+
+    def test_flush_error(self):
+        def write(path, contents):
+            if not self.writes:
+                self.writes.append(None)
+                raise IOError("failed")
+            self.writes.append((path, contents))
+
+        queue = SaveQueue(write, 60.0)
+        self.addCleanup(queue.close)
+        queue.queue(("A",), "a")
+        self.assertRaises(IOError, queue.flush)
+        self.assertTrue(queue.is_pending(("A",)))
+
+        queue.flush()
+        self.assertEqual(self.writes, [None, (("A",), "a")])
+
+    def test_background_error(self):
+        errors = []
+
+        def write(path, contents):
+            if not errors:
+                raise IOError("failed")
+            self.writes.append((path, contents))
+
+        queue = SaveQueue(write, 0.01, 0.05, error_fn=lambda path, e: errors.append(path))
+        self.addCleanup(queue.close)
+        queue.queue(("A",), "a")
+
+        self.wait_for(lambda: self.writes)
+        self.assertEqual(errors, [("A",)])
+        self.assertEqual(self.writes, [(("A",), "a")])
+        self.assertRaises(IOError, queue.flush)
+
+    def test_errors_by_note(self):
+        def write(path, contents):
+            if path == ("A",):
+                raise IOError("disk full")
+            self.writes.append((path, contents))
+
+        queue = SaveQueue(write, 0.01, 0.05, error_fn=lambda path, e: None)
+        self.addCleanup(queue.close)
+        queue.queue(("A",), "a")
+        self.wait_for(lambda: queue._errors)
+
+        queue.queue(("B",), "b")
+        queue.flush(("B",))
+        self.assertEqual(self.writes, [(("B",), "b")])
+        self.assertRaises(IOError, queue.flush, ("A",))
+
+        # Forgotten with the note
+        self.wait_for(lambda: queue._errors)
+        queue.remove(("A",))
+        queue.flush()
+
+    def test_hold(self):
+        self.queue.queue(("A", "B"), "b")
+        self.queue.hold([("A",)])
+
+        flushed = threading.Thread(target=self.queue.flush)
+        flushed.start()
+        flushed.join(0.2)
+        self.assertTrue(flushed.is_alive())
+        self.assertEqual(self.writes, [])
+
+        self.queue.move(("A",), ("C",))
+        self.queue.release([("A",)])
+        flushed.join(5)
+        self.assertEqual(self.writes, [(("C", "B"), "b")])
+
+
+class ModelSaveTest(unittest.TestCase):
+
+    def test_written_directly(self):
+        model = make_pim(self).get_model("notes")
+        make_notes(model, {"A": "<note>one</note>"})
+
+        model.queue_write(("A",), "<note>two</note>")
+        model.flush_writes()
+        model.restore_revision(("A",), -2)
+        model.queue_write(("A",), "<note>two</note>")
+        model.flush_writes()
+        self.assertEqual(model.read_note(("A",)), "<note>two</note>")
+
+    def test_move_while_saving(self):
+        model = make_pim(self).get_model("notes")
+        make_notes(model, {"A": "<note>one</note>"})
+
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def write(path, contents):
+            started.set()
+            proceed.wait(5)
+            model.write_note(path, contents)
+
+        model._saves._write_fn = write
+        model._saves._delay = 0
+        model.queue_write(("A",), "<note>two</note>")
+        self.assertTrue(started.wait(5))
+
+        # The save is in progress while the note is moved
+        moved = threading.Thread(target=model.rename_note, args=(("A",), "B"))
+        moved.daemon = True
+        moved.start()
+        time.sleep(0.1)
+        proceed.set()
+
+        moved.join(5)
+        self.assertFalse(moved.is_alive())
+        self.assertEqual(model.read_note(("B",)), "<note>two</note>")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+""" Tests of the HTTP server. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import asyncio
+import unittest
+
+from mrbavii_mypim.server import NotesServer
+
+from helpers import make_pim, make_notes
+
+
+class _Writer(object):
+    """ Collects what the server writes to a connection. """
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pim = make_pim(self)
+        self.model = self.pim.get_model("notes")
+        make_notes(self.model, {"A": "<note>one</note>", "A/B": None})
+
+        self.server = NotesServer(self.pim, 1)
+        self.addCleanup(self.server.close)
+
+    def request(self, target, headers=""):
+        """ Send one request and return (status, headers, body). """
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data("GET {0} HTTP/1.1\r\nConnection: close\r\n{1}\r\n".format(target, headers).encode("latin-1"))
+            reader.feed_eof()
+            writer = _Writer()
+            await self.server.handle_connection(reader, writer)
+            return writer.data
+
+        (head, _, body) = asyncio.run(run()).partition(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        fields = dict((i.partition(": ")[0].lower(), i.partition(": ")[2]) for i in lines[1:])
+        return (int(lines[0].split()[1]), fields, body)
+
+    def test_etag(self):
+        (status, headers, body) = self.request("/source/A")
+        self.assertEqual((status, body), (200, b"<note>one</note>"))
+
+        etag = headers["etag"]
+        (status, headers, body) = self.request("/source/A", "If-None-Match: {0}\r\n".format(etag))
+        self.assertEqual(status, 304)
+
+        # Same size and likely the same modification time
+        self.model.write_note(("A",), "<note>two</note>")
+        (status, headers, body) = self.request("/source/A", "If-None-Match: {0}\r\n".format(etag))
+        self.assertEqual((status, body), (200, b"<note>two</note>"))
+        self.assertNotEqual(headers["etag"], etag)
+
+    def test_paging(self):
+        self.assertEqual(self.request("/tree/?offset=0&limit=1")[0], 200)
+        self.assertEqual(self.request("/tree/?offset=x")[0], 400)
+        self.assertEqual(self.request("/tree/?limit=-1")[0], 400)
+        self.assertEqual(self.request("/source/Missing")[0], 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
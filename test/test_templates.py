@@ -0,0 +1,60 @@
+""" Tests of the template cache. """
+
+__author__      =   "Brian Allen Vanderburg II"
+__copyright__   =   "Copyright (C) 2017 Brian Allen Vanderburg II"
+__license__     =   "Apache License 2.0"
+
+
+import os
+import io
+import unittest
+
+from mrbavii_mypim.templates import TemplateCache
+
+from helpers import make_directory
+
+
+class _Pim(object):
+    """ Just enough of a PIM for the template cache. """
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    def get_data_directories(self):
+        return [self._directory]
+
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = make_directory(self)
+        self.templates = os.path.join(directory, "templates")
+        os.mkdir(self.templates)
+        self.write("note.tmpl", "one")
+        self.cache = TemplateCache(_Pim(directory))
+
+    def write(self, name, text):
+        with io.open(os.path.join(self.templates, name), "wt") as handle:
+            handle.write(text)
+
+    def test_throttled(self):
+        self.cache.CHECK_INTERVAL = 3600
+        digest = self.cache.digest()
+
+        self.write("other.tmpl", "two")
+        self.assertEqual(self.cache.digest(), digest)
+
+        self.cache.clear()
+        self.assertNotEqual(self.cache.digest(), digest)
+
+    def test_changes(self):
+        self.cache.CHECK_INTERVAL = 0
+        digest = self.cache.digest()
+        self.assertEqual(self.cache.digest(), digest)
+
+        self.write("note.tmpl", "changed")
+        self.assertNotEqual(self.cache.digest(), digest)
+
+
+if __name__ == "__main__":
+    unittest.main()